@@ -0,0 +1,481 @@
+"""
+記録済みセッションの SQLite カタログ
+
+pc_app/data/{日時}_{PID}/session_NN/（main.py）と experiment_data/{日時}_{ID}/session_NN/
+（recorder.py）の各セッションについて、サンプル数・記録時間・イベント数・ファイルサイズ・
+動画フレーム数・整合性フラグを1行にまとめる。参加者をまたいだ条件検索をファイルを
+開かずに行うためのもの。
+
+- セッションごとにファイル一覧の (パス, サイズ, 更新時刻) から指紋を作り、変化したものだけ読み直す
+- 録画停止時に main.py / recorder.py から index_session() で1セッションずつ更新される
+- 消えたセッションは rescan 時にカタログから削除する
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.analysis.catalog scan pc_app/data experiment_data
+    python -m pc_app.analysis.catalog list --min-cameras 2 --min-gsr-minutes 50
+    python -m pc_app.analysis.catalog sql "SELECT pid, COUNT(*) FROM sessions GROUP BY pid"
+"""
+
+import os
+import re
+import csv
+import sys
+import json
+import time
+import struct
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_DB_PATH = os.path.join(REPO_ROOT, 'catalog.sqlite')
+DEFAULT_ROOTS = [os.path.join(REPO_ROOT, 'pc_app', 'data'), os.path.join(REPO_ROOT, 'experiment_data')]
+
+# カタログの列定義を変えたら上げる（古いカタログは作り直す）
+SCHEMA_VERSION = 2
+# GSRの記録間隔がこれを超えたら欠落とみなす（秒）
+GSR_GAP_SECONDS = 1.0
+# 顔ROI録画の切り出し映像のファイル名の接尾辞（workers/camera_worker.py の FACE_STREAM_SUFFIX と同じ）
+FACE_STREAM_SUFFIX = '_face'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_dir      TEXT PRIMARY KEY,   -- リポジトリルートからの相対パス
+    experiment_dir   TEXT NOT NULL,
+    pid              TEXT,
+    started          TEXT,               -- ディレクトリ名の日時 (YYYYMMDD-HHMMSS)
+    session_number   INTEGER,
+    format           TEXT,               -- 'main' | 'recorder'
+    gsr_samples      INTEGER,
+    gsr_seconds      REAL,
+    gsr_max_gap_s    REAL,
+    preroll_seconds  REAL,               -- record_start より前（プリロール）の GSR の秒数。gsr_seconds に含まれる
+    event_count      INTEGER,
+    av_changes       INTEGER,
+    markers          INTEGER,
+    button_events    INTEGER,
+    clips            INTEGER,
+    camera_count     INTEGER,
+    video_frames     INTEGER,
+    video_bytes      INTEGER,
+    audio_seconds    REAL,
+    total_bytes      INTEGER,
+    flags            TEXT,               -- 整合性の問題（カンマ区切り、問題なしは空文字）
+    fingerprint      TEXT,
+    indexed_at       REAL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    session_dir      TEXT NOT NULL REFERENCES sessions(session_dir) ON DELETE CASCADE,
+    camera           TEXT NOT NULL,
+    bytes            INTEGER,
+    sidecar_frames   INTEGER,
+    container_frames INTEGER,
+    seconds          REAL,
+    PRIMARY KEY (session_dir, camera)
+);
+CREATE INDEX IF NOT EXISTS sessions_pid ON sessions(pid);
+"""
+
+EXPERIMENT_DIR_PATTERN = re.compile(r'^(\d{8}-\d{6})_(.+)$')
+
+
+def connect(db_path=DEFAULT_DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != SCHEMA_VERSION:
+        conn.executescript("DROP TABLE IF EXISTS videos; DROP TABLE IF EXISTS sessions;")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def relative_path(path):
+    return os.path.relpath(os.path.abspath(path), REPO_ROOT)
+
+
+def find_sessions(root):
+    """root/{日時}_{ID}/session_NN を列挙する"""
+    sessions = []
+    if not os.path.isdir(root):
+        return sessions
+    for experiment in sorted(os.scandir(root), key=lambda e: e.name):
+        if not experiment.is_dir():
+            continue
+        for session in sorted(os.scandir(experiment.path), key=lambda e: e.name):
+            if session.is_dir() and session.name.startswith('session_'):
+                sessions.append(session.path)
+    return sessions
+
+
+def fingerprint(session_dir):
+    """ファイル一覧の (相対パス, サイズ, 更新時刻) のハッシュ。stat のみで中身は読まない"""
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(session_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            st = os.stat(path)
+            entries.append(f"{os.path.relpath(path, session_dir)}\t{st.st_size}\t{st.st_mtime_ns}")
+    return hashlib.sha1("\n".join(entries).encode('utf-8')).hexdigest()
+
+
+# --- 各ファイルの集計 ---
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def summarize_gsr(path, time_column, scale):
+    """(サンプル数, 記録秒数, 最大間隔秒, 最初の時刻の秒) を返す。time_column の値 × scale が秒"""
+    count, first, last, max_gap = 0, None, None, 0.0
+    with open(path, encoding='utf-8', errors='replace') as f:
+        header = f.readline().strip().split(',')
+        col = header.index(time_column)
+        for line in f:
+            try:
+                t = float(line.split(',')[col]) * scale
+            except (ValueError, IndexError):
+                continue
+            if last is not None:
+                max_gap = max(max_gap, t - last)
+            if first is None:
+                first = t
+            last = t
+            count += 1
+    return count, (last - first) if count > 1 else 0.0, max_gap, first
+
+
+def summarize_events(path):
+    """イベントの種類ごとの件数。record_start_ns は最初の record_start の時刻（プリロールの長さを求めるのに使う）"""
+    counts = {'events': 0, 'av_change': 0, 'marker': 0, 'button': 0, 'clip': 0,
+              'record_start': 0, 'record_stop': 0, 'bad_lines': 0, 'record_start_ns': None}
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+                event_type = event['type']
+            except (ValueError, KeyError, TypeError):
+                counts['bad_lines'] += 1
+                continue
+            if event_type == 'record_start' and counts['record_start_ns'] is None:
+                counts['record_start_ns'] = event.get('pc_ns')
+            counts['events'] += 1
+            if event_type == 'av_change':
+                counts['av_change'] += 1
+            elif event_type == 'morph_awareness_marker':
+                counts['marker'] += 1
+            elif event_type == 'button':
+                counts['button'] += 1
+            elif event_type == 'clip_start':
+                counts['clip'] += 1
+            elif event_type in ('record_start', 'record_stop'):
+                counts[event_type] += 1
+    return counts
+
+
+def summarize_operations(path):
+    counts = {'events': 0, 'av_change': 0, 'marker': 0, 'button': 0, 'clip': 0,
+              'record_start': 0, 'record_stop': 0, 'bad_lines': 0}
+    names = {'controller_input': 'av_change', 'event_marker': 'marker',
+             'button_press': 'button', 'button_release': 'button',
+             'record_start': 'record_start', 'record_stop': 'record_stop'}
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 3:
+                counts['bad_lines'] += 1
+                continue
+            counts['events'] += 1
+            key = names.get(row[2])
+            if key:
+                counts[key] += 1
+    return counts
+
+
+def summarize_video(video_path, sidecar_path):
+    """(sidecarの行数, コンテナのフレーム数, 秒数)。コンテナはヘッダのみ読む"""
+    sidecar_frames, seconds = None, 0.0
+    if os.path.exists(sidecar_path):
+        first = last = None
+        sidecar_frames = 0
+        with open(sidecar_path, encoding='utf-8', errors='replace') as f:
+            f.readline()
+            for line in f:
+                try:
+                    pc_ns = int(line.split(',')[1])
+                except (ValueError, IndexError):
+                    continue
+                first = pc_ns if first is None else first
+                last = pc_ns
+                sidecar_frames += 1
+        if first is not None:
+            seconds = (last - first) / 1e9
+    container_frames = None
+    try:
+        import cv2  # 動画のフレーム数を確認する場合のみ必要
+        cap = cv2.VideoCapture(video_path)
+        if cap.isOpened():
+            container_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+    except ImportError:
+        pass
+    return sidecar_frames, container_frames, seconds
+
+
+def wav_seconds(path):
+    """WAVヘッダのdataサイズから秒数を求める。ヘッダとファイルサイズが合わなければ (秒数, False)"""
+    with open(path, 'rb') as f:
+        header = f.read(44)
+    if len(header) < 44 or header[:4] != b'RIFF':
+        return 0.0, False
+    channels, sample_rate = struct.unpack('<HI', header[22:28])
+    data_bytes = struct.unpack('<I', header[40:44])[0]
+    consistent = data_bytes == os.path.getsize(path) - 44
+    return data_bytes / (2 * channels * sample_rate) if sample_rate else 0.0, consistent
+
+
+def summarize_session(session_dir):
+    """1セッション分の行（sessions テーブルの列名 → 値）と動画の行のリスト"""
+    experiment_dir = os.path.dirname(os.path.abspath(session_dir))
+    match = EXPERIMENT_DIR_PATTERN.match(os.path.basename(experiment_dir))
+    number = re.search(r'(\d+)$', os.path.basename(os.path.normpath(session_dir)))
+    flags = []
+    row = {
+        'session_dir': relative_path(session_dir),
+        'experiment_dir': relative_path(experiment_dir),
+        'pid': match.group(2) if match else None,
+        'started': match.group(1) if match else None,
+        'session_number': int(number.group(1)) if number else None,
+    }
+
+    def path(*parts):
+        return os.path.join(session_dir, *parts)
+
+    # イベント
+    if os.path.exists(path('events.jsonl')):
+        counts = summarize_events(path('events.jsonl'))
+    elif os.path.exists(path('operations.csv')):
+        counts = summarize_operations(path('operations.csv'))
+    else:
+        counts = None
+        flags.append('no_events')
+    if counts:
+        if counts['record_stop'] == 0:
+            flags.append('no_record_stop')  # 録画停止前にアプリが終了した
+        if counts['bad_lines']:
+            flags.append('events_bad_lines')
+    counts = counts or {}
+    row.update(event_count=counts.get('events', 0), av_changes=counts.get('av_change', 0),
+               markers=counts.get('marker', 0), button_events=counts.get('button', 0),
+               clips=counts.get('clip', 0))
+
+    # GSR
+    gsr_samples = gsr_seconds = max_gap = preroll_seconds = 0
+    if os.path.exists(path('serial.csv')):
+        row['format'] = 'main'
+        gsr_path, time_column, scale = path('serial.csv'), 'pc_ns', 1e-9
+    else:
+        row['format'] = 'recorder'
+        gsr_path, time_column, scale = path('gsr_data.csv'), 'elapsed_seconds', 1.0
+    if os.path.exists(gsr_path):
+        try:
+            gsr_samples, gsr_seconds, max_gap, first = summarize_gsr(gsr_path, time_column, scale)
+            # プリロール（main.py の記録）: record_start より前の pc_ns の行
+            record_start_ns = counts.get('record_start_ns')
+            if first is not None and isinstance(record_start_ns, int):
+                preroll_seconds = max(0.0, record_start_ns * scale - first)
+        except ValueError:
+            flags.append('gsr_header')
+        if not _ends_with_newline(gsr_path):
+            flags.append('gsr_truncated')
+        if max_gap > GSR_GAP_SECONDS:
+            flags.append('gsr_gap')
+    else:
+        flags.append('no_gsr')
+    row.update(gsr_samples=gsr_samples, gsr_seconds=gsr_seconds, gsr_max_gap_s=max_gap,
+               preroll_seconds=preroll_seconds)
+
+    # 動画
+    videos = []
+    video_dir = path('video')
+    if os.path.isdir(video_dir):
+        for name in sorted(os.listdir(video_dir)):
+            if not name.endswith('.mp4'):
+                continue
+            camera = os.path.splitext(name)[0]
+            video_path = os.path.join(video_dir, name)
+            sidecar_frames, container_frames, seconds = summarize_video(
+                video_path, path('sidecar', f"{camera}_frames.csv"))
+            size = os.path.getsize(video_path)
+            if size == 0 or container_frames == 0:
+                flags.append(f"{camera}_empty")
+            elif sidecar_frames is None:
+                flags.append(f"{camera}_no_sidecar")
+            elif container_frames is not None and container_frames != sidecar_frames:
+                flags.append(f"{camera}_frame_mismatch")
+            videos.append({'session_dir': row['session_dir'], 'camera': camera, 'bytes': size,
+                           'sidecar_frames': sidecar_frames, 'container_frames': container_frames,
+                           'seconds': seconds})
+    # 顔ROI録画では1台のカメラに全体映像と切り出し映像の2本があるため、カメラごとに数える
+    frames_by_camera = {}
+    for v in videos:
+        camera = v['camera'][:-len(FACE_STREAM_SUFFIX)] if v['camera'].endswith(FACE_STREAM_SUFFIX) else v['camera']
+        frames_by_camera[camera] = max(frames_by_camera.get(camera, 0), v['sidecar_frames'] or v['container_frames'] or 0)
+    row.update(camera_count=len(frames_by_camera),
+               video_frames=sum(frames_by_camera.values()),
+               video_bytes=sum(v['bytes'] for v in videos))
+
+    # 音声
+    audio_seconds = 0.0
+    if os.path.exists(path('audio', 'rta.wav')):
+        audio_seconds, consistent = wav_seconds(path('audio', 'rta.wav'))
+        if not consistent:
+            flags.append('audio_header')
+    row['audio_seconds'] = audio_seconds
+
+    total = 0
+    for dirpath, _, filenames in os.walk(session_dir):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+    row.update(total_bytes=total, flags=",".join(flags))
+    return row, videos
+
+
+# --- カタログの更新 ---
+def index_session(session_dir, conn=None, db_path=DEFAULT_DB_PATH, force=False):
+    """1セッションをカタログに登録する。内容が変わっていなければ何もしない。更新したら True"""
+    own = conn is None
+    if own:
+        conn = connect(db_path)
+    try:
+        key = relative_path(session_dir)
+        digest = fingerprint(session_dir)
+        stored = conn.execute("SELECT fingerprint FROM sessions WHERE session_dir = ?", (key,)).fetchone()
+        if stored and stored['fingerprint'] == digest and not force:
+            return False
+        row, videos = summarize_session(session_dir)
+        row.update(fingerprint=digest, indexed_at=time.time())
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE session_dir = ?", (key,))
+            conn.execute(f"INSERT INTO sessions ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                         list(row.values()))
+            for video in videos:
+                conn.execute(f"INSERT INTO videos ({', '.join(video)}) VALUES ({', '.join('?' * len(video))})",
+                             list(video.values()))
+        return True
+    finally:
+        if own:
+            conn.close()
+
+
+def index_session_in_background(session_dir, db_path=DEFAULT_DB_PATH):
+    """
+    録画停止時に呼ぶ。集計は別スレッドで行い、GUIを止めない。
+    失敗してもカタログは次回の scan で補われるため、警告の表示のみ行う。
+    """
+    def run():
+        try:
+            index_session(session_dir, db_path=db_path)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            print(f"カタログの更新に失敗しました ({session_dir}): {e}")
+    thread = threading.Thread(target=run, name="catalog-index")
+    thread.start()
+    return thread
+
+
+def rescan(roots, db_path=DEFAULT_DB_PATH, force=False):
+    """roots 以下の全セッションを確認し、(更新数, 変化なし数, 削除数) を返す"""
+    conn = connect(db_path)
+    try:
+        seen = set()
+        updated = unchanged = 0
+        for root in roots:
+            for session_dir in find_sessions(root):
+                seen.add(relative_path(session_dir))
+                if index_session(session_dir, conn, force=force):
+                    updated += 1
+                else:
+                    unchanged += 1
+        # 走査したルート以下でディレクトリが消えたものを削除
+        prefixes = tuple(relative_path(root) + os.sep for root in roots)
+        removed = [r['session_dir'] for r in conn.execute("SELECT session_dir FROM sessions")
+                   if r['session_dir'].startswith(prefixes) and r['session_dir'] not in seen]
+        with conn:
+            conn.executemany("DELETE FROM sessions WHERE session_dir = ?", [(r,) for r in removed])
+        return updated, unchanged, len(removed)
+    finally:
+        conn.close()
+
+
+def query_sessions(conn, pid=None, min_cameras=None, min_gsr_minutes=None, clean=False):
+    conditions, params = [], []
+    if pid:
+        conditions.append("pid = ?")
+        params.append(pid)
+    if min_cameras is not None:
+        conditions.append("camera_count >= ?")
+        params.append(min_cameras)
+    if min_gsr_minutes is not None:
+        conditions.append("gsr_seconds >= ?")
+        params.append(min_gsr_minutes * 60)
+    if clean:
+        conditions.append("flags = ''")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return conn.execute(f"SELECT * FROM sessions {where} ORDER BY started, session_number", params).fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="記録済みセッションのカタログ（SQLite）を作成・検索します")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="カタログのパス（既定: リポジトリ直下の catalog.sqlite）")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    scan = sub.add_parser('scan', help="変化したセッションだけを読み直してカタログを更新")
+    scan.add_argument('roots', nargs='*', default=DEFAULT_ROOTS, help="データディレクトリ（既定: pc_app/data, experiment_data）")
+    scan.add_argument('--force', action='store_true', help="変化の有無に関わらず全て読み直す")
+
+    show = sub.add_parser('list', help="条件に合うセッションを表示")
+    show.add_argument('--pid')
+    show.add_argument('--min-cameras', type=int)
+    show.add_argument('--min-gsr-minutes', type=float)
+    show.add_argument('--clean', action='store_true', help="整合性フラグの無いセッションのみ")
+
+    sql = sub.add_parser('sql', help="任意のSQLを実行")
+    sql.add_argument('statement')
+    args = parser.parse_args(argv)
+
+    if args.command == 'scan':
+        start = time.perf_counter()
+        updated, unchanged, removed = rescan(args.roots, args.db, args.force)
+        print(f"更新 {updated}、変化なし {unchanged}、削除 {removed}（{time.perf_counter() - start:.2f} 秒）")
+        return 0
+
+    conn = connect(args.db)
+    try:
+        if args.command == 'list':
+            rows = query_sessions(conn, args.pid, args.min_cameras, args.min_gsr_minutes, args.clean)
+            for r in rows:
+                print(f"{r['session_dir']}  PID={r['pid']}  GSR {r['gsr_seconds'] / 60:.1f}分/{r['gsr_samples']}件  "
+                      f"カメラ {r['camera_count']}台/{r['video_frames']}フレーム  イベント {r['event_count']}  "
+                      f"{r['total_bytes'] / 1e6:.0f} MB  {r['flags'] or 'OK'}")
+            print(f"{len(rows)} セッション")
+        else:
+            cursor = conn.execute(args.statement)
+            if cursor.description:
+                print("\t".join(d[0] for d in cursor.description))
+                for r in cursor:
+                    print("\t".join(str(v) for v in r))
+            conn.commit()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
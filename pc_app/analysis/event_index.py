@@ -0,0 +1,281 @@
+"""
+events.jsonl / operations.csv の区間インデックス
+
+イベントログを1回だけ読み、時刻・種類の配列と、録画・クリップ・休憩・モーフ気付きの区間に
+まとめる。「時刻 t はどのクリップ（休憩）か」「[t0, t1] のマーカー」を、ログを読み直さずに
+二分探索で求める。GSR の時刻配列全体のラベル付けも区間の種類ごとに searchsorted 1回で済む。
+
+    index = EventIndex.load(session_dir)
+    trace = load_trace(os.path.join(session_dir, 'serial.csv'))   # rating_trace.py
+    labels = index.label(trace['pc_ns'])          # {'clip': クリップ番号 (-1 は区間外), ...}
+    clip_ids = index.spans['clip'].labels_at(trace['pc_ns'])
+    markers = index.events_between(t0, t1, types=['morph_awareness_marker'])
+
+区間の種類:
+- record: record_start から record_stop まで（record_stop が無ければ最後のイベントまで）
+- clip: clip_start から clip_end まで（ラベルは clip_id）
+- rest: 録画中でクリップ外の区間（ラベルは休憩の通し番号）
+- morph: クリップ内で最初の morph_awareness_marker からクリップの終わりまで（ラベルは clip_id）
+
+時刻はいずれも ns の int64。main.py の記録は pc_ns、recorder.py の operations.csv は
+elapsed_seconds を ns にしたもの（gsr_data.csv の elapsed_seconds と同じ基準）を使う。
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.analysis.event_index pc_app/data
+"""
+
+import os
+import csv
+import sys
+import glob
+import json
+import time
+import argparse
+
+import numpy as np
+
+from .rating_trace import load_trace
+
+SPAN_KINDS = ('record', 'clip', 'rest', 'morph')
+# recorder.py の operations.csv の操作名 -> events.jsonl のイベント名
+OPERATION_TYPES = {
+    'controller_input': 'av_change',
+    'event_marker': 'morph_awareness_marker',
+    'button_press': 'button',
+    'button_release': 'button',
+    'record_start': 'record_start',
+    'record_stop': 'record_stop',
+}
+
+
+def parse_event_line(line):
+    """events.jsonl の1行を (時刻ns, 種類, データ) にする。読めない行（書き込み途中の最終行など）は None"""
+    try:
+        event = json.loads(line)
+        return int(event['pc_ns']), event.get('type', ''), event.get('data') or {}
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def parse_operation_row(row):
+    """operations.csv の1行を events.jsonl と同じ (時刻ns, 種類, データ) にする。読めない行は None"""
+    try:
+        elapsed_ns = int(round(float(row[1]) * 1e9))
+        operation = row[2]
+    except (IndexError, ValueError):
+        return None
+    details = {'operation': operation, 'details': row[5] if len(row) > 5 else ''}
+    if operation == 'controller_input' and len(row) > 4:
+        try:
+            details.update(arousal=float(row[3]), valence=float(row[4]))
+        except ValueError:
+            pass
+    return elapsed_ns, OPERATION_TYPES.get(operation, operation), details
+
+
+def _columns(events):
+    """(時刻ns, 種類, データ) の列から読めなかった行を除き、([時刻], [種類], [データ]) にする"""
+    times, types, data = [], [], []
+    for event in events:
+        if event:
+            times.append(event[0])
+            types.append(event[1])
+            data.append(event[2])
+    return times, types, data
+
+
+class IntervalIndex:
+    """
+    重ならない区間 [start, end) の集合。区間は開始時刻順に並べ、終了時刻も同じ順に単調増加する前提で、
+    所属・重なりの検索を二分探索で行う（ログが壊れて区間が重なる場合は、後から始まった区間を優先する）。
+    """
+    def __init__(self, starts, ends, labels):
+        order = np.argsort(np.asarray(starts, dtype=np.int64), kind='stable')
+        self.starts = np.asarray(starts, dtype=np.int64)[order]
+        self.ends = np.asarray(ends, dtype=np.int64)[order]
+        self.labels = np.empty(len(order), dtype=object)
+        self.labels[:] = [labels[i] for i in order]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, t):
+        """各時刻を含む区間の番号の配列（どの区間にも含まれなければ -1）"""
+        t = np.asarray(t, dtype=np.int64)
+        i = np.searchsorted(self.starts, t, side='right') - 1
+        if not len(self.starts):
+            return i
+        inside = (i >= 0) & (t < self.ends[np.maximum(i, 0)])
+        return np.where(inside, i, -1)
+
+    def labels_at(self, t, fill=None):
+        """各時刻を含む区間のラベルの配列（区間外は fill）"""
+        labels = np.empty(len(self.labels) + 1, dtype=object)
+        labels[:-1] = self.labels
+        labels[-1] = fill
+        return labels[self.lookup(t)]  # -1 は末尾の fill を指す
+
+    def overlapping(self, t0, t1):
+        """[t0, t1) と重なる区間の番号の範囲"""
+        lo = np.searchsorted(self.ends, t0, side='right')
+        hi = np.searchsorted(self.starts, t1, side='left')
+        return range(int(lo), int(max(lo, hi)))
+
+    def durations_s(self):
+        return (self.ends - self.starts) / 1e9
+
+
+class EventIndex:
+    """イベントログを時刻順の配列（times / type_codes / data）と区間の種類ごとの IntervalIndex にまとめる"""
+    def __init__(self, times, types, data):
+        order = np.argsort(np.asarray(times, dtype=np.int64), kind='stable')
+        self.times = np.asarray(times, dtype=np.int64)[order]
+        # 種類は番号で持つ（type_names[type_codes[i]] がイベント i の種類）
+        self.type_names, codes = np.unique(np.asarray(types, dtype=object)[order].astype(str), return_inverse=True)
+        self.type_codes = codes.astype(np.int32)
+        self.data = [data[i] for i in order]
+        self._times_by_type = {}
+        self.spans = self._build_spans()
+
+    @classmethod
+    def from_events_jsonl(cls, path):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            return cls(*_columns(parse_event_line(line) for line in f))
+
+    @classmethod
+    def from_operations_csv(cls, path):
+        """recorder.py の operations.csv（時刻は elapsed_seconds を ns にしたもの）"""
+        with open(path, encoding='utf-8', errors='replace', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            return cls(*_columns(parse_operation_row(row) for row in reader))
+
+    @classmethod
+    def load(cls, session_dir):
+        """セッションの events.jsonl（無ければ operations.csv）を読む。どちらも無ければ None"""
+        events_path = os.path.join(session_dir, 'events.jsonl')
+        if os.path.exists(events_path):
+            return cls.from_events_jsonl(events_path)
+        operations_path = os.path.join(session_dir, 'operations.csv')
+        if os.path.exists(operations_path):
+            return cls.from_operations_csv(operations_path)
+        return None
+
+    def __len__(self):
+        return len(self.times)
+
+    def times_of(self, event_type):
+        """指定した種類のイベントの時刻の配列（時刻順）"""
+        if event_type not in self._times_by_type:
+            self._times_by_type[event_type] = self.times[self._mask(event_type)]
+        return self._times_by_type[event_type]
+
+    def _mask(self, event_type):
+        code = np.searchsorted(self.type_names, event_type)
+        if code >= len(self.type_names) or self.type_names[code] != event_type:
+            return np.zeros(len(self.times), dtype=bool)
+        return self.type_codes == code
+
+    def events_between(self, t0, t1, types=None):
+        """[t0, t1) のイベントを時刻順に (時刻, 種類, データ) のリストで返す（types で種類を絞る）"""
+        lo, hi = np.searchsorted(self.times, [t0, t1])
+        indices = np.arange(lo, hi)
+        if types is not None:
+            wanted = np.isin(self.type_names[self.type_codes[lo:hi]], list(types))
+            indices = indices[wanted]
+        return [(int(self.times[i]), str(self.type_names[self.type_codes[i]]), self.data[i]) for i in indices]
+
+    def count_between(self, event_type, t0, t1):
+        lo, hi = np.searchsorted(self.times_of(event_type), [t0, t1])
+        return int(hi - lo)
+
+    def label(self, t):
+        """各時刻が属する区間の番号を区間の種類ごとに返す（{'record': 配列, 'clip': 配列, ...}、区間外は -1）"""
+        return {kind: self.spans[kind].lookup(t) for kind in SPAN_KINDS}
+
+    def _build_spans(self):
+        last_ns = int(self.times[-1]) if len(self.times) else 0
+        records, record_start = [], None
+        clips, clip_start = [], None
+        morphs, morph_start = [], None
+        for i, t in enumerate(self.times):
+            event_type = self.type_names[self.type_codes[i]]
+            t = int(t)
+            if event_type == 'record_start':
+                record_start = t
+            elif event_type == 'record_stop' and record_start is not None:
+                records.append((record_start, t, len(records)))
+                record_start = None
+            elif event_type == 'clip_start':
+                clip_start, morph_start = (t, self.data[i].get('clip_id')), None
+            elif event_type == 'clip_end' and clip_start:
+                clips.append((clip_start[0], t, clip_start[1]))
+                # モーフ気付きはクリップの終わりまで続く
+                if morph_start is not None:
+                    morphs.append((morph_start, t, clip_start[1]))
+                clip_start = morph_start = None
+            elif event_type == 'morph_awareness_marker' and clip_start and morph_start is None:
+                morph_start = t
+        # record_stop が無い（途中で終了した）録画は最後のイベントまでとする
+        if record_start is not None:
+            records.append((record_start, last_ns, len(records)))
+
+        # 休憩: 録画区間からクリップ区間を除いた残り
+        rests = []
+        for record_start, record_end, _ in records:
+            cursor = record_start
+            for start, end, _ in clips:
+                if end <= record_start or start >= record_end:
+                    continue
+                if start > cursor:
+                    rests.append((cursor, start, len(rests)))
+                cursor = max(cursor, end)
+            if record_end > cursor:
+                rests.append((cursor, record_end, len(rests)))
+
+        def index(spans):
+            return IntervalIndex([s[0] for s in spans], [s[1] for s in spans], [s[2] for s in spans])
+        return {'record': index(records), 'clip': index(clips), 'rest': index(rests), 'morph': index(morphs)}
+
+
+def find_sessions(root):
+    sessions = set()
+    for name in ('events.jsonl', 'operations.csv'):
+        sessions.update(os.path.dirname(p) for p in glob.glob(os.path.join(root, '**', name), recursive=True))
+    return sorted(sessions)
+
+
+def summarize_session(session_dir):
+    """セッション1つの区間数と、GSR サンプルのうちクリップ内・休憩中の割合を表示する"""
+    loaded_at = time.perf_counter()
+    index = EventIndex.load(session_dir)
+    if index is None:
+        return
+    load_ms = (time.perf_counter() - loaded_at) * 1000
+    counts = ", ".join(f"{kind} {len(index.spans[kind])}" for kind in SPAN_KINDS)
+    print(f"{session_dir}: イベント {len(index)} 件（{load_ms:.0f} ms）, 区間: {counts}")
+    serial_path = os.path.join(session_dir, 'serial.csv')
+    trace = load_trace(serial_path) if os.path.exists(serial_path) else None
+    if not trace or not len(trace['pc_ns']):
+        return
+    labeled_at = time.perf_counter()
+    labels = index.label(trace['pc_ns'])
+    label_ms = (time.perf_counter() - labeled_at) * 1000
+    n = len(trace['pc_ns'])
+    in_clip = np.count_nonzero(labels['clip'] >= 0)
+    in_rest = np.count_nonzero(labels['rest'] >= 0)
+    print(f"  GSR {n} サンプル（ラベル付け {label_ms:.1f} ms）: クリップ内 {in_clip / n:.1%}, 休憩 {in_rest / n:.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="イベントログの区間インデックスを作り、区間の数を表示します")
+    parser.add_argument('root', help="データディレクトリ（例: pc_app/data）またはセッションディレクトリ")
+    args = parser.parse_args(argv)
+
+    for session_dir in find_sessions(args.root):
+        summarize_session(session_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
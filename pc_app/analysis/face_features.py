@@ -0,0 +1,324 @@
+"""
+録画済みカメラ映像からの顔特徴量バッチ抽出（CPUのみ）
+
+要件定義書 オープン事項4「表情推定の後処理」の内蔵バッチ版。
+session_NN/video/camera_*.mp4 をデコードし、顔検出（Haar もしくは OpenCV DNN）と
+顔領域ごとの簡易特徴量を計算して derived/ 以下にCSVで保存する。
+
+- デコードは別スレッドで先読みし、特徴量計算はプロセスプールで並列化する
+- --stride N で N フレームごとに処理（間引いたフレームはデコードせず grab のみ）
+- 各行は sidecar/camera_*_frames.csv のフレーム取得時刻 (pc_ns) をキーとする
+- 動画ごとに結果をキャッシュし、再実行時は新しいセッションのみ処理する
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.analysis.face_features pc_app/data --stride 2 --workers 4
+"""
+
+import os
+import sys
+import csv
+import json
+import glob
+import queue
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from ..workers.sidecar import sidecar_path_for
+
+# キャッシュの互換性判定に使用（特徴量の定義を変えたら上げる）
+FEATURE_VERSION = 1
+
+FEATURE_COLUMNS = [
+    'face_found', 'face_x', 'face_y', 'face_w', 'face_h', 'face_score',
+    'eyes', 'face_brightness', 'brow_energy', 'mouth_energy', 'mouth_std', 'symmetry',
+]
+
+# 検出は縮小した画像で行う（1280x720 -> 640x360）
+DETECT_WIDTH = 640
+# 顔領域は固定サイズに正規化してから特徴量を計算する
+FACE_NORM_SIZE = 128
+
+# --- プロセスプール側の状態（initializerで各プロセスに1回だけ読み込む） ---
+_face_detector = None
+_eye_detector = None
+_dnn_net = None
+
+
+def _init_worker(dnn_model, dnn_config):
+    global _face_detector, _eye_detector, _dnn_net
+    cv2.setNumThreads(1)  # プロセス並列と競合させない
+    if dnn_model and dnn_config:
+        _dnn_net = cv2.dnn.readNetFromCaffe(dnn_config, dnn_model)
+    else:
+        _face_detector = cv2.CascadeClassifier(
+            os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+    _eye_detector = cv2.CascadeClassifier(
+        os.path.join(cv2.data.haarcascades, 'haarcascade_eye.xml'))
+
+
+def _detect_face(gray):
+    """最大の顔を (x, y, w, h, score) で返す。見つからなければ None"""
+    if _dnn_net is not None:
+        h, w = gray.shape
+        bgr = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
+        _dnn_net.setInput(blob)
+        detections = _dnn_net.forward()[0, 0]
+        best = None
+        for det in detections:
+            score = float(det[2])
+            if score < 0.5:
+                continue
+            x0, y0, x1, y1 = (det[3:7] * np.array([w, h, w, h])).astype(int)
+            area = (x1 - x0) * (y1 - y0)
+            if best is None or area > best[2] * best[3]:
+                best = (max(x0, 0), max(y0, 0), x1 - x0, y1 - y0, score)
+        return best
+
+    faces = _face_detector.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    return (int(x), int(y), int(w), int(h), 1.0)
+
+
+def _region_energy(img):
+    """領域内の勾配エネルギー（眉・口の動きの簡易指標）"""
+    gx = cv2.Sobel(img, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(img, cv2.CV_32F, 0, 1, ksize=3)
+    return float(np.mean(np.abs(gx)) + np.mean(np.abs(gy)))
+
+
+def extract_features(gray):
+    """縮小済みグレースケール画像1枚から特徴量のタプルを計算する"""
+    h, w = gray.shape
+    face = _detect_face(gray)
+    if face is None:
+        return (0,) + (float('nan'),) * (len(FEATURE_COLUMNS) - 1)
+
+    x, y, fw, fh, score = face
+    roi = gray[y:y + fh, x:x + fw]
+    if roi.size == 0:
+        return (0,) + (float('nan'),) * (len(FEATURE_COLUMNS) - 1)
+    roi = cv2.equalizeHist(cv2.resize(roi, (FACE_NORM_SIZE, FACE_NORM_SIZE)))
+
+    # 顔領域を上下に分割: 上部40%を目・眉、下部1/3を口周りとみなす
+    upper = roi[:int(FACE_NORM_SIZE * 0.4)]
+    lower = roi[int(FACE_NORM_SIZE * 2 / 3):]
+    eyes = _eye_detector.detectMultiScale(upper, scaleFactor=1.1, minNeighbors=3)
+    mirrored = cv2.flip(roi, 1)
+    symmetry = float(np.mean(cv2.absdiff(roi, mirrored))) / 255.0
+
+    return (
+        1,
+        x / w, y / h, fw / w, fh / h, score,
+        len(eyes),
+        float(np.mean(roi)) / 255.0,
+        _region_energy(upper),
+        _region_energy(lower),
+        float(np.std(lower)) / 255.0,
+        symmetry,
+    )
+
+
+def _process_frame(job):
+    frame_idx, gray = job
+    return frame_idx, extract_features(gray)
+
+
+# --- 先読みデコード ---
+class FramePrefetcher(threading.Thread):
+    """別スレッドで動画をデコードし、処理対象フレームだけをキューに積む"""
+
+    def __init__(self, video_path, stride=1, max_prefetch=64):
+        super().__init__(daemon=True)
+        self.video_path = video_path
+        self.stride = max(1, stride)
+        self.frames = queue.Queue(maxsize=max_prefetch)
+        self.fps = 0.0
+        self.frame_count = 0
+        self.error = None
+        self._opened = threading.Event()
+
+    def wait_opened(self):
+        self._opened.wait()
+        return self.error is None
+
+    def run(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            self.error = f"動画を開けませんでした: {self.video_path}"
+            self._opened.set()
+            self.frames.put(None)
+            return
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self._opened.set()
+
+        frame_idx = 0
+        try:
+            while True:
+                if frame_idx % self.stride:
+                    # 間引くフレームはデコードせずに読み飛ばす
+                    if not cap.grab():
+                        break
+                    frame_idx += 1
+                    continue
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                scale = DETECT_WIDTH / gray.shape[1]
+                if scale < 1.0:
+                    gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                self.frames.put((frame_idx, gray))
+                frame_idx += 1
+        finally:
+            cap.release()
+            self.frames.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            yield item
+
+
+# --- タイムスタンプ・キャッシュ ---
+def load_frame_timestamps(video_path):
+    """sidecarから {frame_idx: pc_ns} を読み込む。無ければ空の辞書"""
+    path = sidecar_path_for(video_path)
+    timestamps = {}
+    if not os.path.exists(path):
+        return timestamps
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            try:
+                timestamps[int(row['frame_idx'])] = int(row['pc_ns'])
+            except (KeyError, ValueError):
+                continue
+    return timestamps
+
+
+def output_paths_for(video_path):
+    session_dir = os.path.dirname(os.path.dirname(video_path))
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    base = os.path.join(session_dir, 'derived', f"face_{stem}")
+    return base + '.csv', base + '.json'
+
+
+def _cache_key(video_path, stride, detector):
+    st = os.stat(video_path)
+    return {
+        'video_size': st.st_size,
+        'video_mtime_ns': st.st_mtime_ns,
+        'stride': stride,
+        'detector': detector,
+        'feature_version': FEATURE_VERSION,
+    }
+
+
+def is_cached(video_path, stride, detector):
+    csv_path, meta_path = output_paths_for(video_path)
+    if not (os.path.exists(csv_path) and os.path.exists(meta_path)):
+        return False
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get('cache_key') == _cache_key(video_path, stride, detector)
+
+
+# --- パイプライン本体 ---
+def process_video(video_path, executor, stride=1, detector='haar', max_in_flight=32):
+    """1本の動画を処理して derived/face_{stem}.csv を書き出す。処理フレーム数を返す"""
+    csv_path, meta_path = output_paths_for(video_path)
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+
+    timestamps = load_frame_timestamps(video_path)
+    prefetcher = FramePrefetcher(video_path, stride=stride, max_prefetch=max_in_flight * 2)
+    prefetcher.start()
+    if not prefetcher.wait_opened():
+        print(prefetcher.error)
+        return 0
+    fps = prefetcher.fps or 20.0
+
+    # 途中で中断されても不完全なキャッシュが残らないよう一時ファイルに書く
+    tmp_path = csv_path + '.tmp'
+    processed = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['frame_idx', 'pc_ns', 't_s'] + FEATURE_COLUMNS)
+
+        def write_result(result):
+            frame_idx, features = result
+            pc_ns = timestamps.get(frame_idx, '')
+            writer.writerow([frame_idx, pc_ns, f"{frame_idx / fps:.3f}"] +
+                            [f"{v:.5g}" if isinstance(v, float) else v for v in features])
+
+        # 同時に投入するジョブ数を制限してメモリ使用量を一定に保つ（結果はフレーム順に書く）
+        pending = deque()
+        for job in prefetcher:
+            pending.append(executor.submit(_process_frame, job))
+            if len(pending) >= max_in_flight:
+                write_result(pending.popleft().result())
+                processed += 1
+        while pending:
+            write_result(pending.popleft().result())
+            processed += 1
+
+    os.replace(tmp_path, csv_path)
+    meta = {
+        'video': os.path.basename(video_path),
+        'frames_processed': processed,
+        'frame_count': prefetcher.frame_count,
+        'fps': fps,
+        'has_sidecar': bool(timestamps),
+        'cache_key': _cache_key(video_path, stride, detector),
+    }
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return processed
+
+
+def find_videos(root):
+    pattern = os.path.join(root, '**', 'video', 'camera_*.mp4')
+    return sorted(glob.glob(pattern, recursive=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="録画済みカメラ映像から顔特徴量をバッチ抽出します")
+    parser.add_argument('root', help="データディレクトリ（例: pc_app/data）")
+    parser.add_argument('--stride', type=int, default=1, help="N フレームごとに処理 (既定: 1)")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="特徴量計算のプロセス数")
+    parser.add_argument('--dnn-model', help="OpenCV DNN 顔検出モデル (res10_300x300_ssd_iter_140000.caffemodel)")
+    parser.add_argument('--dnn-config', help="OpenCV DNN 顔検出設定 (deploy.prototxt)")
+    parser.add_argument('--force', action='store_true', help="キャッシュを無視して再処理")
+    args = parser.parse_args(argv)
+
+    detector = 'dnn' if args.dnn_model and args.dnn_config else 'haar'
+    videos = find_videos(args.root)
+    todo = [v for v in videos if args.force or not is_cached(v, args.stride, detector)]
+    print(f"動画 {len(videos)} 本中 {len(todo)} 本を処理します（検出器: {detector}, stride: {args.stride}）")
+    if not todo:
+        return 0
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(args.dnn_model, args.dnn_config)) as executor:
+        for video_path in todo:
+            count = process_video(video_path, executor, stride=args.stride, detector=detector,
+                                  max_in_flight=args.workers * 4)
+            print(f"完了: {video_path} ({count} フレーム) -> {output_paths_for(video_path)[0]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+serial.csv の評価トレースからクリップごとの評価指標を計算する
+
+serial.csv は GSR サンプルごとにその時点の arousal / valence / online5 を記録しているため、
+イベントログから階段関数を再構成せずに配列演算だけで集計できる。
+
+- online5_auc: クリップ区間の online5 の積分（値×秒、サンプル保持）
+- online5_mean / arousal_mean / valence_mean: 区間内の時間加重平均
+- gsr_mean: 区間内の GSR 平均
+
+結果は session_NN/derived/rating_clips.csv に保存する。
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.analysis.rating_trace pc_app/data
+"""
+
+import os
+import sys
+import csv
+import json
+import glob
+import argparse
+import warnings
+
+import numpy as np
+
+TRACE_COLUMNS = ['pc_ns', 'gsr_value', 'arousal', 'valence', 'online5']
+
+OUTPUT_COLUMNS = [
+    'clip_id', 'start_ns', 'end_ns', 'dur_s', 'samples',
+    'online5_auc', 'online5_mean', 'arousal_mean', 'valence_mean', 'gsr_mean',
+]
+
+
+def load_trace(serial_path):
+    """serial.csv を列名 -> numpy 配列 の辞書として読み込む（評価列が無い旧形式は None）"""
+    with open(serial_path, encoding='utf-8') as f:
+        header = f.readline().strip().split(',')
+    if not set(TRACE_COLUMNS) <= set(header):
+        return None
+    usecols = [header.index(name) for name in TRACE_COLUMNS]
+    # 書き込み途中で終わった最終行などは読み飛ばす
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        data = np.genfromtxt(serial_path, delimiter=',', skip_header=1, usecols=usecols,
+                             dtype=np.float64, invalid_raise=False)
+    data = np.atleast_2d(data)
+    data = data[~np.isnan(data).any(axis=1)] if data.size else np.empty((0, len(TRACE_COLUMNS)))
+    trace = {name: data[:, i] for i, name in enumerate(TRACE_COLUMNS)}
+    trace['pc_ns'] = trace['pc_ns'].astype(np.int64)
+    return trace
+
+
+def load_clips(events_path):
+    """events.jsonl の clip_start / clip_end を (clip_id, start_ns, end_ns) の組にする"""
+    clips, open_clip = [], None
+    with open(events_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event.get('type') == 'clip_start':
+                open_clip = (event.get('data', {}).get('clip_id'), int(event['pc_ns']))
+            elif event.get('type') == 'clip_end' and open_clip:
+                clips.append((open_clip[0], open_clip[1], int(event['pc_ns'])))
+                open_clip = None
+    return clips
+
+
+def clip_metrics(trace, start_ns, end_ns):
+    """区間 [start_ns, end_ns) の指標。各サンプルの値は次のサンプルまで保持されたものとみなす"""
+    t = trace['pc_ns']
+    lo, hi = np.searchsorted(t, [start_ns, end_ns])
+    # 区間を区間内のサンプル時刻で区切り、各小区間にはその開始時点で最新の値を割り当てる
+    dt = np.diff(np.concatenate(([start_ns], t[lo:hi], [end_ns]))) / 1e9
+    result = {'samples': int(hi - lo), 'dur_s': (end_ns - start_ns) / 1e9}
+    for name in ('online5', 'arousal', 'valence'):
+        # 最初のサンプルより前の区間は値が無いため除く
+        before = trace[name][lo - 1] if lo > 0 else np.nan
+        values = np.concatenate(([before], trace[name][lo:hi]))
+        valid = ~np.isnan(values)
+        auc = float(np.sum(values[valid] * dt[valid]))
+        total = float(dt[valid].sum())
+        if name == 'online5':
+            result['online5_auc'] = auc
+        result[f'{name}_mean'] = auc / total if total > 0 else float('nan')
+    result['gsr_mean'] = float(trace['gsr_value'][lo:hi].mean()) if hi > lo else float('nan')
+    return result
+
+
+def process_session(session_dir):
+    """セッション1つを集計して derived/rating_clips.csv に保存し、クリップ数を返す"""
+    serial_path = os.path.join(session_dir, 'serial.csv')
+    events_path = os.path.join(session_dir, 'events.jsonl')
+    if not (os.path.exists(serial_path) and os.path.exists(events_path)):
+        return 0
+    trace = load_trace(serial_path)
+    if trace is None:
+        print(f"スキップ（評価列の無い旧形式）: {serial_path}")
+        return 0
+    clips = load_clips(events_path)
+    out_dir = os.path.join(session_dir, 'derived')
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'rating_clips.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for clip_id, start_ns, end_ns in clips:
+            row = {'clip_id': clip_id, 'start_ns': start_ns, 'end_ns': end_ns}
+            row.update(clip_metrics(trace, start_ns, end_ns))
+            writer.writerow({k: (f"{v:.6g}" if isinstance(v, float) else v) for k, v in row.items()})
+    return len(clips)
+
+
+def find_sessions(root):
+    pattern = os.path.join(root, '**', 'serial.csv')
+    return sorted(os.path.dirname(p) for p in glob.glob(pattern, recursive=True))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="serial.csv の評価トレースからクリップごとの評価指標を計算します")
+    parser.add_argument('root', help="データディレクトリ（例: pc_app/data）")
+    args = parser.parse_args(argv)
+
+    sessions = find_sessions(args.root)
+    print(f"セッション {len(sessions)} 件を処理します")
+    for session_dir in sessions:
+        count = process_session(session_dir)
+        if count:
+            print(f"完了: {session_dir} ({count} クリップ)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+セッションのファイルを一定行数のチャンクで読むストリーミングリーダー
+
+serial.csv・gsr_data.csv・operations.csv・events.jsonl をファイル全体を読み込まずに先頭から読み、
+chunk_rows 行ずつ列名 -> NumPy 配列 のチャンクとして返す。隣り合うチャンクは overlap 行だけ重ねるため、
+窓を使うフィルタや検出器はチャンクの境目を意識せずに処理できる。メモリ使用量はファイルの長さに
+よらず一定で、最初のチャンクは読み始めてすぐに返る。
+
+    for chunk in iter_chunks(serial_path, chunk_rows=65536, overlap=256):
+        filtered = smooth(chunk['gsr_value'])      # 窓幅 overlap 以下の処理
+        emit(chunk.t_ns[chunk.new_rows], filtered[chunk.new_rows])
+
+    # 複数セッションを続けて処理する（チャンクはセッションをまたがない）
+    for chunk in iter_session_chunks(session_dirs, 'serial.csv'):
+        ...
+
+各チャンクには共通の時刻列 t_ns（int64, ns）がある。serial.csv は pc_ns、gsr_data.csv は
+elapsed_seconds を ns にしたもの、イベントは event_index.py と同じ時刻。
+events.jsonl / operations.csv のチャンクは t_ns・type・data の列を持ち、ファイルの行の順に並ぶ
+（時刻順に並べ替えない）。書き込み途中で終わった行などの読めない行は読み飛ばす。
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.analysis.stream_reader pc_app/data/.../session_01/serial.csv --chunk-rows 65536
+"""
+
+import os
+import sys
+import csv
+import time
+import argparse
+import warnings
+import itertools
+
+import numpy as np
+
+from .event_index import parse_event_line, parse_operation_row
+
+DEFAULT_CHUNK_ROWS = 65536
+# gsr_data.csv の ISO 形式の時刻（数値でない列）は読まない
+TEXT_COLUMNS = {'timestamp'}
+# ns の時刻は float64 では丸まるため int64 で読む
+INT_COLUMNS = {'pc_ns'}
+
+
+class Chunk:
+    """ファイルの連続した行。先頭の overlap 行は前のチャンクの末尾と同じ行"""
+    def __init__(self, path, start, overlap, columns):
+        self.path = path
+        # ファイル内での先頭行の番号（読めない行を除いた数え方）
+        self.start = start
+        self.overlap = overlap
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['t_ns'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @property
+    def t_ns(self):
+        return self.columns['t_ns']
+
+    @property
+    def new_rows(self):
+        """前のチャンクと重ならない行（結果を重複なく出力するときに使う）"""
+        return slice(self.overlap, None)
+
+
+def iter_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, overlap=0):
+    """ファイル名で形式を判断し、chunk_rows 行（最後は短い）のチャンクを overlap 行ずつ重ねて返す"""
+    if not 0 <= overlap < chunk_rows:
+        raise ValueError(f"overlap は 0 以上 chunk_rows ({chunk_rows}) 未満にしてください: {overlap}")
+    name = os.path.basename(path)
+    if name not in READERS:
+        raise ValueError(f"未対応のファイルです: {path}（{', '.join(READERS)} に対応）")
+    return _rechunk(path, READERS[name](path, chunk_rows - overlap), chunk_rows, overlap)
+
+
+def iter_session_chunks(session_dirs, name, chunk_rows=DEFAULT_CHUNK_ROWS, overlap=0):
+    """複数セッションの同じ名前のファイルを順に読む（ファイルの無いセッションは飛ばす）"""
+    for session_dir in session_dirs:
+        path = os.path.join(session_dir, name)
+        if os.path.exists(path):
+            yield from iter_chunks(path, chunk_rows, overlap)
+
+
+def _rechunk(path, batches, chunk_rows, overlap):
+    """読んだ行のまとまりを、chunk_rows 行ずつ overlap 行重ねたチャンクに並べ直す"""
+    pending, start, carried = None, 0, 0
+    for batch in batches:
+        pending = batch if pending is None else {k: np.concatenate((pending[k], batch[k])) for k in pending}
+        while len(pending['t_ns']) >= chunk_rows:
+            yield Chunk(path, start, carried, {k: v[:chunk_rows] for k, v in pending.items()})
+            step = chunk_rows - overlap
+            pending = {k: v[step:] for k, v in pending.items()}
+            start += step
+            carried = overlap
+    # 最後の短いチャンク（前のチャンクと重なる行しか無ければ返さない）
+    if pending is not None and len(pending['t_ns']) > carried:
+        yield Chunk(path, start, carried, pending)
+
+
+def _read_lines(f, batch_lines):
+    while True:
+        lines = list(itertools.islice(f, batch_lines))
+        if not lines:
+            return
+        yield lines
+
+
+def _read_numeric_csv(path, batch_lines, time_column, time_scale):
+    """数値の列を float64（INT_COLUMNS は int64）で読む。時刻列 × time_scale を t_ns にする"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        header = f.readline().strip().split(',')
+        names = [name for name in header if name not in TEXT_COLUMNS]
+        usecols = [header.index(name) for name in names]
+        for lines in _read_lines(f, batch_lines):
+            columns = _parse_numeric(lines, names, usecols, time_column)
+            if not len(columns[time_column]):
+                continue
+            if time_scale == 1:
+                columns['t_ns'] = columns[time_column]
+            else:
+                columns['t_ns'] = np.round(columns[time_column] * time_scale).astype(np.int64)
+            yield columns
+
+
+def _parse_numeric(lines, names, usecols, time_column):
+    dtype = [(name, np.int64 if name in INT_COLUMNS else np.float64) for name in names]
+    try:
+        data = np.loadtxt(lines, delimiter=',', usecols=usecols, dtype=dtype, ndmin=1)
+        return {name: data[name].copy() for name in names}
+    except ValueError:
+        pass
+    # 空欄（旧形式のGSR行の連番・Pico時刻）や書き込み途中の行がある場合は、遅いが欠損を NaN にして読む
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        data = np.genfromtxt(lines, delimiter=',', usecols=usecols, dtype=np.float64, invalid_raise=False)
+    data = data.reshape(-1, len(names))
+    data = data[~np.isnan(data[:, names.index(time_column)])]
+    columns = {name: data[:, i].copy() for i, name in enumerate(names)}
+    for name in INT_COLUMNS & set(names):
+        columns[name] = columns[name].astype(np.int64)
+    return columns
+
+
+def _read_serial(path, batch_lines):
+    return _read_numeric_csv(path, batch_lines, 'pc_ns', 1)
+
+
+def _read_gsr_data(path, batch_lines):
+    """recorder.py の gsr_data.csv（t_ns は elapsed_seconds を ns にしたもの）"""
+    return _read_numeric_csv(path, batch_lines, 'elapsed_seconds', 1e9)
+
+
+def _event_columns(events):
+    events = [event for event in events if event]
+    columns = {'t_ns': np.array([event[0] for event in events], dtype=np.int64),
+               'type': np.empty(len(events), dtype=object),
+               'data': np.empty(len(events), dtype=object)}
+    columns['type'][:] = [event[1] for event in events]
+    columns['data'][:] = [event[2] for event in events]
+    return columns
+
+
+def _read_events(path, batch_lines):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for lines in _read_lines(f, batch_lines):
+            yield _event_columns(parse_event_line(line) for line in lines)
+
+
+def _read_operations(path, batch_lines):
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for rows in _read_lines(reader, batch_lines):
+            yield _event_columns(parse_operation_row(row) for row in rows)
+
+
+# ファイル名 -> (ファイル, 1回に読む行数) から列の辞書を順に返す関数
+READERS = {
+    'serial.csv': _read_serial,
+    'gsr_data.csv': _read_gsr_data,
+    'events.jsonl': _read_events,
+    'operations.csv': _read_operations,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="セッションのファイルをチャンクで読み、チャンク数と読み込み速度を表示します")
+    parser.add_argument('path', help=f"読むファイル（{', '.join(READERS)}）")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument('--overlap', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    chunks = rows = 0
+    first_ms = None
+    for chunk in iter_chunks(args.path, args.chunk_rows, args.overlap):
+        if first_ms is None:
+            first_ms = (time.perf_counter() - started) * 1000
+        chunks += 1
+        rows += len(chunk) - chunk.overlap
+    elapsed = time.perf_counter() - started
+    print(f"{args.path}: {rows} 行, {chunks} チャンク, {elapsed:.2f} 秒"
+          f"（最初のチャンクまで {first_ms or 0:.0f} ms, {rows / max(elapsed, 1e-9):.0f} 行/秒）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+コピーしたセッションを meta/manifest.json と照合する
+
+記録時に各ファイルの sha256 を逐次計算して meta/manifest.json に残している（workers/integrity.py）。
+ここでは各ファイルを1回だけ読み、サイズとハッシュが記録時と一致するかを確認する。
+
+- hash_offset のあるエントリ（WAV）は、先頭 hash_offset バイトが head と一致するかを確認し、
+  sha256 はそれ以降について照合する
+- マニフェストの無いセッション（この機能より前の記録）は件数だけ報告する
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.analysis.verify_manifest /mnt/archive/data
+"""
+
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+
+from ..workers.integrity import MANIFEST_PATH
+
+CHUNK_BYTES = 1024 * 1024
+
+
+def verify_file(session_dir, entry):
+    """1ファイルを照合し、問題があれば理由の文字列を返す"""
+    path = os.path.join(session_dir, *entry['path'].split('/'))
+    if not os.path.exists(path):
+        return "ファイルがありません"
+    size = os.path.getsize(path)
+    if size != entry['bytes']:
+        return f"サイズが異なります（記録時 {entry['bytes']}、現在 {size}）"
+    digest = hashlib.sha256()
+    offset = entry.get('hash_offset', 0)
+    with open(path, 'rb') as f:
+        if offset:
+            head = f.read(offset)
+            if head.hex() != entry['head']:
+                return "ヘッダが異なります"
+        for chunk in iter(lambda: f.read(CHUNK_BYTES), b''):
+            digest.update(chunk)
+    if digest.hexdigest() != entry['sha256']:
+        return "sha256 が異なります"
+    return None
+
+
+def verify_session(session_dir):
+    """(照合したファイル数, [(パス, 理由), ...]) を返す。マニフェストが無ければ None"""
+    manifest_path = os.path.join(session_dir, MANIFEST_PATH)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('algorithm', 'sha256') != 'sha256':
+        return 0, [(MANIFEST_PATH, f"未対応のハッシュです: {manifest['algorithm']}")]
+    problems = []
+    for entry in manifest['files']:
+        reason = verify_file(session_dir, entry)
+        if reason:
+            problems.append((entry['path'], reason))
+    return len(manifest['files']), problems
+
+
+def find_sessions(root):
+    pattern = os.path.join(root, '**', 'session_*')
+    return sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isdir(p))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="コピーしたセッションを meta/manifest.json と照合します")
+    parser.add_argument('root', help="データディレクトリ（例: pc_app/data）またはセッションディレクトリ")
+    args = parser.parse_args(argv)
+
+    sessions = find_sessions(args.root)
+    if not sessions and os.path.exists(os.path.join(args.root, MANIFEST_PATH)):
+        sessions = [args.root]
+    verified = failed = missing = 0
+    for session_dir in sessions:
+        result = verify_session(session_dir)
+        if result is None:
+            missing += 1
+            continue
+        count, problems = result
+        if problems:
+            failed += 1
+            for path, reason in problems:
+                print(f"不一致: {session_dir}/{path}: {reason}")
+        else:
+            verified += 1
+            print(f"OK: {session_dir} ({count} ファイル)")
+    print(f"一致 {verified} セッション、不一致 {failed} セッション、マニフェスト無し {missing} セッション")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,483 @@
+"""
+GUIを使わない記録モード
+
+PicoWorker・カメラ録画・serial.csv / events.jsonl の書き出しを設定ファイルから組み立てて実行する。
+描画（A/Vプロット・GSRグラフ・プレビュー）を一切行わないため、長時間の無人記録や自動テストに使う。
+
+操作は GUI 版と同じ:
+- 録画の開始/停止: B2 短押し（F13 相当）
+- 終了: B1+B2 3秒長押し（F15 相当）
+- 制御ソケット（127.0.0.1 のみ）に1行1コマンドで送信: status / start / stop / toggle / marker / end
+  応答は1行の JSON
+
+使い方（pc_app/ で実行）:
+    python headless.py --config headless.json
+"""
+import sys
+import os
+import json
+import time
+import signal
+import logging
+import argparse
+from datetime import datetime
+from PySide6.QtCore import Qt, QCoreApplication, QObject, QTimer
+from PySide6.QtNetwork import QTcpServer, QHostAddress
+
+from workers.camera_worker import CameraWorker, CameraShutdown
+from workers.pico_worker import PicoWorker, SERIAL_CSV_COLUMNS, serial_csv_row
+from workers.preflight_worker import check_free_space
+from workers.metrics import metrics, MetricsSnapshotWriter
+from workers.integrity import HashingFile, SessionManifest
+from workers.preroll import PrerollBuffer, DEFAULT_PREROLL_SECONDS
+from workers.monitor_server import MonitorServer
+from analysis.catalog import index_session_in_background
+
+# 設定ファイルで省略した項目の既定値
+DEFAULT_CONFIG = {
+    'station': None,             # 複数ステーション運用時の名前（station_manager.py が設定）
+    'pid': 'PID001',
+    'serial_port': 'COM13',
+    'baud_rate': 9600,
+    'cameras': [],               # 録画するカメラ番号のリスト
+    'data_dir': 'data',
+    'log_dir': 'logs',
+    'keyboard_hooks': False,     # True で F13/F15 のキーボード入力も受け付ける
+    'control_host': '127.0.0.1',
+    'control_port': 8765,        # null で制御ソケットを使わない（0 は空きポートを自動選択）
+    'auto_record': False,        # 起動直後に録画を開始する
+    'max_record_seconds': 0,     # 0 より大きければ、この秒数で録画を自動停止する
+    'monitor_host': '127.0.0.1',
+    'monitor_port': None,        # 指定すると別室モニタ用の HTTP/WebSocket サーバーを開く
+    'cpu_affinity': None,        # このプロセス（以降に作るスレッドを含む）を割り当てるCPU番号のリスト
+    'face_roi': False,           # True で顔の周辺を切り出した映像（camera_N_face.mp4）を記録する
+    'full_frame_scale': 0.5,     # 顔ROI録画時の全体映像の縮小率（0 で全体映像を記録しない）
+    'preroll_seconds': DEFAULT_PREROLL_SECONDS,  # 録画開始の直前のこの秒数も記録する（0 で無効）
+}
+# モニタへ状態を渡す間隔（ミリ秒）
+MONITOR_STATUS_INTERVAL_MS = 1000
+# メトリクスを metrics.jsonl に書き出す間隔（ミリ秒）
+METRICS_SNAPSHOT_INTERVAL_MS = 5000
+# Ctrl+C を受け付けるためにPythonへ制御を戻す間隔（ミリ秒）
+SIGNAL_POLL_MS = 200
+
+logger = logging.getLogger("pc_app.headless")
+
+def load_config(path=None):
+    config = dict(DEFAULT_CONFIG)
+    if path:
+        with open(path, encoding='utf-8') as f:
+            user_config = json.load(f)
+        unknown = set(user_config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"不明な設定項目: {', '.join(sorted(unknown))}")
+        config.update(user_config)
+    return config
+
+def set_cpu_affinity(cores):
+    """
+    プロセスを指定したCPUに固定する。スレッドを作る前に呼ぶ（Linux では以降のスレッドが継承する）。
+    対応していない環境では警告のみ出して続行する。
+    """
+    try:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores)
+        elif sys.platform == 'win32':
+            import ctypes  # Windows のみ必要
+            kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+            kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+            kernel32.SetProcessAffinityMask.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            mask = sum(1 << core for core in cores)
+            if not kernel32.SetProcessAffinityMask(kernel32.GetCurrentProcess(), mask):
+                raise OSError(ctypes.get_last_error(), "SetProcessAffinityMask に失敗しました")
+        else:
+            print("警告: この環境ではCPUの割り当てに対応していません。")
+            return
+    except OSError as e:
+        print(f"警告: CPU {cores} への割り当てに失敗しました: {e}")
+        return
+    print(f"CPU {cores} に割り当てました。")
+
+class HeadlessRecorder(QObject):
+    """
+    GUI版 MainWindow の記録処理のみを持つコントローラー。
+    ワーカーのシグナルはメインスレッドのイベントループで受け取り、ファイルへ書き出す。
+    """
+    def __init__(self, config, monitor=None):
+        super().__init__()
+        self.config = config
+        self.monitor = monitor
+        self.session_dir = os.path.join(config['data_dir'],
+                                        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{config['pid']}")
+        self.recording_session_count = 0
+        self.current_recording_dir = None
+        self.is_recording = False
+        self.record_started_at = None
+        self.events_file = None
+        self.gsr_file = None
+        self.session_manifest = None
+        # 録画していない間の直近の serial.csv の行とイベント（録画開始時にファイルの先頭に書く）
+        self.serial_preroll = PrerollBuffer('serial', config['preroll_seconds'])
+        self.events_preroll = PrerollBuffer('events', config['preroll_seconds'])
+        self.active_camera_workers = []
+        # 録画停止中（カメラがファイルを閉じ終わるまで）の CameraShutdown と、その後に終了するかどうか
+        self.camera_shutdown = None
+        self.quit_after_shutdown = False
+        self.current_av = (0.0, 0.0)
+        self.current_online5 = 3
+        self.last_gsr = None
+        self.started_at = time.monotonic()
+
+        self.m_serial_bytes = metrics.counter('writer.serial.bytes')
+        self.m_events_bytes = metrics.counter('writer.events.bytes')
+        self.m_gsr_samples = metrics.counter('headless.gsr_samples')
+
+        self.pico_worker = PicoWorker(serial_port=config['serial_port'], baud_rate=config['baud_rate'],
+                                      use_keyboard_hooks=config['keyboard_hooks'])
+        self.pico_worker.gsr_sample.connect(self.handle_gsr_sample)
+        self.pico_worker.av_changed.connect(self.handle_av_change)
+        self.pico_worker.online5_changed.connect(self.handle_online5_change)
+        self.pico_worker.record_toggled.connect(self.toggle_recording)
+        self.pico_worker.session_ended.connect(self.end_session)
+        self.pico_worker.morph_marker_received.connect(self.log_morph_marker)
+        self.pico_worker.button_changed.connect(self.log_button_change)
+        self.pico_worker.error.connect(self.report_error)
+        self.pico_worker.connection_changed.connect(self.handle_pico_connection)
+        if monitor:
+            # ワーカーのスレッドから値を置くだけなので、記録処理のイベントループを経由しない
+            self.pico_worker.new_gsr_data.connect(monitor.publish_gsr, Qt.DirectConnection)
+            self.pico_worker.av_changed.connect(monitor.publish_av, Qt.DirectConnection)
+            self.pico_worker.online5_changed.connect(monitor.publish_online5, Qt.DirectConnection)
+            monitor.error.connect(self.report_error)
+            self.monitor_timer = QTimer(self)
+            self.monitor_timer.timeout.connect(self.publish_monitor_status)
+            self.monitor_timer.start(MONITOR_STATUS_INTERVAL_MS)
+
+        # 録画の自動停止
+        self.record_limit_timer = QTimer(self)
+        self.record_limit_timer.setSingleShot(True)
+        self.record_limit_timer.timeout.connect(self.stop_recording)
+
+        os.makedirs(config['log_dir'], exist_ok=True)
+        self.metrics_writer = MetricsSnapshotWriter(os.path.join(config['log_dir'], "metrics.jsonl"), metrics)
+        self.metrics_timer = QTimer(self)
+        self.metrics_timer.timeout.connect(self.write_metrics_snapshot)
+        self.metrics_timer.start(METRICS_SNAPSHOT_INTERVAL_MS)
+
+    def start(self):
+        os.makedirs(self.session_dir, exist_ok=True)
+        print(f"セッションディレクトリ: {self.session_dir}")
+        self.pico_worker.start()
+        if self.monitor:
+            self.monitor.start()
+        # 録画開始を待たせないよう、カメラを今開いて待機状態にしておく
+        for cam_index in self.config['cameras']:
+            self.arm_camera(int(cam_index))
+        if self.config['auto_record']:
+            self.start_recording()
+
+    # --- 録画 ---
+    def arm_camera(self, cam_index):
+        """カメラを開いて設定し、フレームを読み続ける待機状態にする（録画開始はフラグを立てるだけになる）"""
+        self.active_camera_workers = [w for w in self.active_camera_workers if w.camera_index != cam_index]
+        worker = CameraWorker(cam_index,
+                              thumbnail_interval=self.monitor.thumbnail_interval if self.monitor else 0,
+                              face_roi=self.config['face_roi'], full_frame_scale=self.config['full_frame_scale'],
+                              preroll_seconds=self.config['preroll_seconds'])
+        worker.error.connect(self.report_error)
+        worker.recording_started.connect(self.handle_camera_record_start)
+        if self.monitor:
+            worker.thumbnail_ready.connect(self.monitor.publish_thumbnail, Qt.DirectConnection)
+        self.active_camera_workers.append(worker)
+        worker.start()
+        return worker
+
+    def camera_worker_for(self, cam_index):
+        """待機中（スレッドが動いている）のカメラのワーカー。無ければ None"""
+        for worker in self.active_camera_workers:
+            if worker.camera_index == cam_index and worker.isRunning():
+                return worker
+        return None
+
+    def toggle_recording(self):
+        if self.is_recording:
+            return self.stop_recording()
+        return self.start_recording()
+
+    def start_recording(self):
+        """録画を開始する。開始できなければエラーメッセージ、開始したら None を返す"""
+        if self.is_recording:
+            return "録画中です。"
+        if self.camera_shutdown:
+            return "前の録画を保存中です。"
+        # 空き容量が閾値を下回る場合は録画を開始しない
+        message = check_free_space(self.session_dir)
+        if message:
+            self.report_error(message)
+            return message
+        self.recording_session_count += 1
+        self.current_recording_dir = os.path.join(self.session_dir, f"session_{self.recording_session_count:02d}")
+        os.makedirs(os.path.join(self.current_recording_dir, 'video'), exist_ok=True)
+        print(f"録画開始: セッション {self.recording_session_count}: {self.current_recording_dir}")
+
+        # 各ファイルは書き込みながらハッシュを計算し、停止時に meta/manifest.json にまとめる
+        self.session_manifest = SessionManifest(self.current_recording_dir)
+        self.events_file = HashingFile(os.path.join(self.current_recording_dir, 'events.jsonl'))
+        self.gsr_file = HashingFile(os.path.join(self.current_recording_dir, 'serial.csv'))
+        self.gsr_file.write(SERIAL_CSV_COLUMNS + "\n")
+        # 録画開始の直前の数秒（プリロール）を先頭に書く（pc_ns は受信時刻のまま）
+        for _, line in self.serial_preroll.drain():
+            self.gsr_file.write(line)
+        for _, line in self.events_preroll.drain():
+            self.events_file.write(line)
+        self.is_recording = True
+        self.record_started_at = time.monotonic()
+        self.log_event('record_start', {'session_number': self.recording_session_count, 'headless': True,
+                                       'face_roi': self.config['face_roi'],
+                                       'preroll_seconds': self.config['preroll_seconds']})
+
+        # 待機中のカメラは次のフレームから書き込む（外れていたカメラはここで開き直す）
+        for cam_index in self.config['cameras']:
+            save_path = os.path.join(self.current_recording_dir, f"video/camera_{cam_index}.mp4")
+            worker = self.camera_worker_for(int(cam_index)) or self.arm_camera(int(cam_index))
+            worker.start_recording(save_path)
+        if self.config['max_record_seconds'] > 0:
+            self.record_limit_timer.start(int(self.config['max_record_seconds'] * 1000))
+        return None
+
+    def stop_recording(self):
+        if not self.is_recording:
+            return "録画していません。"
+        print(f"録画停止: セッション {self.recording_session_count} 完了")
+        self.record_limit_timer.stop()
+        self.log_event('record_stop', {'session_number': self.recording_session_count})
+        self.is_recording = False
+        self.events_file.close()
+        self.gsr_file.close()
+        self.session_manifest.add(self.events_file.entry(rows=self.events_file.lines))
+        self.session_manifest.add(self.gsr_file.entry(rows=self.gsr_file.lines - 1))
+        self.events_file = self.gsr_file = None
+        # 動画は各カメラのスレッドで並列に閉じ、全カメラの完了後にマニフェストを書き出す（カメラは待機状態に残す）
+        self.camera_shutdown = CameraShutdown(self.active_camera_workers, disarm=False, parent=self)
+        self.camera_shutdown.camera_stopped.connect(self.handle_camera_stopped)
+        self.camera_shutdown.all_stopped.connect(self.finish_record_stop)
+        self.camera_shutdown.start()
+        return None
+
+    def handle_camera_stopped(self, camera_index, seconds, state):
+        print(f"カメラ {camera_index} の停止: {state}（{seconds:.2f}s）")
+        if state != 'ok':
+            self.report_error(f"カメラ {camera_index} の録画が正常に終了しませんでした（{state}）。")
+
+    def finish_record_stop(self, results):
+        shutdown, self.camera_shutdown = self.camera_shutdown, None
+        for worker in shutdown.workers:
+            self.session_manifest.add_all(worker.manifest_entries)
+        # 強制的に止めたカメラは待機から外す（次の録画開始時に開き直す）
+        stopped = [r['camera'] for r in results if r['state'] != 'ok']
+        self.active_camera_workers = [w for w in self.active_camera_workers if w.camera_index not in stopped]
+        slowest = max((r['seconds'] for r in results), default=0.0)
+        metrics.gauge('record.stop_ms').set(slowest * 1000)
+        self.session_manifest.write()
+        # セッションカタログに登録
+        index_session_in_background(self.current_recording_dir)
+        if self.quit_after_shutdown:
+            self.disarm_cameras_and_quit()
+
+    def disarm_cameras_and_quit(self):
+        """待機中のカメラを並列に閉じてから終了する"""
+        shutdown = CameraShutdown(self.active_camera_workers, disarm=True, parent=self)
+        self.active_camera_workers = []
+        shutdown.all_stopped.connect(lambda results: QCoreApplication.quit())
+        shutdown.start()
+
+    def end_session(self):
+        print("セッション終了信号を受信しました。")
+        if self.quit_after_shutdown:
+            return  # 終了処理中
+        self.stop_recording()
+        self.pico_worker.stop()
+        if self.monitor:
+            self.monitor.stop()
+        self.write_metrics_snapshot()
+        # カメラがファイルを閉じ終わってから終了する
+        self.quit_after_shutdown = True
+        if not self.camera_shutdown:
+            self.disarm_cameras_and_quit()
+
+    # --- 記録 ---
+    def handle_gsr_sample(self, gsr_value, idx, pico_ms, pc_ns):
+        self.last_gsr = gsr_value
+        self.m_gsr_samples.inc()
+        line = serial_csv_row(gsr_value, idx, pico_ms, pc_ns, *self.current_av, self.current_online5)
+        if not self.is_recording:
+            self.serial_preroll.append(pc_ns, line, len(line))
+            return
+        self.gsr_file.write(line)
+        self.m_serial_bytes.inc(len(line))
+
+    def handle_av_change(self, arousal, valence):
+        self.current_av = (arousal, valence)
+        self.log_event('av_change', {'arousal': arousal, 'valence': valence})
+
+    def handle_online5_change(self, value):
+        self.current_online5 = value
+        self.log_event('online5_change', {'value': value})
+
+    def log_morph_marker(self):
+        self.log_event('morph_awareness_marker', {})
+
+    def log_button_change(self, name, pressed, pico_ms, pc_ns):
+        self.log_event('button', {'button': name, 'pressed': pressed, 'pico_ms': pico_ms}, pc_ns=pc_ns)
+
+    def handle_camera_record_start(self, camera, pc_ns, preroll_start_ns, preroll_frames):
+        # プリロールのフレームは record_start より前の時刻のため、イベントの時刻ではなくデータに記録する
+        data = {'camera': camera}
+        if preroll_frames:
+            data.update(preroll_start_ns=preroll_start_ns, preroll_frames=preroll_frames)
+        self.log_event('camera_record_start', data, pc_ns=pc_ns)
+
+    def log_event(self, event_type, data, pc_ns=None):
+        event_data = {
+            'pc_ns': pc_ns if pc_ns is not None else time.perf_counter_ns(),
+            'type': event_type,
+            'data': data
+        }
+        line = json.dumps(event_data) + '\n'
+        if not self.is_recording or not self.events_file:
+            self.events_preroll.append(event_data['pc_ns'], line, len(line))
+            return
+        self.events_file.write(line)
+        self.m_events_bytes.inc(len(line))
+
+    def handle_pico_connection(self, connected):
+        if not connected:
+            logger.warning("Pico が切断されました。再接続を試みます。")
+
+    def report_error(self, message):
+        print(f"エラー: {message}")
+        logger.error(message)
+
+    def write_metrics_snapshot(self):
+        try:
+            self.metrics_writer.write()
+        except OSError as e:
+            logger.warning("メトリクスの書き出しに失敗しました: %s", e)
+
+    def publish_monitor_status(self):
+        self.monitor.publish_recording(self.is_recording)
+        self.monitor.publish_status(self.status())
+
+    def status(self):
+        arousal, valence = self.current_av
+        return {
+            'station': self.config['station'],
+            'pid': self.config['pid'],
+            'session_dir': self.session_dir,
+            'recording': self.is_recording,
+            'saving': self.camera_shutdown is not None,
+            'session_number': self.recording_session_count,
+            'recording_dir': self.current_recording_dir if self.is_recording else None,
+            'record_seconds': time.monotonic() - self.record_started_at if self.is_recording else 0.0,
+            'uptime_s': time.monotonic() - self.started_at,
+            'pico_connected': bool(self.pico_worker.ser and self.pico_worker.ser.is_open),
+            'gsr': self.last_gsr,
+            'arousal': arousal,
+            'valence': valence,
+            'online5': self.current_online5,
+            'cameras': [w.camera_index for w in self.active_camera_workers if w.isRunning()],
+            'preroll_bytes': (self.serial_preroll.bytes + self.events_preroll.bytes
+                              + sum(w.preroll.bytes for w in self.active_camera_workers)),
+        }
+
+class ControlServer(QObject):
+    """
+    ローカルの制御ソケット。1行1コマンドを受け取り、1行の JSON で応答する。
+    メインスレッドのイベントループで処理するため、記録処理との排他は不要。
+    """
+    def __init__(self, recorder, host, port):
+        super().__init__()
+        self.recorder = recorder
+        self.commands = {
+            'status': lambda: None,
+            'start': recorder.start_recording,
+            'stop': recorder.stop_recording,
+            'toggle': recorder.toggle_recording,
+            'marker': recorder.log_morph_marker,
+            'end': lambda: QTimer.singleShot(0, recorder.end_session),
+        }
+        self.server = QTcpServer(self)
+        self.server.newConnection.connect(self.accept)
+        if not self.server.listen(QHostAddress(host), port):
+            raise OSError(f"制御ソケット {host}:{port} を開けませんでした: {self.server.errorString()}")
+        self.port = self.server.serverPort()
+        print(f"制御ソケット: {host}:{self.port}")
+
+    def accept(self):
+        while self.server.hasPendingConnections():
+            client = self.server.nextPendingConnection()
+            client.readyRead.connect(lambda c=client: self.handle_client(c))
+            client.disconnected.connect(client.deleteLater)
+
+    def handle_client(self, client):
+        while client.canReadLine():
+            command = bytes(client.readLine()).decode('utf-8', errors='replace').strip().lower()
+            if not command:
+                continue
+            action = self.commands.get(command)
+            if action is None:
+                reply = {'ok': False, 'error': f"不明なコマンド: {command}"}
+            else:
+                error = action()
+                reply = {'ok': error is None}
+                if error:
+                    reply['error'] = error
+                reply['status'] = self.recorder.status()
+            client.write((json.dumps(reply, ensure_ascii=False) + '\n').encode('utf-8'))
+
+def setup_logging(log_dir):
+    os.makedirs(log_dir, exist_ok=True)
+    logging.basicConfig(
+        filename=os.path.join(log_dir, "headless.log"),
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        encoding="utf-8",
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GUIなしで記録します")
+    parser.add_argument('--config', help="設定ファイル（JSON）")
+    parser.add_argument('--serial-port', help="設定ファイルの serial_port を上書き")
+    parser.add_argument('--control-port', type=int, help="設定ファイルの control_port を上書き")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    if args.serial_port:
+        config['serial_port'] = args.serial_port
+    if args.control_port is not None:
+        config['control_port'] = args.control_port
+    setup_logging(config['log_dir'])
+    if config['cpu_affinity']:
+        set_cpu_affinity(config['cpu_affinity'])
+
+    app = QCoreApplication(sys.argv[:1])
+    monitor = None
+    if config['monitor_port'] is not None:
+        monitor = MonitorServer(config['monitor_host'], config['monitor_port'])
+    recorder = HeadlessRecorder(config, monitor)
+    server = None
+    if config['control_port'] is not None:
+        server = ControlServer(recorder, config['control_host'], config['control_port'])
+
+    # Ctrl+C / SIGTERM でも録画中のファイルを閉じてから終了する
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: QTimer.singleShot(0, recorder.end_session))
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(SIGNAL_POLL_MS)
+
+    QTimer.singleShot(0, recorder.start)
+    return app.exec()
+
+if __name__ == "__main__":
+    sys.exit(main())
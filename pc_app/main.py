@@ -1,43 +1,157 @@
+import time
+# 起動時間の計測起点（重いモジュールを読み込む前）
+STARTUP_T0 = time.perf_counter()
+
 import sys
 import os
-import cv2
-import time
 import json
-import subprocess
+import shutil
+import logging
+import argparse
+import importlib
+import threading
 from datetime import datetime
-from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGraphicsView, QGraphicsScene, QGraphicsEllipseItem, QStackedWidget, QPushButton, QGroupBox, QCheckBox, QMessageBox, QComboBox)
+from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QGraphicsView, QGraphicsScene, QGraphicsEllipseItem, QStackedWidget, QPushButton, QGroupBox, QCheckBox, QMessageBox, QComboBox, QSlider, QSpinBox)
 from PySide6.QtCore import Qt, QPointF, QThread, Signal, QTimer
 from PySide6.QtGui import QBrush, QPen, QColor, QPainter, QPixmap, QImage
-import pyqtgraph as pg
 
 # --- ワーカーのインポート ---
-from workers.camera_worker import CameraWorker
-from workers.pico_worker import PicoWorker
+# OpenCV・pyqtgraph・NumPy・asyncio を使うもの（刺激プレイヤー・音声録音・再生・モニタ配信）は初回使用時に load_module で読み込む
+from workers.camera_worker import (CameraWorker, CameraShutdown, CAMERA_WIDTH, CAMERA_HEIGHT, FACE_ROI_SIZE,
+                                   ROI_FULL_FRAME_SCALE, CAMERA_STOP_TIMEOUT_S, CAMERA_FORCE_RELEASE_GRACE_S)
+from workers.pico_worker import PicoWorker, SERIAL_CSV_COLUMNS, serial_csv_row
+from workers.preflight_worker import (PreflightWorker, estimate_requirements, evaluate, check_free_space,
+                                     face_roi_pixel_ratio)
+from workers.latency import input_latency
+from workers.integrity import HashingFile, SessionManifest
+from workers.preroll import PrerollBuffer, DEFAULT_PREROLL_SECONDS
+from workers.metrics import metrics, compute_rates, MetricsSnapshotWriter
+from analysis.catalog import index_session_in_background
+
+STARTUP_IMPORTS_DONE = time.perf_counter()
 
 # --- 定数 ---
 AROUSAL_VALENCE_MAX = 2.5
 AV_PLOT_SIZE = 400
+# A/V 表示の軌跡（点の数・点の大きさ・最新点の不透明度）
+AV_TRAIL_LENGTH = 32
+AV_TRAIL_DOT_SIZE = 8
+AV_TRAIL_MAX_OPACITY = 0.6
+# 画面のリフレッシュレートが取得できない場合の A/V 表示の更新間隔（ミリ秒）
+DEFAULT_FRAME_INTERVAL_MS = 16
+# 刺激クリップの設定ファイル（clip_id, path, scene, ab のリスト）
+STIMULI_CONFIG_PATH = "assets/config.json"
+# 記録データの保存先
+DATA_DIR = "data"
+# 録画中のカメラのフレームプール（スロット数）と、プレビューへ渡す間隔（秒）
+FRAME_POOL_SLOTS = 6
+SHARED_PREVIEW_INTERVAL_S = 1 / 15
+# 容量見積もりに使う予定実験時間の初期値（分）
+PLANNED_SESSION_MINUTES = 60
+# アプリケーションログ
+LOG_DIR = "logs"
+# 入力遅延の集計をログに書き出す間隔（ミリ秒）
+LATENCY_LOG_INTERVAL_MS = 30000
+# メトリクスを logs/metrics.jsonl に書き出す間隔（ミリ秒）
+METRICS_SNAPSHOT_INTERVAL_MS = 5000
+# GUIイベントループの遅れを測るタイマー間隔（ミリ秒）
+GUI_LAG_PROBE_MS = 100
+# 起動からメインウィンドウ表示までの目標時間（ミリ秒）
+STARTUP_TARGET_MS = 1000
+# ウィンドウ表示後にバックグラウンドで先読みするモジュール（初回のカメラ検出・プレビューを待たせない）
+PRELOAD_MODULES = ['cv2']
+
+logger = logging.getLogger("pc_app")
+
+def load_module(name):
+    """重いモジュールを初回使用時に読み込み、所要時間をログに残す"""
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        logger.info("遅延読み込み: %s (%.0f ms)", name, (time.perf_counter() - start) * 1000)
+    return module
 
 # --- 2D評価空間プロット用ウィジェット (変更なし) ---
 class AVPlot(QGraphicsView):
+    """
+    評価点の表示。軸は背景としてキャッシュし、点が動いた領域だけを再描画する。
+    軌跡を有効にすると、直近 AV_TRAIL_LENGTH 点を古いほど薄く表示する（項目は最初に確保して使い回す）。
+    """
     def __init__(self):
         super().__init__()
         self.scene = QGraphicsScene()
         self.setScene(self.scene)
         self.setRenderHint(QPainter.Antialiasing)
+        self.setCacheMode(QGraphicsView.CacheBackground)
+        self.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
         self.scene.setSceneRect(-AV_PLOT_SIZE/2, -AV_PLOT_SIZE/2, AV_PLOT_SIZE, AV_PLOT_SIZE)
-        self.scene.addLine(-AV_PLOT_SIZE/2, 0, AV_PLOT_SIZE/2, 0, QPen(Qt.white))
-        self.scene.addLine(0, -AV_PLOT_SIZE/2, 0, AV_PLOT_SIZE/2, QPen(Qt.white))
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
+
+        # 軌跡（リングバッファ。表示位置と不透明度の更新のみで新しい項目は作らない）
+        self.trail_enabled = False
+        self.trail = []
+        for _ in range(AV_TRAIL_LENGTH):
+            item = QGraphicsEllipseItem(0, 0, AV_TRAIL_DOT_SIZE, AV_TRAIL_DOT_SIZE)
+            item.setBrush(QBrush(Qt.red))
+            item.setPen(QPen(Qt.NoPen))
+            item.setVisible(False)
+            self.scene.addItem(item)
+            self.trail.append(item)
+        self._trail_head = 0
+        self._trail_count = 0
+
         self.dot = QGraphicsEllipseItem(0, 0, 20, 20)
         self.dot.setBrush(QBrush(Qt.red))
+        self.dot.setZValue(1)
+        self.dot.setCacheMode(QGraphicsEllipseItem.DeviceCoordinateCache)
         self.scene.addItem(self.dot)
+        self._position = None
         self.update_dot_position(0, 0)
 
+    def drawBackground(self, painter, rect):
+        # CacheBackground により、表示サイズが変わるまで1回だけ描画される
+        super().drawBackground(painter, rect)
+        painter.setPen(QPen(Qt.white))
+        painter.drawLine(QPointF(-AV_PLOT_SIZE/2, 0), QPointF(AV_PLOT_SIZE/2, 0))
+        painter.drawLine(QPointF(0, -AV_PLOT_SIZE/2), QPointF(0, AV_PLOT_SIZE/2))
+
     def update_dot_position(self, arousal, valence):
         x = (valence / AROUSAL_VALENCE_MAX) * (AV_PLOT_SIZE / 2)
         y = (-arousal / AROUSAL_VALENCE_MAX) * (AV_PLOT_SIZE / 2)
+        changed = (x, y) != self._position
+        # 端（±最大値）でのレバー操作など点が動かない入力は再描画されないため、遅延の計測から除く
+        input_latency.displayed(changed)
+        if not changed:
+            return
+        if self.trail_enabled and self._position is not None:
+            self.push_trail(*self._position)
+        self._position = (x, y)
         self.dot.setPos(x - 10, y - 10)
 
+    def push_trail(self, x, y):
+        """直前の位置を軌跡に加え、古いものほど薄くする"""
+        offset = AV_TRAIL_DOT_SIZE / 2
+        self.trail[self._trail_head].setPos(x - offset, y - offset)
+        self._trail_head = (self._trail_head + 1) % AV_TRAIL_LENGTH
+        self._trail_count = min(self._trail_count + 1, AV_TRAIL_LENGTH)
+        for age in range(self._trail_count):
+            item = self.trail[(self._trail_head - 1 - age) % AV_TRAIL_LENGTH]
+            item.setOpacity(AV_TRAIL_MAX_OPACITY * (1 - age / AV_TRAIL_LENGTH))
+            item.setVisible(True)
+
+    def set_trail_enabled(self, enabled):
+        self.trail_enabled = enabled
+        if not enabled:
+            for item in self.trail:
+                item.setVisible(False)
+            self._trail_count = 0
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        # 描画完了時刻を入力遅延の終点として記録
+        input_latency.painted()
+
 # --- GSRプロット用ウィジェット ---
 class GSRWidget(QWidget):
     def __init__(self):
@@ -45,15 +159,11 @@ class GSRWidget(QWidget):
         layout = QVBoxLayout()
         self.setLayout(layout)
         
-        # GSRグラフ
-        self.graphWidget = pg.PlotWidget()
-        self.graphWidget.setLabel('left', 'GSR Value')
-        self.graphWidget.setLabel('bottom', 'Time')
+        # GSRグラフ（pyqtgraph は実験画面を最初に表示する時に読み込む）
+        self.graphWidget = None
+        self.data_line = None
         self.x = list(range(300))
         self.y = [0] * 300
-        self.graphWidget.setBackground('k')
-        self.pen = pg.mkPen(color=(0, 255, 0))
-        self.data_line = self.graphWidget.plot(self.x, self.y, pen=self.pen)
         
         # 現在の値表示
         self.current_value_label = QLabel("GSR: 0")
@@ -61,14 +171,107 @@ class GSRWidget(QWidget):
         
         layout.addWidget(QLabel("GSR リアルタイム表示"))
         layout.addWidget(self.current_value_label)
-        layout.addWidget(self.graphWidget)
+
+    def showEvent(self, event):
+        if self.graphWidget is None:
+            pg = load_module('pyqtgraph')
+            self.graphWidget = pg.PlotWidget()
+            self.graphWidget.setLabel('left', 'GSR Value')
+            self.graphWidget.setLabel('bottom', 'Time')
+            self.graphWidget.setBackground('k')
+            self.pen = pg.mkPen(color=(0, 255, 0))
+            self.data_line = self.graphWidget.plot(self.x, self.y, pen=self.pen)
+            self.layout().addWidget(self.graphWidget)
+        super().showEvent(event)
 
     def update_plot(self, new_value):
         self.x = self.x[1:] + [self.x[-1] + 1]
         self.y = self.y[1:] + [new_value]
-        self.data_line.setData(self.x, self.y)
+        if self.data_line:
+            self.data_line.setData(self.x, self.y)
         self.current_value_label.setText(f"GSR: {new_value}")
 
+    def set_history(self, values):
+        """シーク後などに表示中の波形を values（古い順）で置き換える"""
+        values = list(values)[-len(self.y):]
+        self.y = [0] * (len(self.y) - len(values)) + values
+        if self.data_line:
+            self.data_line.setData(self.x, self.y)
+        if values:
+            self.current_value_label.setText(f"GSR: {values[-1]}")
+
+# --- 刺激呈示用ウィジェット（参加者用ウィンドウ） ---
+class StimulusView(QLabel):
+    """
+    StimuliPlayerのフレームを表示する。各クリップの最初のフレームは同期的に描画し、
+    描画完了時刻を clip_start の時刻として通知する（誤差は最大1表示フレーム）。
+    """
+    # (clip_id, 最初のフレームの描画完了時刻 pc_ns)
+    clip_presented = Signal(str, "qint64")
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("刺激呈示")
+        self.setStyleSheet("background-color: black;")
+        self.setAlignment(Qt.AlignCenter)
+        self.setMinimumSize(640, 360)
+        self.last_presented_ns = 0
+
+    def show_frame(self, image, clip_id, frame_idx):
+        self.setPixmap(QPixmap.fromImage(image).scaled(self.size(), Qt.KeepAspectRatio))
+        if frame_idx == 0:
+            # update() ではなく repaint() で即座に描画し、その完了時刻を記録する
+            self.repaint()
+            self.last_presented_ns = time.perf_counter_ns()
+            self.clip_presented.emit(clip_id, self.last_presented_ns)
+        else:
+            self.last_presented_ns = time.perf_counter_ns()
+
+    def blackout(self):
+        self.clear()
+
+# --- テレメトリ表示用ウィジェット ---
+class TelemetryPanel(QWidget):
+    """ワーカーのメトリクスを1秒ごとに表示する"""
+    def __init__(self):
+        super().__init__()
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+        self.text_label = QLabel("テレメトリ: 取得中")
+        self.text_label.setStyleSheet("font-size: 10px; font-family: monospace;")
+        self.text_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        layout.addWidget(QLabel("テレメトリ"))
+        layout.addWidget(self.text_label)
+        self._previous = None
+
+    def refresh(self):
+        snapshot = metrics.snapshot()
+        rates = compute_rates(self._previous, snapshot)
+        self._previous = snapshot
+        counters = snapshot['counters']
+        gauges = snapshot['gauges']
+        histograms = snapshot['histograms']
+
+        lines = [
+            f"Pico: {rates.get('pico.gsr_samples', 0):.1f} サンプル/s, "
+            f"解析エラー {counters.get('pico.parse_errors', 0)}, 欠落 {counters.get('pico.seq_gaps', 0)}",
+        ]
+        for name in sorted(gauges):
+            if name.startswith('camera.') and name.endswith('.fps'):
+                prefix = name[:-len('.fps')]
+                encode = histograms.get(f"{prefix}.encode_ms", {})
+                lines.append(
+                    f"{prefix}: {gauges[name]:.1f} fps, ドロップ {counters.get(f'{prefix}.dropped', 0)}, "
+                    f"エンコード p95 {encode.get('p95', float('nan')):.1f} ms, "
+                    f"{gauges.get(f'{prefix}.file_bytes', 0) / 1e6:.1f} MB")
+        lines.append(
+            f"書き込み: serial {rates.get('writer.serial.bytes', 0) / 1e3:.1f} kB/s, "
+            f"events {rates.get('writer.events.bytes', 0) / 1e3:.1f} kB/s, "
+            f"audio {rates.get('audio.bytes', 0) / 1e3:.1f} kB/s (バッファ {gauges.get('audio.ring_frames', 0):.0f})")
+        lag = histograms.get('gui.loop_lag_ms', {})
+        lines.append(f"GUIループ遅れ: p95 {lag.get('p95', float('nan')):.1f} ms, 最大 {lag.get('max', float('nan')):.1f} ms")
+        self.text_label.setText("\n".join(lines))
+
 # --- コントロールパネル用ウィジェット ---
 class ControlPanel(QWidget):
     def __init__(self):
@@ -103,6 +306,42 @@ class ControlPanel(QWidget):
         layout.addWidget(self.status_label)
         layout.addWidget(self.av_values_label)
         layout.addWidget(self.recording_label)
+
+        # Pico の接続状態（切断中は自動で再接続する）
+        self.pico_label = QLabel("Pico: 未接続")
+        self.pico_label.setStyleSheet("font-size: 12px;")
+        layout.addWidget(self.pico_label)
+
+        # オンライン興奮度（5段階）
+        self.online5_label = QLabel("興奮度: 3")
+        self.online5_label.setStyleSheet("font-size: 20px; font-weight: bold;")
+        layout.addWidget(self.online5_label)
+
+        # A/V 表示の軌跡
+        self.trail_checkbox = QCheckBox("A/Vの軌跡を表示")
+        layout.addWidget(self.trail_checkbox)
+
+        # 入力遅延（レバー → 画面上の点）
+        self.latency_label = QLabel("入力遅延: 計測待ち")
+        self.latency_label.setStyleSheet("font-size: 10px; font-family: monospace;")
+        layout.addWidget(self.latency_label)
+
+        # 刺激クリップ
+        self.clip_label = QLabel("クリップ: なし")
+        self.clip_label.setStyleSheet("font-size: 12px;")
+        self.play_clip_button = QPushButton("次のクリップを再生")
+        self.play_clip_button.setEnabled(False)
+        layout.addWidget(self.clip_label)
+        layout.addWidget(self.play_clip_button)
+
+        # RTA音声録音（録画中のみ）
+        self.rta_button = QPushButton("RTA録音開始")
+        self.rta_button.setEnabled(False)
+        self.rta_label = QLabel("音声: 停止中")
+        self.rta_label.setStyleSheet("font-size: 12px;")
+        layout.addWidget(self.rta_button)
+        layout.addWidget(self.rta_label)
+
         layout.addWidget(key_help)
         layout.addStretch()
 
@@ -112,6 +351,9 @@ class ControlPanel(QWidget):
     def update_av_values(self, arousal, valence):
         self.av_values_label.setText(f"Arousal: {arousal:.1f}, Valence: {valence:.1f}")
     
+    def update_online5(self, value):
+        self.online5_label.setText(f"興奮度: {value}")
+
     def update_recording_status(self, is_recording):
         if is_recording:
             self.recording_label.setText("録画: 実行中")
@@ -120,9 +362,89 @@ class ControlPanel(QWidget):
             self.recording_label.setText("録画: 停止中")
             self.recording_label.setStyleSheet("font-size: 14px; font-weight: bold; color: red;")
 
+    def update_pico_status(self, connected):
+        if connected:
+            self.pico_label.setText("Pico: 接続中")
+            self.pico_label.setStyleSheet("font-size: 12px; color: green;")
+        else:
+            self.pico_label.setText("Pico: 切断（再接続中...）")
+            self.pico_label.setStyleSheet("font-size: 12px; font-weight: bold; color: red;")
+
+    def update_rta_status(self, is_recording, level=0.0):
+        self.rta_button.setText("RTA録音停止" if is_recording else "RTA録音開始")
+        if is_recording:
+            self.rta_label.setText(f"音声: 録音中 (レベル {level:.2f})")
+        else:
+            self.rta_label.setText("音声: 停止中")
+
+    def update_latency(self, summary):
+        lines = []
+        for name in ('firmware→paint', 'arrival→paint'):
+            stats = summary.get(name)
+            if stats:
+                lines.append(f"{name}: p50 {stats['p50']:.1f} / p95 {stats['p95']:.1f} / "
+                             f"p99 {stats['p99']:.1f} ms (n={stats['n']})")
+        self.latency_label.setText("入力遅延\n" + "\n".join(lines) if lines else "入力遅延: 計測待ち")
+
+    def update_clip_status(self, text, can_play):
+        self.clip_label.setText(f"クリップ: {text}")
+        self.play_clip_button.setEnabled(can_play)
+
+# --- 記録済みセッションの再生操作 ---
+class ReplayControls(QWidget):
+    """再生/一時停止・速度・シークバー。スライダー操作中は再生位置の更新で動かさない"""
+    SPEEDS = [0.5, 1.0, 2.0, 4.0, 8.0, 16.0]
+
+    def __init__(self, replay_worker):
+        super().__init__()
+        self.replay_worker = replay_worker
+        self.playing = True
+        layout = QHBoxLayout()
+        self.setLayout(layout)
+
+        self.play_button = QPushButton("一時停止")
+        self.play_button.clicked.connect(self.toggle_play)
+        self.speed_combo = QComboBox()
+        self.speed_combo.addItems([f"{speed:g}x" for speed in self.SPEEDS])
+        self.speed_combo.setCurrentText(f"{replay_worker.speed:g}x")
+        self.speed_combo.currentTextChanged.connect(lambda text: replay_worker.set_speed(float(text[:-1])))
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.setRange(int(replay_worker.start_ms), int(replay_worker.duration_ms))
+        self.slider.sliderReleased.connect(lambda: replay_worker.seek(self.slider.value()))
+        self.time_label = QLabel()
+        self.duration_text = self.format_ms(replay_worker.duration_ms)
+
+        layout.addWidget(self.play_button)
+        layout.addWidget(QLabel("速度:"))
+        layout.addWidget(self.speed_combo)
+        layout.addWidget(self.slider, 1)
+        layout.addWidget(self.time_label)
+        self.update_position(replay_worker.start_ms, True)
+
+    @staticmethod
+    def format_ms(ms):
+        # プリロール部分（録画開始前）は負の時刻で表示する
+        sign = "-" if ms < 0 else ""
+        seconds = int(abs(ms) // 1000)
+        return f"{sign}{seconds // 60:02d}:{seconds % 60:02d}"
+
+    def toggle_play(self):
+        self.playing = not self.playing
+        self.replay_worker.set_paused(not self.playing)
+        self.play_button.setText("一時停止" if self.playing else "再生")
+
+    def update_position(self, position_ms, playing):
+        if not self.slider.isSliderDown():
+            self.slider.setValue(int(position_ms))
+        if not playing and self.playing:
+            # 終端に達して止まった場合
+            self.playing = False
+            self.play_button.setText("再生")
+        self.time_label.setText(f"{self.format_ms(position_ms)} / {self.duration_text}")
+
 # --- マスターコントロール用メインウィンドウ ---
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, replay_dir=None, replay_speed=1.0, monitor=None):
         super().__init__()
         self.setWindowTitle("実験コントローラー - GSR & A/V モニタリング")
         self.setGeometry(100, 100, 1200, 800)
@@ -132,9 +454,29 @@ class MainWindow(QMainWindow):
         self.session_dir = ""
         self.current_recording_dir = ""
         self.recording_session_count = 0
+        self.record_started_at = 0.0
         self.events_file = None
         self.gsr_file = None
+        self.session_manifest = None
+        # 録画していない間の直近の serial.csv の行とイベント（録画開始時にファイルの先頭に書く）
+        self.serial_preroll = PrerollBuffer('serial')
+        self.events_preroll = PrerollBuffer('events')
+        # 録画停止中（カメラがファイルを閉じ終わるまで）の CameraShutdown と、その後に終了するかどうか
+        self.camera_shutdown = None
+        self.close_after_shutdown = False
+        # closeEvent の処理中（保存中の録画をそこで仕上げる）
+        self.closing = False
+        # 現在の評価値（serial.csv の各行に記録する）
+        self.current_av = (0.0, 0.0)
+        self.current_online5 = 3
+        self.audio_recorder = None
         self.preview_camera = None
+        self.pico_worker = None
+        self.replay_worker = None
+        self.preflight_worker = None
+        self.preflight_result = None
+        # 別室モニタへの配信（--monitor-port 指定時のみ）
+        self.monitor = monitor
         self.preview_timer = QTimer()
         self.preview_timer.timeout.connect(self.update_preview)
 
@@ -155,10 +497,42 @@ class MainWindow(QMainWindow):
         detect_button.clicked.connect(self.detect_cameras)
         self.camera_layout.addWidget(detect_button)
 
+        # 顔ROI録画: 顔の周辺を高解像度で切り出し、全体映像は縮小して記録する（エンコード負荷と容量を減らす）
+        self.face_roi_checkbox = QCheckBox(f"顔ROI録画（顔の周辺を {FACE_ROI_SIZE}px で切り出し、全体映像は {ROI_FULL_FRAME_SCALE:g} 倍に縮小）")
+        self.face_roi_checkbox.toggled.connect(self.update_preflight_status)
+        # プリロール: 録画開始操作の直前の数秒も記録する（0 で無効）
+        preroll_layout = QHBoxLayout()
+        preroll_layout.addWidget(QLabel("プリロール（秒）:"))
+        self.preroll_spin = QSpinBox()
+        self.preroll_spin.setRange(0, 30)
+        self.preroll_spin.setValue(DEFAULT_PREROLL_SECONDS)
+        preroll_layout.addWidget(self.preroll_spin)
+        preroll_layout.addStretch()
+
+        # 保存先の書き込み速度・空き容量（バックグラウンドで測定）
+        preflight_group = QGroupBox("保存先の確認")
+        preflight_layout = QVBoxLayout()
+        preflight_group.setLayout(preflight_layout)
+        duration_layout = QHBoxLayout()
+        duration_layout.addWidget(QLabel("予定実験時間（分）:"))
+        self.planned_minutes_spin = QSpinBox()
+        self.planned_minutes_spin.setRange(1, 600)
+        self.planned_minutes_spin.setValue(PLANNED_SESSION_MINUTES)
+        self.planned_minutes_spin.valueChanged.connect(self.update_preflight_status)
+        duration_layout.addWidget(self.planned_minutes_spin)
+        duration_layout.addStretch()
+        self.preflight_label = QLabel("書き込み速度を測定中...")
+        self.preflight_label.setWordWrap(True)
+        preflight_layout.addLayout(duration_layout)
+        preflight_layout.addWidget(self.preflight_label)
+
         start_button = QPushButton("2. 実験開始")
         start_button.clicked.connect(self.start_experiment)
 
         setup_layout.addWidget(self.camera_group)
+        setup_layout.addWidget(self.face_roi_checkbox)
+        setup_layout.addLayout(preroll_layout)
+        setup_layout.addWidget(preflight_group)
         setup_layout.addWidget(start_button)
 
         # 1: 実験画面 (統合された表示)
@@ -184,6 +558,16 @@ class MainWindow(QMainWindow):
         self.video_label.setScaledContents(True)
         
         self.av_plot = AVPlot()
+        # A/V 表示の更新を画面のリフレッシュレートにまとめる
+        screen = QApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen else 0
+        self.frame_interval_ms = 1000 / refresh_rate if refresh_rate > 0 else DEFAULT_FRAME_INTERVAL_MS
+        self._pending_av = (0.0, 0.0)
+        self._last_av_flush = 0.0
+        self.av_refresh_timer = QTimer()
+        self.av_refresh_timer.setSingleShot(True)
+        self.av_refresh_timer.setTimerType(Qt.PreciseTimer)
+        self.av_refresh_timer.timeout.connect(self.flush_av_display)
         
         left_layout.addLayout(camera_preview_layout)
         left_layout.addWidget(self.video_label, 2)
@@ -195,8 +579,11 @@ class MainWindow(QMainWindow):
         right_layout = QVBoxLayout()
         self.gsr_widget = GSRWidget()
         self.control_panel = ControlPanel()
+        self.control_panel.trail_checkbox.toggled.connect(self.av_plot.set_trail_enabled)
+        self.telemetry_panel = TelemetryPanel()
         right_layout.addWidget(self.gsr_widget, 2)
         right_layout.addWidget(self.control_panel, 1)
+        right_layout.addWidget(self.telemetry_panel)
         right_widget.setLayout(right_layout)
         
         exp_layout.addWidget(left_widget, 2)
@@ -207,20 +594,123 @@ class MainWindow(QMainWindow):
         self.stacked_widget.addWidget(self.experiment_screen)
 
         # --- ワーカーのセットアップ ---
-        self.pico_worker = PicoWorker(serial_port='COM13') # find_com_ports.pyで確認したポート番号
-        self.pico_worker.new_gsr_data.connect(self.handle_new_gsr)
-        self.pico_worker.av_changed.connect(self.handle_av_change)
-        self.pico_worker.record_toggled.connect(self.handle_record_toggle)
-        self.pico_worker.morph_marker_received.connect(self.log_morph_marker)
-        self.pico_worker.session_ended.connect(self.end_session)
-        self.pico_worker.error.connect(self.show_error)
-        self.pico_worker.start()
+        if replay_dir:
+            # 記録済みセッションの再生（Pico とカメラの代わり）
+            self.setup_replay(replay_dir, replay_speed, left_layout)
+        else:
+            self.pico_worker = PicoWorker(serial_port='COM13') # find_com_ports.pyで確認したポート番号
+            self.pico_worker.new_gsr_data.connect(self.handle_new_gsr)
+            self.pico_worker.gsr_sample.connect(self.handle_gsr_sample)
+            self.pico_worker.online5_changed.connect(self.handle_online5_change)
+            self.pico_worker.av_changed.connect(self.handle_av_change)
+            self.pico_worker.record_toggled.connect(self.handle_record_toggle)
+            self.pico_worker.morph_marker_received.connect(self.log_morph_marker)
+            self.pico_worker.button_changed.connect(self.log_button_change)
+            self.pico_worker.session_ended.connect(self.end_session)
+            self.pico_worker.error.connect(self.show_error)
+            self.pico_worker.connection_changed.connect(self.handle_pico_connection)
+            if self.monitor:
+                self.attach_monitor(self.pico_worker)
+                self.pico_worker.online5_changed.connect(self.monitor.publish_online5, Qt.DirectConnection)
+
+            # カメラ選択の間に保存先の書き込み速度を測っておく
+            self.preflight_worker = PreflightWorker(DATA_DIR)
+            self.preflight_worker.result_ready.connect(self.handle_preflight_result)
+            self.preflight_worker.error.connect(self.preflight_label.setText)
+            # ワーカーの起動はウィンドウを表示してから行う
+            QTimer.singleShot(0, self.start_background_workers)
+
+        # 刺激プレイヤー（次のクリップは休憩中に先読みする）
+        self.stimuli = []
+        self.next_clip_index = 0
+        self.current_clip = None
+        self.clip_start_ns = 0
+        self.stimulus_view = StimulusView()
+        # 刺激プレイヤーはクリップの設定がある場合のみ作成する（load_stimuli）
+        self.stimuli_player = None
+        self.stimulus_view.clip_presented.connect(self.handle_clip_presented)
+        self.control_panel.play_clip_button.clicked.connect(self.play_next_clip)
+        self.control_panel.rta_button.clicked.connect(self.toggle_rta_recording)
         
+        # 入力遅延の表示とログ出力
+        self.latency_timer = QTimer()
+        self.latency_timer.timeout.connect(lambda: self.control_panel.update_latency(input_latency.summary()))
+        self.latency_timer.start(1000)
+        self.latency_log_timer = QTimer()
+        self.latency_log_timer.timeout.connect(self.log_latency_summary)
+        self.latency_log_timer.start(LATENCY_LOG_INTERVAL_MS)
+
+        # テレメトリ（表示・定期スナップショット・GUIループ遅れの計測）
+        self.m_serial_bytes = metrics.counter('writer.serial.bytes')
+        self.m_events_bytes = metrics.counter('writer.events.bytes')
+        self.m_gui_lag = metrics.histogram('gui.loop_lag_ms')
+        self.metrics_writer = MetricsSnapshotWriter(os.path.join(LOG_DIR, "metrics.jsonl"), metrics)
+        self.telemetry_timer = QTimer()
+        self.telemetry_timer.timeout.connect(self.telemetry_panel.refresh)
+        self.telemetry_timer.start(1000)
+        self.metrics_timer = QTimer()
+        self.metrics_timer.timeout.connect(self.write_metrics_snapshot)
+        self.metrics_timer.start(METRICS_SNAPSHOT_INTERVAL_MS)
+        if self.monitor:
+            self.telemetry_timer.timeout.connect(self.publish_monitor_status)
+            self.monitor.error.connect(self.show_error)
+            QTimer.singleShot(0, self.monitor.start)
+        self.gui_lag_timer = QTimer()
+        self.gui_lag_timer.timeout.connect(self.probe_gui_lag)
+        self._gui_lag_last = time.perf_counter()
+        self.gui_lag_timer.start(GUI_LAG_PROBE_MS)
+
         # 初期状態設定
-        self.control_panel.update_status("カメラ選択待ち")
+        if not self.replay_worker:
+            self.control_panel.update_status("カメラ選択待ち")
+
+    def start_background_workers(self):
+        self.pico_worker.start()
+        self.preflight_worker.start()
+        # 初回のカメラ検出で読み込みを待たないよう、OpenCV などを先に読み込んでおく
+        threading.Thread(target=lambda: [load_module(name) for name in PRELOAD_MODULES],
+                         name="preload", daemon=True).start()
+
+    def setup_replay(self, replay_dir, speed, left_layout):
+        ReplayWorker = load_module('workers.replay_worker').ReplayWorker
+        self.replay_worker = ReplayWorker(replay_dir, speed=speed)
+        self.replay_worker.new_gsr_data.connect(self.handle_new_gsr)
+        self.replay_worker.gsr_history.connect(self.gsr_widget.set_history)
+        self.replay_worker.av_changed.connect(self.handle_av_change)
+        self.replay_worker.frame_ready.connect(lambda image, name: self.video_label.setPixmap(QPixmap.fromImage(image)))
+        self.replay_worker.error.connect(self.show_error)
+        if self.monitor:
+            self.attach_monitor(self.replay_worker)
+        self.replay_controls = ReplayControls(self.replay_worker)
+        self.replay_worker.position_changed.connect(self.replay_controls.update_position)
+        left_layout.insertWidget(0, self.replay_controls)
+
+        self.preview_camera_combo.addItems(self.replay_worker.video_names or ["プレビューなし"])
+        self.video_label.setStyleSheet("")
+        self.control_panel.update_status(f"再生: {replay_dir}")
+        self.setWindowTitle(f"実験コントローラー - 再生 {replay_dir}")
+        self.stacked_widget.setCurrentIndex(1)
+        self.replay_worker.start()
+
+    def attach_monitor(self, source):
+        """ワーカーの GSR・A/V をモニタへ直接渡す（ワーカーのスレッドで値を置くだけで、GUIスレッドを経由しない）"""
+        source.new_gsr_data.connect(self.monitor.publish_gsr, Qt.DirectConnection)
+        source.av_changed.connect(self.monitor.publish_av, Qt.DirectConnection)
+
+    def publish_monitor_status(self):
+        self.monitor.publish_recording(self.is_recording)
+        self.monitor.publish_status({
+            'pid': os.path.basename(self.session_dir).split('_')[-1] if self.session_dir else None,
+            'session_number': self.recording_session_count,
+            'recording_dir': self.current_recording_dir if self.is_recording else None,
+            'record_seconds': time.perf_counter() - self.record_started_at if self.is_recording else 0.0,
+            'status': self.control_panel.status_label.text(),
+        })
 
     def get_camera_info(self, index):
         """カメラの詳細情報を取得"""
+        import subprocess
+        cv2 = load_module('cv2')
         try:
             # PowerShellコマンドでカメラデバイスの情報を取得
             cmd = f'Get-WmiObject -Class Win32_PnPEntity | Where-Object {{$_.Name -like "*camera*" -or $_.Name -like "*webcam*" -or $_.Name -like "*USB Video*"}} | Format-Table -Property Name, DeviceID -AutoSize'
@@ -252,6 +742,7 @@ class MainWindow(QMainWindow):
             return f"カメラ {index}"
 
     def detect_cameras(self):
+        cv2 = load_module('cv2')
         # 既存のチェックボックスをクリア
         for checkbox in self.camera_checkboxes:
             self.camera_layout.removeWidget(checkbox)
@@ -289,9 +780,46 @@ class MainWindow(QMainWindow):
             camera_info = camera_info_dict.get(index, f"カメラ {index}")
             checkbox = QCheckBox(camera_info)
             checkbox.setToolTip(f"デバイス ID: {index}")  # ツールチップでデバイスIDを表示
+            checkbox.toggled.connect(self.update_preflight_status)
             self.camera_layout.addWidget(checkbox)
             self.camera_checkboxes.append(checkbox)
 
+    # --- 保存先の事前確認 ---
+    def handle_preflight_result(self, result):
+        self.preflight_result = result
+        self.update_preflight_status()
+
+    def evaluate_preflight(self):
+        """選択中のカメラ台数と予定時間で見積もり、(判定, メッセージ, 見積もり) を返す"""
+        num_cameras = sum(1 for cb in self.camera_checkboxes if cb.isChecked())
+        result = self.preflight_result or {}
+        requirements = estimate_requirements(num_cameras, self.planned_minutes_spin.value() * 60,
+                                             bytes_per_frame=result.get('bytes_per_frame'),
+                                             pixel_ratio=face_roi_pixel_ratio(ROI_FULL_FRAME_SCALE)
+                                             if self.face_roi_checkbox.isChecked() else 1.0)
+        free = result.get('free_bytes')
+        if free is None:
+            # 測定が終わっていなくても容量だけは確認する
+            os.makedirs(DATA_DIR, exist_ok=True)
+            free = shutil.disk_usage(DATA_DIR).free
+        level, messages = evaluate(requirements, free, result.get('throughput_bps'))
+        return level, messages, requirements
+
+    def update_preflight_status(self, *args):
+        level, messages, requirements = self.evaluate_preflight()
+        result = self.preflight_result or {}
+        lines = [f"必要帯域 {requirements['bandwidth_bps'] / 1e6:.2f} MB/s、"
+                 f"必要容量 {requirements['capacity_bytes'] / 1024**3:.1f} GB"]
+        if result.get('throughput_bps'):
+            lines.append(f"書き込み速度 {result['throughput_bps'] / 1e6:.1f} MB/s、"
+                         f"空き {result['free_bytes'] / 1024**3:.1f} GB")
+        elif not result:
+            lines.append("書き込み速度を測定中...")
+        lines += messages
+        color = {'ok': 'green', 'warn': 'orange', 'block': 'red'}[level]
+        self.preflight_label.setStyleSheet(f"color: {color};")
+        self.preflight_label.setText("\n".join(lines))
+
     def start_experiment(self):
         # チェックボックスからカメラインデックスを抽出
         self.selected_cameras = []
@@ -316,11 +844,22 @@ class MainWindow(QMainWindow):
         if not self.selected_cameras:
             self.show_error("録画するカメラを1台以上選択してください。")
             return
+
+        level, messages, _ = self.evaluate_preflight()
+        if level == 'block':
+            self.show_error("\n".join(messages))
+            return
+        if level == 'warn':
+            answer = QMessageBox.warning(self, "保存先の確認", "\n".join(messages) + "\n\n実験を開始しますか？",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if answer != QMessageBox.Yes:
+                return
         
         # セッションディレクトリを作成
-        self.session_dir = f"data/{datetime.now().strftime('%Y%m%d-%H%M%S')}_PID001"
+        self.session_dir = os.path.join(DATA_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_PID001")
         os.makedirs(self.session_dir, exist_ok=True)
         self.recording_session_count = 0
+        self.serial_preroll.seconds = self.events_preroll.seconds = self.preroll_spin.value()
         
         # プレビュー用カメラ選択肢を更新
         self.preview_camera_combo.clear()
@@ -328,6 +867,15 @@ class MainWindow(QMainWindow):
         for cam_index in self.selected_cameras:
             self.preview_camera_combo.addItem(f"カメラ {cam_index}")
         
+        self.load_stimuli()
+
+        # 録画開始を待たせないよう、カメラを今開いて待機状態にしておく
+        # （同じカメラを2か所で開かないよう、プレビューは待機中のカメラのフレームを表示する）
+        self.stop_preview_camera()
+        for cam_index in self.selected_cameras:
+            self.arm_camera(int(cam_index))
+        self.change_preview_camera(self.preview_camera_combo.currentText())
+
         print(f"実験開始。選択されたカメラ: {self.selected_cameras}")
         print(f"セッションディレクトリ: {self.session_dir}")
         self.control_panel.update_status("実験中 - 録画待機")
@@ -336,19 +884,62 @@ class MainWindow(QMainWindow):
     # --- スロット関数 (ワーカーからの信号を処理) ---
     def handle_new_gsr(self, gsr_value):
         self.gsr_widget.update_plot(gsr_value)
-        if self.is_recording and self.gsr_file:
-            self.gsr_file.write(f"{time.perf_counter_ns()},{gsr_value}\n")
+
+    def handle_gsr_sample(self, gsr_value, idx, pico_ms, pc_ns):
+        """
+        GSRサンプルごとに、その時点の評価値（A/V・オンライン5段階）を同じ行に記録する。
+        評価の変化とGSRは同じワーカーから発行順に届くため、各行は受信時点の値になる。
+        """
+        line = serial_csv_row(gsr_value, idx, pico_ms, pc_ns, *self.current_av, self.current_online5)
+        if not self.is_recording or not self.gsr_file:
+            self.serial_preroll.append(pc_ns, line, len(line))
+            return
+        self.gsr_file.write(line)
+        self.m_serial_bytes.inc(len(line))
+
+    def handle_pico_connection(self, connected):
+        # 実験中に切断してもダイアログで止めず、表示とログだけにする（自動で再接続する）
+        self.control_panel.update_pico_status(connected)
+        if not connected:
+            logger.warning("Pico が切断されました。再接続を試みます。")
+
+    def handle_online5_change(self, value):
+        self.current_online5 = value
+        self.control_panel.update_online5(value)
+        self.log_event('online5_change', {'value': value})
 
     def handle_av_change(self, arousal, valence):
-        self.av_plot.update_dot_position(arousal, valence)
-        self.control_panel.update_av_values(arousal, valence)
+        input_latency.slot_executed()
+        self.current_av = (arousal, valence)
+        # 記録は全ての変化について行い、表示は画面の更新間隔ごとに最新の値だけを反映する
         self.log_event('av_change', {'arousal': arousal, 'valence': valence})
+        self._pending_av = (arousal, valence)
+        if self.av_refresh_timer.isActive():
+            return
+        wait_ms = (self._last_av_flush + self.frame_interval_ms / 1000 - time.perf_counter()) * 1000
+        if wait_ms <= 0:
+            self.flush_av_display()
+        else:
+            self.av_refresh_timer.start(int(wait_ms) + 1)
+
+    def flush_av_display(self):
+        self._last_av_flush = time.perf_counter()
+        self.av_plot.update_dot_position(*self._pending_av)
+        self.control_panel.update_av_values(*self._pending_av)
 
     def handle_record_toggle(self):
-        self.is_recording = not self.is_recording
-        self.control_panel.update_recording_status(self.is_recording)
-        
-        if self.is_recording:
+        if self.camera_shutdown:
+            print("前の録画を保存中のため、録画を開始できません。")
+            return
+        if not self.is_recording:
+            # 空き容量が閾値を下回る場合は録画を開始しない
+            message = check_free_space(self.session_dir or DATA_DIR)
+            if message:
+                self.show_error(message)
+                return
+        if not self.is_recording:
+            self.is_recording = True
+            self.control_panel.update_recording_status(True)
             print("録画開始...")
             self.control_panel.update_status("録画中")
             
@@ -358,32 +949,221 @@ class MainWindow(QMainWindow):
             os.makedirs(os.path.join(self.current_recording_dir, 'video'), exist_ok=True)
             
             print(f"録画セッション {self.recording_session_count}: {self.current_recording_dir}")
+            self.record_started_at = time.perf_counter()
             
             # ログファイルを開く
-            self.events_file = open(os.path.join(self.current_recording_dir, 'events.jsonl'), 'a')
-            self.gsr_file = open(os.path.join(self.current_recording_dir, 'serial.csv'), 'a')
-            self.gsr_file.write("pc_ns,gsr_value\n")
+            # 各ファイルは書き込みながらハッシュを計算し、停止時に meta/manifest.json にまとめる
+            self.session_manifest = SessionManifest(self.current_recording_dir)
+            self.events_file = HashingFile(os.path.join(self.current_recording_dir, 'events.jsonl'))
+            self.gsr_file = HashingFile(os.path.join(self.current_recording_dir, 'serial.csv'))
+            self.gsr_file.write(SERIAL_CSV_COLUMNS + "\n")
+            # 録画開始の直前の数秒（プリロール）を先頭に書く（pc_ns は受信時刻のまま）
+            for _, line in self.serial_preroll.drain():
+                self.gsr_file.write(line)
+            for _, line in self.events_preroll.drain():
+                self.events_file.write(line)
 
-            self.log_event('record_start', {'session_number': self.recording_session_count})
+            self.log_event('record_start', {'session_number': self.recording_session_count,
+                                           'face_roi': self.face_roi_checkbox.isChecked(),
+                                           'preroll_seconds': self.preroll_spin.value()})
 
-            # 選択されたカメラの録画を開始
+            # 待機中のカメラは次のフレームから書き込む（外れていたカメラはここで開き直す）
             for cam_index in self.selected_cameras:
                 save_path = os.path.join(self.current_recording_dir, f"video/camera_{cam_index}.mp4")
-                worker = CameraWorker(int(cam_index), save_path)
-                worker.error.connect(self.show_error)
-                self.active_camera_workers.append(worker)
-                worker.start()
+                worker = self.camera_worker_for(int(cam_index))
+                if worker is None:
+                    self.stop_preview_camera()  # 同じカメラを2か所で開かない
+                    worker = self.arm_camera(int(cam_index))
+                worker.start_recording(save_path)
+            self.control_panel.rta_button.setEnabled(True)
+            self.change_preview_camera(self.preview_camera_combo.currentText())
         else:
             print(f"録画停止...セッション {self.recording_session_count} 完了")
-            self.control_panel.update_status("実験中 - 録画待機")
+            self.stop_rta_recording()
+            self.control_panel.rta_button.setEnabled(False)
             self.log_event('record_stop', {'session_number': self.recording_session_count})
-            # カメラワーカーを停止
-            for worker in self.active_camera_workers:
-                worker.stop()
-            self.active_camera_workers = []
-            # ファイルを閉じる
-            if self.events_file: self.events_file.close()
-            if self.gsr_file: self.gsr_file.close()
+            # RTA の停止と record_stop を events.jsonl に書いてから、以降のイベントをプリロールに回す
+            self.is_recording = False
+            self.control_panel.update_recording_status(False)
+            # ファイルを閉じる（動画は各カメラのスレッドで並列に閉じ、完了後にマニフェストを書き出す）
+            if self.events_file:
+                self.events_file.close()
+                self.session_manifest.add(self.events_file.entry(rows=self.events_file.lines))
+            if self.gsr_file:
+                self.gsr_file.close()
+                self.session_manifest.add(self.gsr_file.entry(rows=self.gsr_file.lines - 1))
+            self.control_panel.update_status("実験中 - 録画を保存中...")
+            # カメラは録画だけを止めて待機状態に残す
+            self.camera_shutdown = CameraShutdown(self.active_camera_workers, disarm=False, parent=self)
+            self.camera_shutdown.camera_stopped.connect(self.handle_camera_stopped)
+            self.camera_shutdown.all_stopped.connect(self.finish_record_stop)
+            self.camera_shutdown.start()
+
+    def arm_camera(self, cam_index):
+        """カメラを開いて設定し、フレームを読み続ける待機状態にする（録画開始はフラグを立てるだけになる）"""
+        for worker in [w for w in self.active_camera_workers if w.camera_index == cam_index]:
+            self.discard_camera_worker(worker, release_pool=not worker.isRunning())
+        FramePool = load_module('workers.frame_pool').FramePool
+        pool = FramePool(FRAME_POOL_SLOTS, (CAMERA_HEIGHT, CAMERA_WIDTH, 3))
+        worker = CameraWorker(cam_index,
+                              thumbnail_interval=self.monitor.thumbnail_interval if self.monitor else 0,
+                              frame_pool=pool, face_roi=self.face_roi_checkbox.isChecked(),
+                              preroll_seconds=self.preroll_spin.value())
+        worker.error.connect(self.show_error)
+        worker.frame_shared.connect(lambda slot, pc_ns, w=worker: self.show_shared_frame(w, slot))
+        worker.recording_started.connect(self.handle_camera_record_start)
+        if self.monitor:
+            worker.thumbnail_ready.connect(self.monitor.publish_thumbnail, Qt.DirectConnection)
+        self.active_camera_workers.append(worker)
+        worker.start()
+        return worker
+
+    def discard_camera_worker(self, worker, release_pool=True):
+        """止まった（またはスレッドが応答しない）ワーカーを待機中のカメラから外す"""
+        self.active_camera_workers.remove(worker)
+        if release_pool:
+            self.release_frame_pool(worker)  # スレッドが残っている場合はプールを使い続けるため解放しない
+
+    def camera_worker_for(self, cam_index):
+        """待機中（スレッドが動いている）のカメラのワーカー。無ければ None"""
+        for worker in self.active_camera_workers:
+            if worker.camera_index == cam_index and worker.isRunning():
+                return worker
+        return None
+
+    def handle_camera_stopped(self, camera_index, seconds, state):
+        self.control_panel.update_status(f"実験中 - 録画を保存中...（カメラ {camera_index} 完了 {seconds:.1f}s）")
+        if state != 'ok':
+            self.show_error(f"カメラ {camera_index} の録画が正常に終了しませんでした（{state}）。")
+
+    def finish_record_stop(self, results):
+        """全カメラがファイルを閉じた後の処理（マニフェスト・カタログ登録・プレビューの再開）"""
+        shutdown, self.camera_shutdown = self.camera_shutdown, None
+        for worker in shutdown.workers:
+            self.session_manifest.add_all(worker.manifest_entries)
+        # 強制的に止めたカメラは待機から外す（次の録画開始時に開き直す）
+        workers = {worker.camera_index: worker for worker in shutdown.workers}
+        for result in results:
+            if result['state'] != 'ok':
+                self.discard_camera_worker(workers[result['camera']], release_pool=result['state'] != 'abandoned')
+        slowest = max((r['seconds'] for r in results), default=0.0)
+        print(f"録画を保存しました（停止にかかった時間 {slowest:.2f}s）")
+        metrics.gauge('record.stop_ms').set(slowest * 1000)
+        self.session_manifest.write()
+        # セッションカタログに登録
+        index_session_in_background(self.current_recording_dir)
+        if self.closing:
+            return
+        if self.close_after_shutdown:
+            self.close()
+            return
+        self.control_panel.update_status("実験中 - 録画待機")
+        self.change_preview_camera(self.preview_camera_combo.currentText())
+
+    # --- 刺激呈示 ---
+    def load_stimuli(self):
+        self.stimuli = []
+        self.next_clip_index = 0
+        if not os.path.exists(STIMULI_CONFIG_PATH):
+            self.control_panel.update_clip_status(f"{STIMULI_CONFIG_PATH} がありません", False)
+            return
+        try:
+            with open(STIMULI_CONFIG_PATH, encoding='utf-8') as f:
+                self.stimuli = json.load(f).get('clips', [])
+        except (OSError, ValueError) as e:
+            self.show_error(f"刺激設定の読み込みエラー: {e}")
+            return
+        if not self.stimuli_player:
+            StimuliPlayer = load_module('workers.stimuli_player').StimuliPlayer
+            self.stimuli_player = StimuliPlayer()
+            self.stimuli_player.frame_ready.connect(self.stimulus_view.show_frame)
+            self.stimuli_player.preloaded.connect(self.handle_clip_preloaded)
+            self.stimuli_player.clip_finished.connect(self.handle_clip_finished)
+            self.stimuli_player.error.connect(self.show_error)
+            self.stimuli_player.start()
+        self.stimulus_view.show()
+        self.preload_next_clip()
+
+    def preload_next_clip(self):
+        if self.next_clip_index >= len(self.stimuli):
+            self.control_panel.update_clip_status("全クリップ終了", False)
+            return
+        clip = self.stimuli[self.next_clip_index]
+        self.control_panel.update_clip_status(f"{clip['clip_id']} 先読み中...", False)
+        self.stimuli_player.preload(clip['clip_id'], clip['path'])
+
+    def handle_clip_preloaded(self, clip_id):
+        self.control_panel.update_clip_status(f"{clip_id} 準備完了", True)
+
+    def play_next_clip(self):
+        if self.current_clip or self.next_clip_index >= len(self.stimuli):
+            return
+        self.current_clip = self.stimuli[self.next_clip_index]
+        self.next_clip_index += 1
+        self.control_panel.update_clip_status(f"{self.current_clip['clip_id']} 再生中", False)
+        self.stimuli_player.play()
+
+    def handle_clip_presented(self, clip_id, pc_ns):
+        # 再生命令の時刻ではなく、最初のフレームを描画した時刻で記録する
+        self.clip_start_ns = pc_ns
+        clip = self.current_clip or {}
+        self.log_event('clip_start', {key: value for key, value in clip.items() if key != 'path'}, pc_ns=pc_ns)
+
+    def handle_clip_finished(self, clip_id, frame_count):
+        end_ns = self.stimulus_view.last_presented_ns
+        dur_s = (end_ns - self.clip_start_ns) / 1e9 if self.clip_start_ns else 0.0
+        self.log_event('clip_end', {'clip_id': clip_id, 'dur_s': round(dur_s, 3), 'frames': frame_count}, pc_ns=end_ns)
+        self.stimulus_view.blackout()
+        self.current_clip = None
+        self.clip_start_ns = 0
+        # 休憩中に次のクリップを先読みしておく
+        self.preload_next_clip()
+
+    # --- RTA音声録音 ---
+    def toggle_rta_recording(self):
+        if self.audio_recorder:
+            self.stop_rta_recording()
+            return
+        if not self.is_recording:
+            return
+        save_path = os.path.join(self.current_recording_dir, 'audio', 'rta.wav')
+        AudioRecorder = load_module('workers.audio_recorder').AudioRecorder
+        self.audio_recorder = AudioRecorder(save_path)
+        self.audio_recorder.level.connect(lambda level: self.control_panel.update_rta_status(True, level))
+        self.audio_recorder.error.connect(self.show_error)
+        self.audio_recorder.start()
+        self.control_panel.update_rta_status(True)
+        self.log_event('rta_audio_start', {'file': 'audio/rta.wav'})
+
+    def stop_rta_recording(self):
+        if not self.audio_recorder:
+            return
+        self.audio_recorder.stop()
+        if self.audio_recorder.manifest_entry and self.session_manifest:
+            self.session_manifest.add(self.audio_recorder.manifest_entry)
+        self.log_event('rta_audio_stop', {'file': 'audio/rta.wav'})
+        self.audio_recorder = None
+        self.control_panel.update_rta_status(False)
+
+    def log_button_change(self, name, pressed, pico_ms, pc_ns):
+        # シリアル入力モードでは押下・解放の両方をPico時刻付きで記録する
+        self.log_event('button', {'button': name, 'pressed': pressed, 'pico_ms': pico_ms}, pc_ns=pc_ns)
+
+    # --- テレメトリ ---
+    def probe_gui_lag(self):
+        now = time.perf_counter()
+        self.m_gui_lag.observe(max(0.0, (now - self._gui_lag_last) * 1000 - GUI_LAG_PROBE_MS))
+        self._gui_lag_last = now
+
+    def write_metrics_snapshot(self):
+        try:
+            self.metrics_writer.write()
+        except OSError as e:
+            logger.warning("メトリクスの書き出しに失敗しました: %s", e)
+
+    def log_latency_summary(self):
+        if input_latency.count:
+            logger.info("入力遅延 (直近 %d 件)\n%s", input_latency.count, input_latency.format_summary())
 
     def log_morph_marker(self):
         self.log_event('morph_awareness_marker', {})
@@ -392,33 +1172,58 @@ class MainWindow(QMainWindow):
         print("セッション終了信号を受信しました。")
         if self.is_recording:
             self.handle_record_toggle() # 録画を停止
+        if self.camera_shutdown:
+            # カメラがファイルを閉じ終わり、マニフェストを書き出してから終了する（finish_record_stop で閉じる）
+            self.close_after_shutdown = True
+            return
         self.close() # アプリケーションを終了
 
-    def log_event(self, event_type, data):
-        if not self.is_recording or not self.events_file:
-            return
+    def handle_camera_record_start(self, camera, pc_ns, preroll_start_ns, preroll_frames):
+        # プリロールのフレームは record_start より前の時刻のため、イベントの時刻ではなくデータに記録する
+        data = {'camera': camera}
+        if preroll_frames:
+            data.update(preroll_start_ns=preroll_start_ns, preroll_frames=preroll_frames)
+        self.log_event('camera_record_start', data, pc_ns=pc_ns)
+
+    def log_event(self, event_type, data, pc_ns=None):
         event_data = {
-            'pc_ns': time.perf_counter_ns(),
+            'pc_ns': pc_ns if pc_ns is not None else time.perf_counter_ns(),
             'type': event_type,
             'data': data
         }
-        self.events_file.write(json.dumps(event_data) + '\n')
+        line = json.dumps(event_data) + '\n'
+        if not self.is_recording or not self.events_file:
+            self.events_preroll.append(event_data['pc_ns'], line, len(line))
+            return
+        self.events_file.write(line)
+        self.m_events_bytes.inc(len(line))
 
     def change_preview_camera(self, camera_text):
+        if self.replay_worker:
+            # 再生中は記録済みの動画を切り替える
+            if camera_text in self.replay_worker.video_names:
+                self.replay_worker.set_preview(camera_text)
+            return
         # 既存のプレビューカメラを停止
-        if self.preview_camera:
-            self.preview_camera.release()
-            self.preview_camera = None
-        self.preview_timer.stop()
+        self.stop_preview_camera()
+        for worker in self.active_camera_workers:
+            worker.share_interval = 0
         
-        if camera_text == "プレビューなし":
+        if camera_text == "プレビューなし" or not camera_text:
             self.video_label.setText("動画表示エリア")
             self.video_label.setStyleSheet("background-color: black; color: white; font-size: 16px;")
             return
         
         # 新しいカメラを開始
+        cv2 = load_module('cv2')
         try:
             camera_index = int(camera_text.split(' ')[1])
+            # 録画中のカメラはデバイスを開き直さず、録画ワーカーのフレームを共有メモリ経由で表示する
+            for worker in self.active_camera_workers:
+                if worker.camera_index == camera_index and worker.frame_pool:
+                    worker.share_interval = SHARED_PREVIEW_INTERVAL_S
+                    self.video_label.setStyleSheet("")
+                    return
             self.preview_camera = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)
             if self.preview_camera.isOpened():
                 self.preview_timer.start(33)  # 約30FPS
@@ -428,38 +1233,100 @@ class MainWindow(QMainWindow):
         except Exception as e:
             self.show_error(f"プレビュー開始エラー: {str(e)}")
     
+    def stop_preview_camera(self):
+        if self.preview_camera:
+            self.preview_camera.release()
+            self.preview_camera = None
+        self.preview_timer.stop()
+
+    def show_shared_frame(self, worker, slot):
+        """録画ワーカーが共有したスロットを表示して解放する"""
+        if worker not in self.active_camera_workers:
+            return  # 録画停止後に届いた（プールは解放済み）
+        try:
+            if worker.share_interval:
+                self.show_preview_frame(worker.frame_pool.view(slot))
+        finally:
+            worker.frame_pool.release(slot)
+
+    def release_frame_pool(self, worker):
+        pool = worker.frame_pool
+        if pool is None:
+            return
+        worker.frame_pool = None
+        pool.close()
+        pool.unlink()
+
     def update_preview(self):
         if not self.preview_camera or not self.preview_camera.isOpened():
             return
-        
         ret, frame = self.preview_camera.read()
         if ret:
-            # フレームをリサイズ（表示用に適切なサイズに調整）
-            height, width, channel = frame.shape
-            target_width = 640
-            target_height = int(height * target_width / width)
-            frame = cv2.resize(frame, (target_width, target_height))
-            
-            # BGR → RGB変換
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            h, w, ch = rgb_frame.shape
-            bytes_per_line = ch * w
-            
-            # QImageに変換
-            qt_image = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            pixmap = QPixmap.fromImage(qt_image)
-            
-            # QLabelに設定
-            self.video_label.setPixmap(pixmap)
+            self.show_preview_frame(frame)
+
+    def show_preview_frame(self, frame):
+        cv2 = load_module('cv2')
+        # フレームをリサイズ（表示用に適切なサイズに調整）
+        height, width, channel = frame.shape
+        target_width = 640
+        target_height = int(height * target_width / width)
+        frame = cv2.resize(frame, (target_width, target_height))
+        
+        # BGR → RGB変換
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb_frame.shape
+        bytes_per_line = ch * w
+        
+        # QImageに変換
+        qt_image = QImage(rgb_frame.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(qt_image)
+        
+        # QLabelに設定
+        self.video_label.setPixmap(pixmap)
 
     def show_error(self, message):
         QMessageBox.critical(self, "エラー", message)
 
     def closeEvent(self, event):
         print("アプリケーションを終了します。")
-        self.pico_worker.stop()
-        for worker in self.active_camera_workers:
-            worker.stop()
+        self.closing = True
+        self.log_latency_summary()
+        if self.is_recording:
+            self.handle_record_toggle()  # 録画を停止（マニフェストはカメラの終了を待ってから下で書き出す）
+        if self.pico_worker:
+            self.pico_worker.stop()
+        if self.replay_worker:
+            self.replay_worker.stop()
+        if self.preflight_worker:
+            self.preflight_worker.stop()
+        if self.monitor:
+            self.monitor.stop()
+        if self.stimuli_player:
+            self.stimuli_player.stop()
+        self.stimulus_view.close()
+        if self.audio_recorder:
+            self.audio_recorder.stop()
+        # 録画中・保存中のカメラに同時に停止を要求してから、それぞれの終了を待つ
+        workers = list(self.active_camera_workers)
+        if self.camera_shutdown:
+            workers += [w for w in self.camera_shutdown.pending if w not in workers]
+        for worker in workers:
+            worker.request_stop()
+        deadline = time.monotonic() + CAMERA_STOP_TIMEOUT_S
+        stopped = []
+        for worker in workers:
+            if not worker.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+                worker.force_release()
+                if not worker.wait(int(CAMERA_FORCE_RELEASE_GRACE_S * 1000)):
+                    continue
+            stopped.append(worker)
+        if self.camera_shutdown:
+            # 保存中の録画を仕上げる（ワーカーからの通知はイベントループに戻らないと届かないため、ここで完了させる）
+            shutdown = self.camera_shutdown
+            for worker in list(shutdown.pending):
+                shutdown.handle_finished(worker, None if worker in stopped else 'abandoned')
+        for worker in stopped:
+            self.release_frame_pool(worker)
         
         # プレビューカメラも停止
         if self.preview_camera:
@@ -468,8 +1335,47 @@ class MainWindow(QMainWindow):
         
         super().closeEvent(event)
 
+def report_startup(visible_at):
+    """起動時間の内訳をログに残す（目標: STARTUP_TARGET_MS 以内にウィンドウ表示）"""
+    total_ms = (visible_at - STARTUP_T0) * 1000
+    metrics.gauge('startup.visible_ms').set(total_ms)
+    message = (f"起動時間: {total_ms:.0f} ms（モジュール読み込み {(STARTUP_IMPORTS_DONE - STARTUP_T0) * 1000:.0f} ms、"
+               f"ウィンドウ作成 {(STARTUP_WINDOW_CREATED - STARTUP_IMPORTS_DONE) * 1000:.0f} ms、"
+               f"表示 {(visible_at - STARTUP_WINDOW_CREATED) * 1000:.0f} ms）")
+    print(message)
+    if total_ms > STARTUP_TARGET_MS:
+        logger.warning("%s: 目標 %d ms を超えています", message, STARTUP_TARGET_MS)
+    else:
+        logger.info(message)
+
+def setup_logging():
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logging.basicConfig(
+        filename=os.path.join(LOG_DIR, "app.log"),
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        encoding="utf-8",
+    )
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    main_win = MainWindow()
+    parser = argparse.ArgumentParser(description="実験コントローラー")
+    parser.add_argument('--replay', metavar='SESSION_DIR',
+                        help="記録済みセッション（session_NN）を Pico・カメラの代わりに再生する")
+    parser.add_argument('--speed', type=float, default=1.0, help="再生速度（0.5〜16）")
+    parser.add_argument('--monitor-port', type=int, help="別室モニタ用の HTTP/WebSocket サーバーをこのポートで開く")
+    parser.add_argument('--monitor-host', default='127.0.0.1',
+                        help="モニタサーバーの待ち受けアドレス（別のPCから見る場合は 0.0.0.0）")
+    args, qt_args = parser.parse_known_args()
+
+    setup_logging()
+    app = QApplication(sys.argv[:1] + qt_args)
+    monitor = None
+    if args.monitor_port is not None:
+        MonitorServer = load_module('workers.monitor_server').MonitorServer
+        monitor = MonitorServer(args.monitor_host, args.monitor_port)
+    main_win = MainWindow(replay_dir=args.replay, replay_speed=args.speed, monitor=monitor)
+    STARTUP_WINDOW_CREATED = time.perf_counter()
     main_win.show()
+    # 最初の描画が終わった後に実行される
+    QTimer.singleShot(0, lambda: report_startup(time.perf_counter()))
     sys.exit(app.exec())
\ No newline at end of file
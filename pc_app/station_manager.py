@@ -0,0 +1,326 @@
+"""
+複数ステーション運用: 1台のPCで複数の参加者を同時に記録する
+
+ステーションごとにヘッドレス記録プロセス（headless.py）を起動し、Pico のシリアルポート・カメラ・
+保存先・PID・制御ポート・CPU を分けて割り当てる。プロセスを分けるため、1つのステーションの
+停止や遅れが他に影響しない。監視画面は各プロセスの制御ソケットから状態を集めて表示する。
+
+設定ファイルの例:
+    {
+      "stations": [
+        {"name": "A", "pid": "PID001", "serial_port": "COM13", "cameras": [0, 1]},
+        {"name": "B", "pid": "PID002", "serial_port": "COM14", "cameras": [2, 3], "cores": [4, 5]}
+      ]
+    }
+cores を省略したステーションには、CPU 0 を除いたコアを均等に割り当てる。
+
+使い方（pc_app/ で実行）:
+    python station_manager.py --config stations.json
+"""
+import sys
+import os
+import json
+import time
+import subprocess
+from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget,
+                               QTableWidgetItem, QPushButton, QLabel, QHeaderView, QMessageBox)
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtNetwork import QTcpSocket, QAbstractSocket
+
+from headless import DEFAULT_CONFIG
+
+# 制御ポート・モニタポートの割り当て（ステーション i は BASE + i）
+CONTROL_PORT_BASE = 8770
+MONITOR_PORT_BASE = 8780
+# ステーションの設定とログの保存先（ステーションごとのサブディレクトリ）
+STATION_LOG_DIR = os.path.join("logs", "stations")
+# 状態を問い合わせる間隔（ミリ秒）
+POLL_INTERVAL_MS = 1000
+# 終了時に各プロセスが録画を閉じて終わるのを待つ時間（秒）
+SHUTDOWN_TIMEOUT_S = 15
+# 再起動時にプロセスの終了を確認する間隔（ミリ秒）。GUIを止めないよう待たずにタイマーで確認する
+RESTART_POLL_MS = 200
+
+COLUMNS = ['ステーション', 'PID', 'プロセス', 'Pico', '録画', 'セッション', '経過', 'GSR', '興奮度', 'CPU']
+
+def assign_cores(stations, cpu_count=None):
+    """
+    cores の指定が無いステーションに、CPU 0（GUI・OS用）を除いたコアを均等に分ける。
+    ステーションが空きコアより多い場合は、警告を表示して複数のステーションで同じコアを共有する
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    free = [core for core in range(1, cpu_count)
+            if not any(core in (s.get('cores') or []) for s in stations)]
+    pending = [s for s in stations if not s.get('cores')]
+    if not pending or not free:
+        return
+    if len(pending) > len(free):
+        print(f"警告: cores の指定が無いステーション {len(pending)} 台に対し空きコアが {len(free)} 個しかないため、"
+              f"複数のステーションが同じコアを使います。記録が遅れる場合はステーションを減らすか cores を指定してください。")
+    per_station = max(1, len(free) // len(pending))
+    for i, station in enumerate(pending):
+        start = (i * per_station) % len(free)
+        station['cores'] = free[start:start + per_station]
+
+def build_station_configs(config):
+    """設定ファイルからステーションごとの headless 設定を作る"""
+    stations = [dict(s) for s in config['stations']]
+    names = [s['name'] for s in stations]
+    if len(set(names)) != len(names):
+        raise ValueError("ステーション名が重複しています。")
+    for key in ('pid', 'serial_port'):
+        values = [s.get(key) for s in stations]
+        if len(set(values)) != len(values):
+            raise ValueError(f"ステーション間で {key} が重複しています。")
+    cameras = [c for s in stations for c in s.get('cameras', [])]
+    if len(set(cameras)) != len(cameras):
+        raise ValueError("同じカメラが複数のステーションに割り当てられています。")
+    if config.get('pin_cores', True):
+        assign_cores(stations)
+
+    result = []
+    for i, station in enumerate(stations):
+        headless = {
+            'station': station['name'],
+            'pid': station['pid'],
+            'serial_port': station['serial_port'],
+            'cameras': station.get('cameras', []),
+            'data_dir': config.get('data_dir', DEFAULT_CONFIG['data_dir']),
+            'log_dir': os.path.join(STATION_LOG_DIR, station['name']),
+            # キーボードは全ステーションで共有されるため使わない（Pico のシリアル入力のみ）
+            'keyboard_hooks': False,
+            'control_port': CONTROL_PORT_BASE + i,
+            'monitor_port': MONITOR_PORT_BASE + i if config.get('monitor') else None,
+            'cpu_affinity': station.get('cores') if config.get('pin_cores', True) else None,
+        }
+        for key, value in station.get('options', {}).items():
+            headless[key] = value
+        result.append(headless)
+    return result
+
+class Station:
+    """ステーション1つ分のプロセスと制御ソケット"""
+    def __init__(self, config):
+        self.config = config
+        self.name = config['station']
+        self.process = None
+        self.status = {}
+        self.last_reply = None
+        # 再起動のため終了を待っている間は True
+        self.restarting = False
+        self.socket = QTcpSocket()
+        self.socket.readyRead.connect(self.read_replies)
+
+    def start(self):
+        log_dir = self.config['log_dir']
+        os.makedirs(log_dir, exist_ok=True)
+        config_path = os.path.join(log_dir, 'headless.json')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(self.config, f, ensure_ascii=False, indent=2)
+        log = open(os.path.join(log_dir, 'stdout.log'), 'a', encoding='utf-8')
+        self.process = subprocess.Popen(
+            [sys.executable, 'headless.py', '--config', config_path],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=log, stderr=subprocess.STDOUT,
+            env={**os.environ, 'PYTHONUNBUFFERED': '1'})
+        log.close()  # 子プロセスが引き継ぐ
+        print(f"ステーション {self.name} を起動しました（PID {self.process.pid}）")
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def send(self, command):
+        if self.socket.state() == QAbstractSocket.ConnectedState:
+            self.socket.write(f"{command}\n".encode('utf-8'))
+            return True
+        return False
+
+    def poll(self):
+        """状態を問い合わせる（未接続なら接続を試みる）"""
+        if not self.is_alive():
+            self.status = {}
+            return
+        if self.socket.state() == QAbstractSocket.UnconnectedState:
+            self.socket.connectToHost('127.0.0.1', self.config['control_port'])
+        else:
+            self.send('status')
+
+    def read_replies(self):
+        while self.socket.canReadLine():
+            try:
+                reply = json.loads(bytes(self.socket.readLine()).decode('utf-8'))
+            except ValueError:
+                continue
+            self.last_reply = reply
+            if 'status' in reply:
+                self.status = reply['status']
+
+    def process_state(self):
+        if self.process is None:
+            return "未起動"
+        if self.restarting:
+            return "再起動中"
+        code = self.process.poll()
+        return "実行中" if code is None else f"終了 ({code})"
+
+class StationManagerWindow(QMainWindow):
+    def __init__(self, station_configs):
+        super().__init__()
+        self.setWindowTitle(f"ステーション管理 - {len(station_configs)} ステーション")
+        self.stations = [Station(config) for config in station_configs]
+        self.closing = False
+
+        self.table = QTableWidget(len(self.stations), len(COLUMNS) + 1)
+        self.table.setHorizontalHeaderLabels(COLUMNS + ['操作'])
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.verticalHeader().setVisible(False)
+        for row, station in enumerate(self.stations):
+            buttons = QWidget()
+            layout = QHBoxLayout(buttons)
+            layout.setContentsMargins(2, 0, 2, 0)
+            for label, command in (("録画開始/停止", 'toggle'), ("マーカー", 'marker'), ("再起動", None)):
+                button = QPushButton(label)
+                if command:
+                    button.clicked.connect(lambda _, s=station, c=command: s.send(c))
+                else:
+                    button.clicked.connect(lambda _, s=station: self.restart_station(s))
+                layout.addWidget(button)
+            self.table.setCellWidget(row, len(COLUMNS), buttons)
+
+        start_all = QPushButton("全ステーション録画開始")
+        start_all.clicked.connect(lambda: [s.send('start') for s in self.stations])
+        stop_all = QPushButton("全ステーション録画停止")
+        stop_all.clicked.connect(lambda: [s.send('stop') for s in self.stations])
+        self.summary_label = QLabel()
+
+        top = QHBoxLayout()
+        top.addWidget(start_all)
+        top.addWidget(stop_all)
+        top.addStretch()
+        top.addWidget(self.summary_label)
+        central = QWidget()
+        layout = QVBoxLayout(central)
+        layout.addLayout(top)
+        layout.addWidget(self.table)
+        self.setCentralWidget(central)
+        self.resize(1100, 120 + 40 * len(self.stations))
+
+        self.poll_timer = QTimer()
+        self.poll_timer.timeout.connect(self.poll)
+        self.poll_timer.start(POLL_INTERVAL_MS)
+
+    def start_stations(self):
+        for station in self.stations:
+            station.start()
+
+    def restart_station(self, station):
+        if station.restarting:
+            return
+        if station.is_alive():
+            if QMessageBox.question(self, "確認", f"ステーション {station.name} は実行中です。停止して再起動しますか？") != QMessageBox.Yes:
+                return
+            self.request_stop(station)
+        station.restarting = True
+        self.restart_when_stopped(station, time.monotonic() + SHUTDOWN_TIMEOUT_S)
+
+    def restart_when_stopped(self, station, deadline):
+        """プロセスが終わったら起動し直す。終わっていなければ RESTART_POLL_MS 後に再確認する"""
+        if self.closing:
+            return
+        if station.is_alive():
+            if time.monotonic() < deadline:
+                QTimer.singleShot(RESTART_POLL_MS, lambda: self.restart_when_stopped(station, deadline))
+                return
+            print(f"ステーション {station.name} が終了しないため強制終了します。")
+            station.process.kill()
+            station.process.wait()
+        station.restarting = False
+        station.socket.abort()
+        station.start()
+
+    def request_stop(self, station):
+        """録画中のファイルを閉じてから終わるよう end を送る（制御ソケットが使えなければ SIGTERM）"""
+        if not station.is_alive():
+            return
+        if station.send('end'):
+            station.socket.flush()
+        else:
+            station.process.terminate()
+
+    def wait_for_exit(self, station):
+        """終了を待ち、SHUTDOWN_TIMEOUT_S 以内に終わらなければ強制終了する"""
+        if station.process is None:
+            return
+        try:
+            station.process.wait(timeout=SHUTDOWN_TIMEOUT_S)
+        except subprocess.TimeoutExpired:
+            print(f"ステーション {station.name} が終了しないため強制終了します。")
+            station.process.kill()
+            station.process.wait()
+
+    def poll(self):
+        recording = 0
+        for row, station in enumerate(self.stations):
+            station.poll()
+            status = station.status
+            recording += bool(status.get('recording'))
+            record_seconds = status.get('record_seconds') or 0
+            values = [
+                station.name,
+                station.config['pid'],
+                station.process_state(),
+                ("接続" if status.get('pico_connected') else "未接続") if status else "-",
+                ("● 録画中" if status.get('recording') else "保存中" if status.get('saving') else "待機") if status else "-",
+                str(status.get('session_number', '-')),
+                f"{int(record_seconds // 60)}:{int(record_seconds % 60):02d}" if status.get('recording') else "-",
+                str(status.get('gsr') if status.get('gsr') is not None else '-'),
+                str(status.get('online5', '-')),
+                ",".join(map(str, station.config.get('cpu_affinity') or [])) or "-",
+            ]
+            for col, value in enumerate(values):
+                item = self.table.item(row, col)
+                if item is None:
+                    item = QTableWidgetItem()
+                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                    self.table.setItem(row, col, item)
+                item.setText(value)
+                if col == 4:
+                    item.setForeground(Qt.red if status.get('recording') else Qt.black)
+            if not station.is_alive() and station.process is not None:
+                self.table.item(row, 2).setForeground(Qt.red)
+        alive = sum(s.is_alive() for s in self.stations)
+        self.summary_label.setText(f"実行中 {alive}/{len(self.stations)}、録画中 {recording}")
+
+    def closeEvent(self, event):
+        if any(s.status.get('recording') for s in self.stations):
+            if QMessageBox.question(self, "確認", "録画中のステーションがあります。全て停止して終了しますか？") != QMessageBox.Yes:
+                event.ignore()
+                return
+        print("全ステーションを停止します。")
+        self.closing = True  # 再起動待ちのステーションは起動し直さない
+        self.poll_timer.stop()
+        # 全ステーションに同時に終了を要求してから待つ
+        for station in self.stations:
+            self.request_stop(station)
+        for station in self.stations:
+            self.wait_for_exit(station)
+        super().closeEvent(event)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="1台のPCで複数ステーションを記録します")
+    parser.add_argument('--config', required=True, help="ステーション設定ファイル（JSON）")
+    parser.add_argument('--monitor', action='store_true', help="各ステーションでモニタサーバーを開く（ポート 8780〜）")
+    args, qt_args = parser.parse_known_args()
+
+    with open(args.config, encoding='utf-8') as f:
+        config = json.load(f)
+    if args.monitor:
+        config['monitor'] = True
+    station_configs = build_station_configs(config)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = StationManagerWindow(station_configs)
+    window.show()
+    QTimer.singleShot(0, window.start_stations)
+    sys.exit(app.exec())
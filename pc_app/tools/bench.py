@@ -0,0 +1,301 @@
+"""
+実機なしで計測系の性能を測るベンチマーク
+
+- Pico: 擬似端末 (pty) の片側に合成GSRを指定レートで書き込み、もう片側を PicoWorker に
+  開かせて、取り込みスループット・欠落・書き込み→スロット実行までの遅延を測る
+- カメラ: 動画ファイル（指定が無ければ合成映像を生成）を CameraWorker に読ませ、
+  達成fps・エンコード時間・CPU時間・書き込み帯域を測る
+
+結果は JSON で保存し、同じ実験PC上でリリース間の比較に使う。
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.tools.bench --rates 100 500 1000 --duration 10
+    python -m pc_app.tools.bench --skip-pico --camera-source sample.mp4
+
+Windows では pty が無いため、com0com 等の仮想COMペアを --serial-pair COM20 COM21 で指定する。
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import cv2
+import numpy as np
+from PySide6.QtCore import QCoreApplication, QObject, QTimer
+
+from pc_app.workers.pico_worker import PicoWorker
+from pc_app.workers.camera_worker import CameraWorker
+from pc_app.workers.latency import percentile
+from pc_app.workers.metrics import metrics
+
+DEFAULT_OUTPUT_DIR = "bench_results"
+
+# --- 合成GSR ---
+class SyntheticGSRGenerator(threading.Thread):
+    """
+    `GSR:<value>,<idx>,<pico_ms>` 行を一定レートで書き込むスレッド。
+    各行の書き込み時刻 (perf_counter_ns) を連番ごとに保持し、受信側で遅延を計算する。
+    """
+    def __init__(self, write, rate_hz, duration_s, drain=None):
+        super().__init__(daemon=True)
+        self.write = write
+        self.drain = drain
+        self.rate_hz = rate_hz
+        self.duration_s = duration_s
+        self.total = int(rate_hz * duration_s)
+        self.write_ns = np.zeros(self.total + 1, dtype=np.int64)
+        self.sent = 0
+
+    def value_at(self, idx):
+        # 緩やかな基線変動 + 時々の皮膚コンダクタンス反応風の山
+        t = idx / self.rate_hz
+        return int(30000 + 2000 * math.sin(t / 7.0) + 3000 * math.exp(-((t % 15) - 3) ** 2))
+
+    def run(self):
+        start = time.perf_counter()
+        while self.sent < self.total:
+            due = min(self.total, int((time.perf_counter() - start) * self.rate_hz) + 1)
+            if due > self.sent:
+                lines = []
+                for idx in range(self.sent + 1, due + 1):
+                    lines.append(f"GSR:{self.value_at(idx)},{idx},{int(idx * 1000 / self.rate_hz)}\n")
+                now = time.perf_counter_ns()
+                self.write_ns[self.sent + 1:due + 1] = now
+                self.write("".join(lines).encode())
+                self.sent = due
+            if self.drain:
+                self.drain()
+            time.sleep(0.0005)
+
+def open_pty_pair():
+    """(書き込み関数, 読み捨て関数, PicoWorkerに渡すポート名, 後始末関数)"""
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    port = os.ttyname(slave)
+    os.set_blocking(master, True)
+
+    def write(data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(master, view):]
+
+    def drain():
+        # PicoWorker が送る MODE:SERIAL などを読み捨てて端末バッファを詰まらせない
+        os.set_blocking(master, False)
+        try:
+            os.read(master, 4096)
+        except (BlockingIOError, OSError):
+            pass
+        finally:
+            os.set_blocking(master, True)
+
+    def close():
+        os.close(master)
+        os.close(slave)
+
+    return write, drain, port, close
+
+def open_serial_pair(port_a, port_b):
+    import serial
+    ser = serial.Serial(port_a, 115200, timeout=0)
+    return ser.write, ser.reset_input_buffer, port_b, ser.close
+
+class GSRReceiver(QObject):
+    """PicoWorker からのサンプルを受け取り、スロット実行時刻で遅延を記録する"""
+    def __init__(self, generator):
+        super().__init__()
+        self.generator = generator
+        self.latencies_ms = []
+        self.received = 0
+        self.last_ns = 0
+
+    def on_sample(self, value, idx, pico_ms, pc_ns):
+        now = time.perf_counter_ns()
+        self.received += 1
+        self.last_ns = now
+        if 0 < idx < len(self.generator.write_ns) and self.generator.write_ns[idx]:
+            self.latencies_ms.append((now - self.generator.write_ns[idx]) / 1e6)
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {'p50': percentile(values, 50), 'p95': percentile(values, 95),
+            'p99': percentile(values, 99), 'max': values[-1], 'mean': sum(values) / len(values)}
+
+def bench_pico(app, rate_hz, duration_s, serial_pair=None):
+    if serial_pair:
+        write, drain, port, close = open_serial_pair(*serial_pair)
+    else:
+        write, drain, port, close = open_pty_pair()
+
+    generator = SyntheticGSRGenerator(write, rate_hz, duration_s, drain=drain)
+    receiver = GSRReceiver(generator)
+    worker = PicoWorker(serial_port=port, use_keyboard_hooks=False)
+    worker.gsr_sample.connect(receiver.on_sample)
+    errors_before = metrics.counter('pico.parse_errors').value
+    gaps_before = metrics.counter('pico.seq_gaps').value
+
+    worker.start()
+    time.sleep(0.2)  # ポートが開くのを待つ
+    cpu_start = time.process_time()
+    start_ns = time.perf_counter_ns()
+    generator.start()
+
+    def poll():
+        # 全行を書き終え、受信が止まってから0.5秒で終了
+        if not generator.is_alive() and time.perf_counter_ns() - max(receiver.last_ns, start_ns) > 5e8:
+            app.quit()
+    timer = QTimer()
+    timer.timeout.connect(poll)
+    timer.start(50)
+    app.exec()
+    timer.stop()
+
+    elapsed = (receiver.last_ns - start_ns) / 1e9 if receiver.last_ns else duration_s
+    cpu = time.process_time() - cpu_start
+    worker.stop()
+    close()
+
+    return {
+        'rate_hz': rate_hz,
+        'duration_s': duration_s,
+        'sent': generator.sent,
+        'received': receiver.received,
+        'lost': generator.sent - receiver.received,
+        'throughput_hz': receiver.received / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': summarize(receiver.latencies_ms),
+        'parse_errors': metrics.counter('pico.parse_errors').value - errors_before,
+        'seq_gaps': metrics.counter('pico.seq_gaps').value - gaps_before,
+        'process_cpu_s': cpu,
+    }
+
+# --- カメラ ---
+def generate_video(path, duration_s, fps=20, width=1280, height=720):
+    """動きのある合成映像を作る（エンコード負荷が実映像に近くなるようノイズを混ぜる）"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 40, size=(height, width, 3), dtype=np.uint8)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    for i in range(int(duration_s * fps)):
+        frame[:] = (i * 3 % 255, 80, 160)
+        cv2.circle(frame, (int(width / 2 + 300 * math.sin(i / 10)), height // 2), 120, (255, 220, 200), -1)
+        cv2.add(frame, np.roll(noise, i * 7, axis=1), dst=frame)
+        writer.write(frame)
+    writer.release()
+
+def bench_camera(app, source, duration_s, work_dir):
+    save_path = os.path.join(work_dir, 'video', 'camera_bench.mp4')
+    worker = CameraWorker(source, save_path)
+    errors = []
+    worker.error.connect(errors.append)
+    frames = metrics.counter(f"camera.{source}.frames")
+    frames_before = frames.value
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    worker.start()
+    QTimer.singleShot(int(duration_s * 1000), app.quit)
+    app.exec()
+    worker.stop()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    frame_count = frames.value - frames_before
+    size = os.path.getsize(save_path) if os.path.exists(save_path) else 0
+    return {
+        'source': source,
+        'duration_s': elapsed,
+        'frames': frame_count,
+        'achieved_fps': frame_count / elapsed if elapsed > 0 else 0.0,
+        'encode_ms': metrics.histogram(f"camera.{source}.encode_ms").summary(),
+        'dropped': metrics.counter(f"camera.{source}.dropped").value,
+        'process_cpu_s': cpu,
+        'cpu_percent_of_one_core': 100.0 * cpu / elapsed if elapsed > 0 else 0.0,
+        'file_bytes': size,
+        'write_mb_per_s': size / elapsed / 1e6 if elapsed > 0 else 0.0,
+        'errors': errors,
+    }
+
+# --- 結果の保存 ---
+def environment_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'hostname': socket.gethostname(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'git_commit': commit,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="実機なしで Pico 取り込みとカメラ録画の性能を測定します")
+    parser.add_argument('--rates', type=float, nargs='+', default=[100, 500, 1000],
+                        help="合成GSRの送信レート [Hz]")
+    parser.add_argument('--duration', type=float, default=10.0, help="各測定の長さ [秒]")
+    parser.add_argument('--serial-pair', nargs=2, metavar=('WRITE_PORT', 'READ_PORT'),
+                        help="pty の代わりに使う仮想COMペア（Windows用）")
+    parser.add_argument('--camera-source', help="カメラの代わりに読む動画ファイル（省略時は合成映像を生成）")
+    parser.add_argument('--skip-pico', action='store_true')
+    parser.add_argument('--skip-camera', action='store_true')
+    parser.add_argument('--out', default=DEFAULT_OUTPUT_DIR, help="結果JSONの保存先ディレクトリ")
+    args = parser.parse_args(argv)
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    results = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment_info(),
+        'pico': [],
+        'camera': None,
+    }
+
+    if not args.skip_pico:
+        for rate in args.rates:
+            print(f"Pico取り込み: {rate:g} Hz × {args.duration:g} 秒 ...")
+            result = bench_pico(app, rate, args.duration, args.serial_pair)
+            latency = result['latency_ms']
+            print(f"  受信 {result['received']}/{result['sent']}, {result['throughput_hz']:.0f} Hz, "
+                  f"遅延 p50 {latency.get('p50', float('nan')):.2f} / p99 {latency.get('p99', float('nan')):.2f} ms")
+            results['pico'].append(result)
+
+    if not args.skip_camera:
+        with tempfile.TemporaryDirectory() as work_dir:
+            source = args.camera_source
+            if not source:
+                source = os.path.join(work_dir, 'synthetic.mp4')
+                print("合成映像を生成しています ...")
+                # CameraWorkerは約20fpsで読むため、測定時間より少し長く作る
+                generate_video(source, args.duration + 2)
+            print(f"カメラ録画: {args.duration:g} 秒 ...")
+            result = bench_camera(app, source, args.duration, work_dir)
+            print(f"  {result['achieved_fps']:.1f} fps, エンコード p95 "
+                  f"{result['encode_ms'].get('p95', float('nan')):.1f} ms, "
+                  f"CPU {result['cpu_percent_of_one_core']:.0f}%, {result['write_mb_per_s']:.2f} MB/s")
+            results['camera'] = result
+
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{socket.gethostname()}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {out_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
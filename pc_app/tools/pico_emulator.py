@@ -0,0 +1,359 @@
+"""
+仮想Pico（コントローラー）エミュレータ
+
+pico_firmware/code.py と同じ行を擬似端末 (pty) に出力し、PC側の取り込み経路を
+実機なしで負荷試験・耐久試験できるようにする。
+
+出力する行:
+    起動メッセージ / デバッグ行（"[12.34] UP PRESSED -> ..." など）
+    GSR:<value>,<seq>,<pico_ms>      (--legacy-gsr で "GSR:<value>")
+    BTN:<seq>,<pico_ms>,<mask>        ボタン状態の変化
+    MODE:SERIAL OK / MODE:HID OK      PCからのモード切替への応答
+
+シナリオファイル（1行1操作、"#" 以降はコメント、時刻は開始からの秒）:
+    0.5   press UP
+    0.7   release UP
+    1.0   tap B2 0.1             # 0.1秒押して離す
+    5.0   hold B1+B2 3.5         # 同時押し（F15相当の長押し）
+    8.0   burst 2.0 5000         # 2秒間だけ 5000 Hz で送信
+    9.0   noise 800              # GSRに振幅800のノイズを加える
+    10.0  garbage 1.0 50         # 1秒間、毎秒50行の壊れた行を混ぜる
+    12.0  disconnect 1.5         # 1.5秒切断してから再接続（ptyを作り直す。切断中のGSR行は失われ、連番が飛ぶ）
+    15.0  reset                  # Pico再起動（連番と時刻が0に戻る）
+
+同じ --seed とシナリオなら出力内容は毎回同じになる（送信時刻は実時間に従う）。
+
+使い方（リポジトリのルートで実行）:
+    python -m pc_app.tools.pico_emulator --link /tmp/pico --rate 1000 --script scenario.txt
+    python pc_app/main.py などで /tmp/pico をシリアルポートとして開く
+Windows では --serial-port で com0com 等の仮想COMペアの片側を指定する。
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+
+BUTTON_BITS = {'UP': 0, 'DOWN': 1, 'LEFT': 2, 'RIGHT': 3, 'B1': 4, 'B2': 5}
+KEYCODES = {'UP': 82, 'DOWN': 81, 'LEFT': 80, 'RIGHT': 79, 'B1': 19, 'B2': 104}
+
+BANNER = [
+    "=== CircuitPython Controller v3.2 (Serial buttons) ===",
+    "Initializing hardware...",
+    "✓ Keyboard HID initialized",
+    "✓ GSR sensor initialized on GP26",
+    "✓ LED initialized",
+    "✓ Controller ready for experiment",
+    "Starting main loop...",
+]
+
+# --- シナリオ ---
+def parse_script(path):
+    """シナリオファイルを (時刻, 操作, 引数リスト) の時刻順リストにする"""
+    events = []
+    with open(path, encoding='utf-8') as f:
+        for lineno, raw in enumerate(f, 1):
+            line = raw.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            try:
+                t = float(parts[0])
+                action = parts[1].lower()
+            except (IndexError, ValueError):
+                raise ValueError(f"{path}:{lineno}: 行を解釈できません: {raw.strip()}")
+            events.append((t, action, parts[2:]))
+            # tap/hold は押下と解放の2つに展開する
+            if action in ('tap', 'hold'):
+                duration = float(parts[3]) if len(parts) > 3 else (0.1 if action == 'tap' else 1.0)
+                events[-1] = (t, 'press', parts[2:3])
+                events.append((t + duration, 'release', parts[2:3]))
+    events.sort(key=lambda e: e[0])
+    return events
+
+# --- 接続 ---
+class PtyTransport:
+    """擬似端末。--link のシンボリックリンクで再接続後も同じパスを使えるようにする"""
+    def __init__(self, link=None):
+        self.link = link
+        self.master = None
+        self.slave = None
+        self.port = None
+
+    def open(self):
+        import pty
+        import tty
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        if self.link:
+            tmp = self.link + '.tmp'
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            os.symlink(self.port, tmp)
+            os.replace(tmp, self.link)
+        return self.link or self.port
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.master, view):]
+            except BlockingIOError:
+                # 受信側が読まずに端末バッファが一杯: 実機と同様に待つ
+                time.sleep(0.001)
+
+    def read(self):
+        try:
+            return os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return b''
+
+    def close(self):
+        # 相手側には EIO として見える（USB抜けに相当）
+        for fd in (self.master, self.slave):
+            if fd is not None:
+                os.close(fd)
+        self.master = self.slave = None
+
+class SerialTransport:
+    """仮想COMペアの片側（Windows用）"""
+    def __init__(self, port):
+        self.port = port
+        self.ser = None
+
+    def open(self):
+        import serial
+        self.ser = serial.Serial(self.port, 115200, timeout=0, write_timeout=1)
+        return self.port
+
+    def write(self, data):
+        self.ser.write(data)
+
+    def read(self):
+        return self.ser.read(4096)
+
+    def close(self):
+        if self.ser:
+            self.ser.close()
+            self.ser = None
+
+# --- エミュレータ本体 ---
+class VirtualPico:
+    def __init__(self, transport, rate_hz=10.0, noise=0.0, seed=0, legacy_gsr=False,
+                 script=None, loop_script=False, debug_lines=True):
+        self.transport = transport
+        self.base_rate = rate_hz
+        self.noise = noise
+        self.rng = random.Random(seed)
+        self.legacy_gsr = legacy_gsr
+        self.script = script or []
+        self.loop_script = loop_script
+        self.debug_lines = debug_lines
+
+        self.serial_mode = False
+        self.mask = 0
+        self.gsr_seq = 0
+        self.button_seq = 0
+        self.boot_time = 0.0
+        self.burst_until = 0.0
+        self.burst_rate = rate_hz
+        self.garbage_until = 0.0
+        self.garbage_rate = 0.0
+        self.next_garbage = 0.0
+        self.sent_lines = 0
+        # 切断中は再接続する時刻（接続中は None）
+        self.disconnected_until = None
+        self._command_buffer = b''
+
+    # --- 出力 ---
+    def pico_ms(self, t):
+        return int((t - self.boot_time) * 1000)
+
+    def emit(self, lines):
+        # 切断中の行は実機と同様に失われる
+        if lines and self.disconnected_until is None:
+            self.transport.write(("\r\n".join(lines) + "\r\n").encode('utf-8'))
+            self.sent_lines += len(lines)
+
+    def gsr_value(self, seq):
+        t = seq / max(self.base_rate, 1.0)
+        value = 30000 + 2000 * math.sin(t / 7.0) + 3000 * math.exp(-((t % 15) - 3) ** 2)
+        if self.noise:
+            value += self.rng.gauss(0, self.noise)
+        return max(0, min(65535, int(value)))
+
+    def gsr_line(self, t):
+        self.gsr_seq += 1
+        value = self.gsr_value(self.gsr_seq)
+        if self.legacy_gsr:
+            return f"GSR:{value}"
+        return f"GSR:{value},{self.gsr_seq},{self.pico_ms(t)}"
+
+    def garbage_line(self):
+        kind = self.rng.randrange(4)
+        if kind == 0:
+            return f"GSR:{self.rng.randrange(10**6)}x"
+        if kind == 1:
+            return "GSR:"
+        if kind == 2:
+            return bytes(self.rng.randrange(128, 256) for _ in range(8)).decode('latin-1')
+        return f"BTN:{self.rng.random()}"
+
+    def set_buttons(self, t, names, pressed):
+        """同時に変化したボタンは実機と同じく1つのBTN行にまとめる"""
+        lines = []
+        new_mask = self.mask
+        for name in names:
+            bit = 1 << BUTTON_BITS[name]
+            if bool(new_mask & bit) == pressed:
+                continue
+            new_mask = (new_mask | bit) if pressed else (new_mask & ~bit)
+            if self.debug_lines and not self.serial_mode:
+                action = f"PRESSED -> {KEYCODES[name]}" if pressed else "RELEASED"
+                lines.append(f"[{t - self.boot_time:.2f}] {name} {action}")
+        if new_mask != self.mask:
+            self.mask = new_mask
+            self.button_seq += 1
+            lines.insert(0, f"BTN:{self.button_seq},{self.pico_ms(t)},{self.mask}")
+        self.emit(lines)
+
+    # --- PCからのコマンド ---
+    def poll_commands(self):
+        if self.disconnected_until is not None:
+            return
+        self._command_buffer += self.transport.read()
+        while b'\n' in self._command_buffer:
+            line, self._command_buffer = self._command_buffer.split(b'\n', 1)
+            command = line.strip().decode('utf-8', 'replace')
+            if command == "MODE:SERIAL":
+                self.serial_mode = True
+                self.emit(["MODE:SERIAL OK"])
+            elif command == "MODE:HID":
+                self.serial_mode = False
+                self.emit(["MODE:HID OK"])
+
+    # --- シナリオ操作 ---
+    def apply(self, t, action, args):
+        if action in ('press', 'release'):
+            names = args[0].upper().split('+')
+            unknown = [n for n in names if n not in BUTTON_BITS]
+            if unknown:
+                raise ValueError(f"不明なボタン: {unknown}")
+            self.set_buttons(t, names, action == 'press')
+        elif action == 'burst':
+            self.burst_until = t + float(args[0])
+            self.burst_rate = float(args[1])
+        elif action == 'noise':
+            self.noise = float(args[0])
+        elif action == 'garbage':
+            self.garbage_until = t + float(args[0])
+            self.garbage_rate = float(args[1])
+            self.next_garbage = t
+        elif action == 'disconnect':
+            self.disconnect(t, float(args[0]))
+        elif action == 'reset':
+            self.reset(t)
+        elif action == 'debug':
+            self.emit([" ".join(args)])
+        else:
+            raise ValueError(f"不明な操作: {action}")
+
+    def disconnect(self, t, duration):
+        """切断する。メインループは止めず、切断中もサンプルの連番は進める（再接続後のPCには欠落として見える）"""
+        if self.disconnected_until is not None:
+            self.disconnected_until = max(self.disconnected_until, t + duration)
+            return
+        print(f"切断 ({duration:g} 秒)", file=sys.stderr)
+        self.transport.close()
+        self._command_buffer = b''
+        self.disconnected_until = t + duration
+
+    def reconnect(self):
+        self.disconnected_until = None
+        port = self.transport.open()
+        print(f"再接続: {port}", file=sys.stderr)
+        # 再接続したPCは改めて MODE:SERIAL を送る
+        self.serial_mode = False
+        self.emit(BANNER)
+
+    def reset(self, t):
+        self.boot_time = t
+        self.gsr_seq = 0
+        self.button_seq = 0
+        self.mask = 0
+        self.serial_mode = False
+        self.emit(BANNER)
+
+    # --- メインループ ---
+    def run(self, duration=None):
+        port = self.transport.open()
+        print(f"仮想Pico: {port} (GSR {self.base_rate:g} Hz)", file=sys.stderr)
+        start = time.perf_counter()
+        self.boot_time = 0.0
+        self.emit(BANNER)
+
+        script_offset = 0.0
+        script_index = 0
+        next_sample = 0.0
+        try:
+            while duration is None or time.perf_counter() - start < duration:
+                t = time.perf_counter() - start
+                if self.disconnected_until is not None and t >= self.disconnected_until:
+                    self.reconnect()
+                self.poll_commands()
+
+                while script_index < len(self.script) and self.script[script_index][0] + script_offset <= t:
+                    _, action, args = self.script[script_index]
+                    self.apply(t, action, args)
+                    script_index += 1
+                if self.loop_script and self.script and script_index >= len(self.script):
+                    script_offset = t
+                    script_index = 0
+
+                # 送信レート（バースト中は一時的に上げる）に従って期限の来たサンプルをまとめて送る
+                lines = []
+                while next_sample <= t:
+                    lines.append(self.gsr_line(next_sample))
+                    rate = self.burst_rate if next_sample < self.burst_until else self.base_rate
+                    next_sample += 1.0 / rate
+                while self.garbage_rate and self.next_garbage <= min(t, self.garbage_until):
+                    lines.append(self.garbage_line())
+                    self.next_garbage += 1.0 / self.garbage_rate
+                self.emit(lines)
+                time.sleep(0.0005)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.transport.close()
+            if getattr(self.transport, 'link', None) and os.path.lexists(self.transport.link):
+                os.remove(self.transport.link)
+        print(f"終了: {self.sent_lines} 行送信", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pico_firmware/code.py と同じ出力をする仮想Pico")
+    parser.add_argument('--link', default='/tmp/pico_emulator', help="ptyへのシンボリックリンク（PC側で開くパス）")
+    parser.add_argument('--serial-port', help="pty の代わりに使う仮想COMポート（Windows用）")
+    parser.add_argument('--rate', type=float, default=10.0, help="GSR送信レート [Hz]（実機は10Hz）")
+    parser.add_argument('--noise', type=float, default=0.0, help="GSRに加えるガウスノイズの標準偏差")
+    parser.add_argument('--seed', type=int, default=0, help="乱数シード（ノイズ・壊れた行の内容）")
+    parser.add_argument('--script', help="ボタン操作・障害注入のシナリオファイル")
+    parser.add_argument('--loop-script', action='store_true', help="シナリオを繰り返す（耐久試験用）")
+    parser.add_argument('--duration', type=float, help="実行時間 [秒]（省略時は Ctrl+C まで）")
+    parser.add_argument('--legacy-gsr', action='store_true', help='旧形式 "GSR:<value>" で送信')
+    parser.add_argument('--no-debug-lines', action='store_true', help="デバッグ行を出力しない")
+    args = parser.parse_args(argv)
+
+    transport = SerialTransport(args.serial_port) if args.serial_port else PtyTransport(args.link)
+    script = parse_script(args.script) if args.script else []
+    pico = VirtualPico(transport, rate_hz=args.rate, noise=args.noise, seed=args.seed,
+                       legacy_gsr=args.legacy_gsr, script=script, loop_script=args.loop_script,
+                       debug_lines=not args.no_debug_lines)
+    pico.run(args.duration)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import os
+import time
+import wave
+import struct
+import hashlib
+import threading
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+from .metrics import metrics
+from .integrity import file_entry
+
+class AudioRingBuffer:
+    """
+    録音コールバックとWAV書き出しスレッドの間で使う固定長リングバッファ。
+    領域は最初に確保し、以降のメモリ確保は行わない。
+    """
+    def __init__(self, capacity_frames, channels):
+        self.capacity = capacity_frames
+        self.channels = channels
+        self._data = np.zeros((capacity_frames, channels), dtype=np.int16)
+        self._lock = threading.Lock()
+        self._read_pos = 0
+        self._write_pos = 0
+        self._available = 0
+        self.overruns = 0  # 書き出しが追いつかずに捨てたフレーム数
+
+    @property
+    def available(self):
+        """書き出し待ちのフレーム数"""
+        return self._available
+
+    def write(self, frames):
+        """コールバックから呼ぶ。コピーのみ行い、溢れた分は破棄して数える"""
+        with self._lock:
+            n = min(len(frames), self.capacity - self._available)
+            if n < len(frames):
+                self.overruns += len(frames) - n
+            first = min(n, self.capacity - self._write_pos)
+            self._data[self._write_pos:self._write_pos + first] = frames[:first]
+            self._data[:n - first] = frames[first:n]
+            self._write_pos = (self._write_pos + n) % self.capacity
+            self._available += n
+
+    def read_into(self, out):
+        """out (frames, channels) に読み出し、読んだフレーム数を返す"""
+        with self._lock:
+            n = min(len(out), self._available)
+            first = min(n, self.capacity - self._read_pos)
+            out[:first] = self._data[self._read_pos:self._read_pos + first]
+            out[first:n] = self._data[:n - first]
+            self._read_pos = (self._read_pos + n) % self.capacity
+            self._available -= n
+            return n
+
+class StreamingWavWriter:
+    """
+    PCM16のWAVを逐次書き出す。一定間隔でヘッダのサイズ欄を更新してフラッシュするため、
+    プロセスが落ちても最後に更新した時点までは再生可能なファイルが残る。
+    ヘッダは書き直すため、完全性マニフェストの sha256 はヘッダ以降（PCMデータ）について逐次計算する。
+    """
+    HEADER_SIZE = 44
+
+    def __init__(self, path, sample_rate, channels, fixup_interval=1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.fixup_interval = fixup_interval
+        self.data_bytes = 0
+        self._hash = hashlib.sha256()
+        self._last_fixup = time.monotonic()
+        self._file = open(path, 'wb')
+        self._write_header()
+
+    def _header(self):
+        block_align = self.channels * 2
+        return struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + self.data_bytes, b'WAVE',
+            b'fmt ', 16, 1, self.channels, self.sample_rate,
+            self.sample_rate * block_align, block_align, 16,
+            b'data', self.data_bytes)
+
+    def _write_header(self):
+        self._file.write(self._header())
+
+    def write(self, frames):
+        """frames: (n, channels) の int16 配列（C連続）"""
+        self._file.write(frames)
+        self._hash.update(frames)
+        self.data_bytes += frames.nbytes
+        if time.monotonic() - self._last_fixup >= self.fixup_interval:
+            self.fixup_header()
+
+    def fixup_header(self):
+        """RIFF/dataチャンクのサイズ欄を現在の書き込み量で更新する"""
+        self._file.flush()
+        self._file.seek(4)
+        self._file.write(struct.pack('<I', 36 + self.data_bytes))
+        self._file.seek(40)
+        self._file.write(struct.pack('<I', self.data_bytes))
+        self._file.seek(0, os.SEEK_END)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_fixup = time.monotonic()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.fixup_header()
+        self._file.close()
+
+    def entry(self):
+        """完全性マニフェストのエントリ（close 後に呼ぶ）"""
+        return file_entry(self.path, self._hash.hexdigest(), self.HEADER_SIZE + self.data_bytes,
+                          hash_offset=self.HEADER_SIZE, head=self._header().hex(),
+                          frames=self.data_bytes // (2 * self.channels), sample_rate=self.sample_rate)
+
+class DeviceAudioSource:
+    """sounddevice による録音デバイス入力"""
+    def __init__(self, device=None):
+        self.device = device
+        self._stream = None
+
+    def start(self, sample_rate, channels, block_frames, callback):
+        import sounddevice as sd  # 音声録音を使う場合のみ必要
+
+        def _callback(indata, frames, time_info, status):
+            callback(indata)
+
+        self._stream = sd.InputStream(samplerate=sample_rate, channels=channels, dtype='int16',
+                                      blocksize=block_frames, device=self.device, callback=_callback)
+        self._stream.start()
+
+    def stop(self):
+        if self._stream:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+class FileAudioSource:
+    """
+    WAVファイルをデバイスの代わりに実時間で流す（テスト・動作確認用）。
+    ファイルのサンプルレートとチャンネル数は録音設定と一致している必要がある。
+    """
+    def __init__(self, path, realtime=True, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self._thread = None
+        self._is_running = False
+
+    def start(self, sample_rate, channels, block_frames, callback):
+        wav = wave.open(self.path, 'rb')
+        if wav.getframerate() != sample_rate or wav.getnchannels() != channels or wav.getsampwidth() != 2:
+            wav.close()
+            raise ValueError(f"音声ファイルの形式が録音設定と一致しません: {self.path}")
+        self._is_running = True
+        self._thread = threading.Thread(target=self._run, args=(wav, sample_rate, channels, block_frames, callback),
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self, wav, sample_rate, channels, block_frames, callback):
+        block_duration = block_frames / sample_rate
+        next_deadline = time.perf_counter()
+        try:
+            while self._is_running:
+                raw = wav.readframes(block_frames)
+                if not raw:
+                    if not self.loop:
+                        break
+                    wav.rewind()
+                    continue
+                callback(np.frombuffer(raw, dtype=np.int16).reshape(-1, channels))
+                if self.realtime:
+                    next_deadline += block_duration
+                    delay = next_deadline - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        finally:
+            wav.close()
+
+    def stop(self):
+        self._is_running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+class AudioRecorder(QThread):
+    """
+    音声をWAVに録音するワーカー（RTA用 audio/rta.wav, 48kHz）。
+    入力コールバックはリングバッファへのコピーのみ行い、このスレッドが一定サイズずつ
+    ファイルへ書き出す。メモリ使用量は録音時間によらず一定。
+    """
+    # 入力レベル（直近チャンクのRMS, 0.0〜1.0）
+    level = Signal(float)
+    # 録音終了（保存パス, 録音秒数）
+    finished_recording = Signal(str, float)
+    # エラーメッセージ（str）
+    error = Signal(str)
+
+    def __init__(self, save_path, source=None, sample_rate=48000, channels=1,
+                 block_ms=20, buffer_seconds=5.0, chunk_ms=100):
+        super().__init__()
+        self.save_path = save_path
+        self.source = source or DeviceAudioSource()
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_frames = int(sample_rate * block_ms / 1000)
+        self.chunk_frames = int(sample_rate * chunk_ms / 1000)
+        self.ring = AudioRingBuffer(int(sample_rate * buffer_seconds), channels)
+        self.start_ns = 0
+        # 録音終了後の完全性マニフェストのエントリ
+        self.manifest_entry = None
+        self._is_running = True
+
+    def run(self):
+        os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
+        try:
+            writer = StreamingWavWriter(self.save_path, self.sample_rate, self.channels)
+        except OSError as e:
+            self.error.emit(f"音声ファイルを作成できませんでした: {e}")
+            return
+
+        m_bytes = metrics.counter('audio.bytes')
+        m_depth = metrics.gauge('audio.ring_frames')
+        m_overruns = metrics.gauge('audio.overruns')
+        chunk = np.zeros((self.chunk_frames, self.channels), dtype=np.int16)
+        chunk_period = self.chunk_frames / self.sample_rate
+        try:
+            self.source.start(self.sample_rate, self.channels, self.block_frames, self.ring.write)
+            self.start_ns = time.perf_counter_ns()
+        except Exception as e:
+            writer.close()
+            self.manifest_entry = writer.entry()
+            self.error.emit(f"音声入力を開始できませんでした: {e}")
+            return
+
+        try:
+            while self._is_running:
+                n = self.ring.read_into(chunk)
+                m_depth.set(self.ring.available)
+                m_overruns.set(self.ring.overruns)
+                if n:
+                    writer.write(chunk[:n])
+                    m_bytes.inc(n * 2 * self.channels)
+                    rms = float(np.sqrt(np.mean(np.square(chunk[:n], dtype=np.float32)))) / 32768.0
+                    self.level.emit(rms)
+                if n < self.chunk_frames:
+                    # バッファが空になったらチャンク半分の時間だけ待つ
+                    time.sleep(chunk_period / 2)
+        finally:
+            self.source.stop()
+            # 停止後にバッファに残った分も書き出す
+            while True:
+                n = self.ring.read_into(chunk)
+                if not n:
+                    break
+                writer.write(chunk[:n])
+            writer.close()
+            self.manifest_entry = writer.entry()
+
+        duration = writer.data_bytes / (2 * self.channels * self.sample_rate)
+        if self.ring.overruns:
+            print(f"音声録音: {self.ring.overruns} フレームを取りこぼしました")
+        print(f"音声録音を終了し、ファイルを保存しました: {self.save_path} ({duration:.1f}s)")
+        self.finished_recording.emit(self.save_path, duration)
+
+    def stop(self):
+        self._is_running = False
+        self.wait()  # スレッドの終了を待機
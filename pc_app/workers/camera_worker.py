@@ -1,57 +1,471 @@
 
-import cv2
 import time
 import os
-from PySide6.QtCore import QThread, Signal
+import collections
+from PySide6.QtCore import QObject, QThread, QTimer, Signal
+from .metrics import metrics
+from .integrity import HashingFile, hash_file, file_entry
+from .preroll import PrerollBuffer
+from .sidecar import sidecar_path_for
+
+# この回数連続でフレーム取得に失敗したらカメラが外れたとみなす
+MAX_CONSECUTIVE_READ_FAILURES = 50
+# 録画設定（表情解析に適した解像度とフレームレート）
+CAMERA_WIDTH = 1280
+CAMERA_HEIGHT = 720
+CAMERA_FPS = 20
+CAMERA_FOURCC = 'mp4v'
+# モニタ配信用サムネイルの幅（ピクセル）と JPEG 品質
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_JPEG_QUALITY = 70
+# 顔ROI録画: 顔の周囲を固定サイズで切り出した映像（camera_N_face.mp4）と、縮小した全体映像（camera_N.mp4）を記録する
+FACE_STREAM_SUFFIX = '_face'
+FACE_ROI_SIZE = 384            # 切り出し映像の一辺（ピクセル）
+FACE_ROI_PADDING = 1.8         # 検出した顔の一辺に対する切り出し範囲の倍率
+FACE_DETECT_INTERVAL = 10      # 顔検出を行うフレーム間隔（約0.5秒）
+FACE_DETECT_WIDTH = 480        # 検出用に縮小する幅
+FACE_ROI_FOLLOW = 0.15         # 1フレームごとに目標位置へ近づける割合
+FACE_ROI_DEADBAND = 0.1        # 切り出し範囲の一辺に対してこれ未満のずれは追従しない（揺れ防止）
+ROI_FULL_FRAME_SCALE = 0.5     # 顔ROI録画時の全体映像の縮小率（0 で全体映像を記録しない）
+# 録画停止: この時間内にファイルを閉じ終わらないカメラはキャプチャを強制解放し、その後さらに待つ時間（秒）
+CAMERA_STOP_TIMEOUT_S = 10.0
+CAMERA_FORCE_RELEASE_GRACE_S = 3.0
+# プリロール: 待機中のフレームを JPEG で保持する（1280x720 で1枚約150KB。20fps・5秒で約15MB）
+PREROLL_JPEG_QUALITY = 90
+PREROLL_MAX_BYTES = 64 * 1024**2   # カメラ1台あたりの上限
+PREROLL_CATCHUP_FRAMES = 3         # 録画開始後、1ループで書き出すプリロールのフレーム数（新しいフレームより多くして追いつく）
+
+class FaceRoiTracker:
+    """
+    一定間隔の顔検出から、揺れを抑えた正方形の切り出し範囲を求める。
+    検出結果は目標位置として保持し、切り出し範囲はフレームごとに少しずつ近づける。
+    顔が見つからない間は直前の範囲を保つ（最初は画面中央）。
+    """
+    def __init__(self, cv2, frame_width, frame_height):
+        self.cv2 = cv2
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.cascade = cv2.CascadeClassifier(
+            os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'))
+        side = min(frame_width, frame_height)
+        # (中心x, 中心y, 一辺)
+        self.roi = [frame_width / 2, frame_height / 2, side]
+        self.target = list(self.roi)
+        self.face_found = False
+
+    def update(self, frame, frame_idx):
+        if frame_idx % FACE_DETECT_INTERVAL == 0:
+            self.detect(frame)
+        # 目標とのずれが不感帯を超える場合のみ追従する
+        side = self.roi[2]
+        if any(abs(t - r) > FACE_ROI_DEADBAND * side for t, r in zip(self.target, self.roi)):
+            self.roi = [r + FACE_ROI_FOLLOW * (t - r) for t, r in zip(self.target, self.roi)]
+
+    def detect(self, frame):
+        cv2 = self.cv2
+        scale = FACE_DETECT_WIDTH / frame.shape[1]
+        gray = cv2.cvtColor(cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY)
+        faces = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(40, 40))
+        self.face_found = len(faces) > 0
+        if not self.face_found:
+            return
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        self.target = [(x + w / 2) / scale, (y + h / 2) / scale,
+                       min(max(w, h) / scale * FACE_ROI_PADDING, self.frame_width, self.frame_height)]
+
+    def rect(self):
+        """切り出し範囲 (x, y, 一辺)。画面の内側に収める"""
+        cx, cy, side = self.roi
+        side = int(min(side, self.frame_width, self.frame_height))
+        x = int(min(max(cx - side / 2, 0), self.frame_width - side))
+        y = int(min(max(cy - side / 2, 0), self.frame_height - side))
+        return x, y, side
+
+def face_stream_path_for(video_path):
+    """session_NN/video/camera_0.mp4 -> session_NN/video/camera_0_face.mp4"""
+    stem, ext = os.path.splitext(video_path)
+    return f"{stem}{FACE_STREAM_SUFFIX}{ext}"
+
+class CameraRecording:
+    """
+    1回の録画で書き出すファイル（全体映像・顔ROI録画の切り出し映像と、それぞれの sidecar）。
+    CameraWorker のスレッドで開き、書き込み、閉じる。
+    """
+    def __init__(self, cv2, save_path, full_frame_scale=1.0, face_roi=False):
+        self.cv2 = cv2
+        self.save_path = save_path
+        self.face_path = face_stream_path_for(save_path)
+        self.frames = 0
+        fourcc = cv2.VideoWriter_fourcc(*CAMERA_FOURCC)  # 互換性の高いコーデック
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        os.makedirs(os.path.dirname(sidecar_path_for(save_path)), exist_ok=True)
+
+        self.writer = self.sidecar = None
+        self.full_size = (int(CAMERA_WIDTH * full_frame_scale) // 2 * 2, int(CAMERA_HEIGHT * full_frame_scale) // 2 * 2)
+        if full_frame_scale > 0:
+            self.writer = cv2.VideoWriter(save_path, fourcc, CAMERA_FPS, self.full_size)
+            # 各フレームの取得時刻を記録（表情解析などの後処理で時刻合わせに使用）
+            self.sidecar = HashingFile(sidecar_path_for(save_path), 'wb')
+            self.sidecar.write("frame_idx,pc_ns\n")
+        self.face_writer = self.face_sidecar = None
+        if face_roi:
+            self.face_writer = cv2.VideoWriter(self.face_path, fourcc, CAMERA_FPS, (FACE_ROI_SIZE, FACE_ROI_SIZE))
+            # 切り出し範囲は元の解像度の座標で記録する（解析で全体映像の座標に戻せるように）
+            self.face_sidecar = HashingFile(sidecar_path_for(self.face_path), 'wb')
+            self.face_sidecar.write("frame_idx,pc_ns,roi_x,roi_y,roi_size,face_found\n")
+
+    @property
+    def paths(self):
+        return [path for path, w in ((self.save_path, self.writer), (self.face_path, self.face_writer)) if w]
+
+    def write(self, frame, pc_ns, roi=None):
+        """roi は顔ROI録画の切り出し範囲 (x, y, 一辺, 顔が見つかったか)"""
+        cv2 = self.cv2
+        if self.face_writer:
+            x, y, side, face_found = roi
+            self.face_writer.write(cv2.resize(frame[y:y + side, x:x + side], (FACE_ROI_SIZE, FACE_ROI_SIZE),
+                                              interpolation=cv2.INTER_AREA))
+            self.face_sidecar.write(f"{self.frames},{pc_ns},{x},{y},{side},{int(face_found)}\n")
+        if self.writer:
+            if frame.shape[1] != self.full_size[0]:
+                self.writer.write(cv2.resize(frame, self.full_size, interpolation=cv2.INTER_AREA))
+            else:
+                self.writer.write(frame)
+            self.sidecar.write(f"{self.frames},{pc_ns}\n")
+        self.frames += 1
+
+    def close(self):
+        """ファイルを閉じ、完全性マニフェストのエントリを返す"""
+        entries = []
+        for w in (self.writer, self.face_writer):
+            if w:
+                w.release()
+        for f in (self.sidecar, self.face_sidecar):
+            if f:
+                f.close()
+                entries.append(f.entry(rows=f.lines - 1))
+        # 動画はコンテナが閉じるときに先頭側を書き直すため逐次ハッシュできない。
+        # 書き終えた直後（ページキャッシュに残っている間）にこのスレッドで計算する
+        for path in self.paths:
+            if os.path.exists(path):
+                entries.append(file_entry(path, *hash_file(path), frames=self.frames))
+        return entries
 
 class CameraWorker(QThread):
     """
     指定されたカメラデバイスから映像を録画し、ファイルに保存するワーカー。
+
+    save_path を指定せずに開始すると「待機（アーム）」状態になり、カメラを開いて設定し、フレームを
+    読み続ける（プレビューとサムネイルには使い、保存はしない）。start_recording() はフラグを立てるだけで、
+    次のフレームから書き込む。stop_recording() でファイルを閉じて待機に戻る。
+
+    preroll_seconds を指定すると、待機中の直近のフレームを JPEG でリングバッファに保持し、録画開始時に
+    ファイルの先頭に書く（sidecar の pc_ns は取得時刻のまま）。プリロール分は数フレームずつ書き出し、
+    追いつくまでは新しいフレームも同じ順番待ちに入れる。recording_started の時刻は録画開始後の最初の
+    フレームのもので、プリロールの先頭の時刻は別の引数で渡す（プリロールの時刻は record_start より前のため、
+    それで camera_record_start を記録すると events.jsonl の時刻順が崩れる）。
     """
     finished = Signal()
     error = Signal(str)
+    # モニタ用サムネイル（カメラ番号, JPEG）。thumbnail_interval 秒ごと
+    thumbnail_ready = Signal(int, bytes)
+    # フレームプールのスロットを共有した（スロット番号, 取得時刻 pc_ns）。受け取った側が release する
+    frame_shared = Signal(int, "qint64")
+    # カメラを開いて設定し終えた（カメラ番号）
+    armed = Signal(int)
+    # 録画開始後の最初のフレームを受け取った
+    # （カメラ番号, そのフレームの取得時刻 pc_ns, プリロールの先頭フレームの取得時刻 pc_ns, プリロールのフレーム数）
+    recording_started = Signal(int, "qint64", "qint64", int)
+    # 録画のファイルを閉じた（カメラ番号）。manifest_entries はこの時点で揃っている
+    recording_stopped = Signal(int)
 
-    def __init__(self, camera_index, save_path):
+    def __init__(self, camera_index, save_path=None, thumbnail_interval=0, frame_pool=None,
+                 face_roi=False, full_frame_scale=ROI_FULL_FRAME_SCALE, preroll_seconds=0):
         super().__init__()
         self.camera_index = camera_index
         self.save_path = save_path
+        self.thumbnail_interval = thumbnail_interval
+        # フレームを共有メモリのプール（frame_pool.FramePool）に直接読み込む。
+        # share_interval 秒ごとに frame_shared でスロットを渡す（0 なら共有しない）
+        self.frame_pool = frame_pool
+        self.share_interval = 0
+        # 顔ROI録画（full_frame_scale は顔ROI録画時の全体映像の縮小率。0 なら全体映像を記録しない）
+        self.face_roi = face_roi
+        self.full_frame_scale = full_frame_scale if face_roi else 1.0
+        self.preroll = PrerollBuffer(f"camera.{camera_index}", preroll_seconds, PREROLL_MAX_BYTES)
+        # 直近の録画の完全性マニフェストのエントリ（動画と sidecar）
+        self.manifest_entries = []
+        self.is_recording = False
+        self._cap = None
         self._is_running = True
+        # 録画の開始/停止の要求（GUIスレッドが設定し、このスレッドが次のフレームの前に処理する）
+        self._record_path = save_path
+        self._record_requested_at = time.perf_counter()
+        self._stop_record_requested = False
+
+        # メトリクス
+        prefix = f"camera.{camera_index}"
+        self._m_frames = metrics.counter(f"{prefix}.frames")
+        self._m_dropped = metrics.counter(f"{prefix}.dropped")
+        self._m_encode_ms = metrics.histogram(f"{prefix}.encode_ms")
+        self._m_fps = metrics.gauge(f"{prefix}.fps")
+        self._m_file_bytes = metrics.gauge(f"{prefix}.file_bytes")
+        self._m_arm_ms = metrics.gauge(f"{prefix}.arm_ms")
+        self._m_record_start_ms = metrics.gauge(f"{prefix}.record_start_ms")
+
+    def start_recording(self, save_path):
+        """次のフレームから save_path への録画を始める（待機中のワーカーに対して呼ぶ）"""
+        self.save_path = save_path
+        self._stop_record_requested = False
+        self._record_requested_at = time.perf_counter()
+        self._record_path = save_path
+
+    def stop_recording(self):
+        """録画のファイルを閉じて待機に戻るよう要求してすぐに戻る（完了は recording_stopped で通知する）"""
+        self._record_path = None
+        self._stop_record_requested = True
 
     def run(self):
-        cap = cv2.VideoCapture(self.camera_index)
+        import cv2  # OpenCV は録画開始時に読み込む（アプリの起動を遅くしない）
+        opened_at = time.perf_counter()
+        cap = self._cap = cv2.VideoCapture(self.camera_index)
         if not cap.isOpened():
             self.error.emit(f"カメラ {self.camera_index} を開けませんでした。")
             return
 
         # カメラ設定（表情解析に適した解像度）
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        cap.set(cv2.CAP_PROP_FPS, 20)  # 表情解析に必要な滑らかさを保持
-        
-        # ビデオのコーデックとフォーマットを定義（Windows互換性向上）
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # 互換性の高いコーデック
-        fps = 20  # 表情解析に適したフレームレート
-        width = 1280  # HD解像度で表情の詳細をキャプチャ
-        height = 720
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_WIDTH)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_HEIGHT)
+        cap.set(cv2.CAP_PROP_FPS, CAMERA_FPS)  # 表情解析に必要な滑らかさを保持
+        self._m_arm_ms.set((time.perf_counter() - opened_at) * 1000)
 
-        # 保存先ディレクトリの確認
-        os.makedirs(os.path.dirname(self.save_path), exist_ok=True)
-
-        writer = cv2.VideoWriter(self.save_path, fourcc, fps, (width, height))
+        roi_tracker = FaceRoiTracker(cv2, CAMERA_WIDTH, CAMERA_HEIGHT) if self.face_roi else None
+        recording = None
+        # 録画開始時に取り出したプリロールと、それに追いつくまでの新しいフレーム（JPEG, 切り出し範囲）
+        backlog = collections.deque()
+        frame_idx = 0
+        consecutive_failures = 0
+        fps_window_start = time.perf_counter()
+        fps_window_frames = 0
+        last_thumbnail = 0.0
+        last_shared = 0.0
+        first_frame = True
 
         while self._is_running:
-            ret, frame = cap.read()
+            # 録画の停止/開始の要求はフレームの合間に処理する
+            if self._stop_record_requested:
+                if recording:
+                    self._write_backlog(cv2, recording, backlog)
+                self._close_recording(recording)
+                recording = None
+            if recording is None and self._record_path:
+                recording = CameraRecording(cv2, self._record_path, self.full_frame_scale, self.face_roi)
+                self.is_recording = True
+                preroll_bytes = self.preroll.bytes
+                backlog.extend(self.preroll.drain())
+                if backlog:
+                    print(f"カメラ {self.camera_index}: プリロール {len(backlog)} フレーム"
+                          f"（{(time.perf_counter_ns() - backlog[0][0]) / 1e9:.1f} 秒, {preroll_bytes / 1024**2:.1f} MB）")
+
+            # プールに空きがあればスロットへ直接読み込む（無ければ通常どおり。録画は止めない）
+            slot = self.frame_pool.acquire() if self.frame_pool else None
+            if slot is not None:
+                ret, frame = cap.read(self.frame_pool.view(slot))
+                if ret and frame.ctypes.data != self.frame_pool.view(slot).ctypes.data:
+                    # 解像度がプールと異なり OpenCV が別の配列を確保した
+                    print(f"カメラ {self.camera_index}: フレームサイズ {frame.shape} がプールと異なるため共有しません。")
+                    self.frame_pool.release(slot)
+                    self.frame_pool = slot = None
+            else:
+                ret, frame = cap.read()
             if not ret:
-                break
-            writer.write(frame)
+                if slot is not None:
+                    self.frame_pool.release(slot)
+                # 一時的な取得失敗は数えて再試行し、続く場合のみ終了する
+                self._m_dropped.inc()
+                consecutive_failures += 1
+                if consecutive_failures >= MAX_CONSECUTIVE_READ_FAILURES:
+                    self.error.emit(f"カメラ {self.camera_index} からフレームを取得できなくなりました。")
+                    break
+                self.msleep(10)
+                continue
+            consecutive_failures = 0
+            pc_ns = time.perf_counter_ns()
+            if first_frame:
+                first_frame = False
+                print(f"カメラ {self.camera_index} を準備しました（{(time.perf_counter() - opened_at) * 1000:.0f} ms）")
+                self.armed.emit(self.camera_index)
+            roi = None
+            if roi_tracker:
+                roi_tracker.update(frame, frame_idx)
+                roi = roi_tracker.rect() + (roi_tracker.face_found,)
+            if recording:
+                if recording.frames == 0:
+                    self._m_record_start_ms.set((time.perf_counter() - self._record_requested_at) * 1000)
+                    self.recording_started.emit(self.camera_index, pc_ns, backlog[0][0] if backlog else pc_ns, len(backlog))
+                if backlog:
+                    # プリロールを書き終えるまでは順番を保つため新しいフレームも後ろに並べる
+                    backlog.append((pc_ns, self._encode_preroll(cv2, frame, roi)))
+                    self._write_backlog(cv2, recording, backlog, PREROLL_CATCHUP_FRAMES)
+                else:
+                    recording.write(frame, pc_ns, roi)
+                self._m_encode_ms.observe((time.perf_counter_ns() - pc_ns) / 1e6)
+            elif self.preroll.seconds:
+                item = self._encode_preroll(cv2, frame, roi)
+                self.preroll.append(pc_ns, item, item[0].nbytes)
+            if slot is not None:
+                if self.share_interval and time.perf_counter() - last_shared >= self.share_interval:
+                    last_shared = time.perf_counter()
+                    self.frame_pool.set_meta(slot, frame_idx, pc_ns)
+                    self.frame_pool.retain(slot)
+                    self.frame_shared.emit(slot, pc_ns)
+                self.frame_pool.release(slot)
+            frame_idx += 1
+            self._m_frames.inc()
+
+            # モニタ用サムネイル（縮小して JPEG にする。間隔が長いので負荷は小さい）
+            if self.thumbnail_interval and time.perf_counter() - last_thumbnail >= self.thumbnail_interval:
+                last_thumbnail = time.perf_counter()
+                h, w = frame.shape[:2]
+                small = cv2.resize(frame, (THUMBNAIL_WIDTH, h * THUMBNAIL_WIDTH // w), interpolation=cv2.INTER_AREA)
+                ok, jpeg = cv2.imencode('.jpg', small, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_JPEG_QUALITY])
+                if ok:
+                    self.thumbnail_ready.emit(self.camera_index, jpeg.tobytes())
+
+            # 達成fpsとファイルサイズは1秒ごとに更新
+            fps_window_frames += 1
+            elapsed = time.perf_counter() - fps_window_start
+            if elapsed >= 1.0:
+                self._m_fps.set(fps_window_frames / elapsed)
+                if recording:
+                    self._m_file_bytes.set(sum(os.path.getsize(p) for p in recording.paths if os.path.exists(p)))
+                fps_window_start = time.perf_counter()
+                fps_window_frames = 0
             # フレームレート制御（表情解析に適したタイミング）
             self.msleep(50)  # 約20FPSに相当
-        
-        print(f"カメラ {self.camera_index} の録画を終了し、ファイルを保存しました: {self.save_path}")
+
         cap.release()
-        writer.release()
+        if recording:
+            self._write_backlog(cv2, recording, backlog)
+            self._close_recording(recording)
         self.finished.emit()
 
-    def stop(self):
+    @staticmethod
+    def _encode_preroll(cv2, frame, roi):
+        ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, PREROLL_JPEG_QUALITY])
+        return jpeg, roi
+
+    @staticmethod
+    def _write_backlog(cv2, recording, backlog, limit=None):
+        """順番待ちのフレームを limit 枚（None なら全部。停止時に書き残さないため）書き出す"""
+        count = len(backlog) if limit is None else min(limit, len(backlog))
+        for _ in range(count):
+            pc_ns, (jpeg, roi) = backlog.popleft()
+            recording.write(cv2.imdecode(jpeg, cv2.IMREAD_COLOR), pc_ns, roi)
+
+    def _close_recording(self, recording):
+        """録画のファイルを閉じて recording_stopped を送る（録画していなければ通知のみ）"""
+        self.manifest_entries = []
+        if recording:
+            print(f"カメラ {self.camera_index} の録画を終了し、ファイルを保存しました: {', '.join(recording.paths)}")
+            self.manifest_entries = recording.close()
+        self.is_recording = False
+        self._stop_record_requested = False
+        self.recording_stopped.emit(self.camera_index)
+
+    def request_stop(self):
+        """停止を要求してすぐに戻る（ファイルはこのワーカーのスレッドで閉じ、終了は finished で通知する）"""
         self._is_running = False
+
+    def force_release(self):
+        """cap.read() が戻らない場合に、別のスレッドからキャプチャを解放して読み込みを中断させる"""
+        if self._cap is not None:
+            print(f"カメラ {self.camera_index} が応答しないため、キャプチャを強制的に解放します。")
+            self._cap.release()
+
+    def stop(self):
+        self.request_stop()
         self.wait()  # スレッドの終了を待機
+
+class CameraShutdown(QObject):
+    """
+    複数のカメラワーカーの録画を並列に止める。全ワーカーへ同時に要求し、各ワーカーが自分のスレッドで
+    ファイルを閉じるため、停止にかかる時間はカメラごとの時間の最大値になる。呼び出し側（GUIスレッド）は
+    待たずに戻り、カメラごとの完了を camera_stopped、全体の完了を all_stopped で受け取る。
+    disarm=False なら録画だけを止めてカメラは待機状態に残し、True ならスレッドも終了させる。
+
+    timeout 秒以内に終わらないワーカーはキャプチャを強制解放して終了させ、さらに grace 秒待っても終わらなければ
+    'abandoned' として報告する（スレッドは終わるまで残るため、フレームプールなどは解放しないこと）。
+    """
+    # カメラ番号, 停止要求からの秒数, 状態（'ok' | 'forced' | 'abandoned'）
+    camera_stopped = Signal(int, float, str)
+    # 全カメラの結果 [{'camera', 'seconds', 'state'}, ...]
+    all_stopped = Signal(list)
+
+    def __init__(self, workers, disarm=True, timeout=CAMERA_STOP_TIMEOUT_S, grace=CAMERA_FORCE_RELEASE_GRACE_S,
+                 parent=None):
+        super().__init__(parent)
+        self.workers = list(workers)
+        self.disarm = disarm
+        self.timeout = timeout
+        self.grace = grace
+        self.pending = list(self.workers)
+        self.forced = []
+        self.results = []
+        self.started_at = 0.0
+        # 待機中のワーカーは次の録画でも使うため、終わったら接続を外す
+        self.connections = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.handle_timeout)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for worker in self.workers:
+            # QThread 自体の finished も同じ名前で届くため、handle_finished は2回呼ばれてもよいようにしてある
+            self.connect_worker(worker.finished, lambda w=worker: self.handle_finished(w))
+            if self.disarm:
+                worker.request_stop()
+            else:
+                self.connect_worker(worker.recording_stopped, lambda _, w=worker: self.handle_finished(w))
+                worker.stop_recording()
+        for worker in self.workers:
+            if not worker.isRunning():
+                self.handle_finished(worker)
+        if self.pending:
+            self.timer.start(int(self.timeout * 1000))
+        elif not self.workers:
+            # カメラが無い場合も停止の完了を通知する（マニフェストの書き出しや終了処理が止まらないように）
+            self.all_stopped.emit([])
+
+    def connect_worker(self, signal, slot):
+        signal.connect(slot)
+        self.connections.append((signal, slot))
+
+    def handle_finished(self, worker, state=None):
+        if worker not in self.pending:
+            return
+        self.pending.remove(worker)
+        seconds = time.perf_counter() - self.started_at
+        state = state or ('forced' if worker in self.forced else 'ok')
+        self.results.append({'camera': worker.camera_index, 'seconds': round(seconds, 3), 'state': state})
+        self.camera_stopped.emit(worker.camera_index, seconds, state)
+        if not self.pending:
+            self.timer.stop()
+            for signal, slot in self.connections:
+                signal.disconnect(slot)
+            self.connections = []
+            self.all_stopped.emit(self.results)
+
+    def handle_timeout(self):
+        if not self.forced:
+            self.forced = list(self.pending)
+            for worker in self.forced:
+                worker.request_stop()
+                worker.force_release()
+            self.timer.start(int(self.grace * 1000))
+            return
+        for worker in list(self.pending):
+            print(f"カメラ {worker.camera_index} のスレッドが終了しません。ファイルが壊れている可能性があります。")
+            self.handle_finished(worker, 'abandoned')
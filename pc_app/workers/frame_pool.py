@@ -0,0 +1,132 @@
+"""
+共有メモリ上のフレームプール（取得・エンコード・プレビュー間のゼロコピー受け渡し）
+
+1280x720 の BGR フレームは約2.7MBあり、スレッドやプロセスの間でコピーや pickle をすると負荷が大きい。
+FramePool は固定数のスロットを multiprocessing.shared_memory 上に確保し、利用者の間では
+スロット番号だけを受け渡す。各スロットは参照カウントを持ち、最後の利用者が release したときに
+空きに戻る。スロットの numpy ビューは最初に作って使い回すため、フレームごとのメモリ確保は無い。
+
+    pool = FramePool(slots=8)                 # 取得側（所有者）
+    slot = pool.acquire()                     # 空きスロット（参照1）。空きが無ければ None
+    cap.read(pool.view(slot))                 # カメラから直接スロットへ読み込む
+    pool.set_meta(slot, frame_idx, pc_ns)
+    pool.retain(slot)                         # プレビューにも渡す（参照2）
+    ... スロット番号を渡す ...
+    pool.release(slot)                        # 各利用者が使い終わったら呼ぶ
+
+別プロセスからは FramePool.attach(pool.spec()) で同じプールを開く（spec はプロセス生成時の引数で渡す。
+ロックを含むため Queue では送れない）。所有者は最後に close() と unlink() を呼ぶ。
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .metrics import metrics
+
+# 既定のフレーム形状（camera_worker の CAMERA_HEIGHT, CAMERA_WIDTH と同じ）
+DEFAULT_SHAPE = (720, 1280, 3)
+# 先頭の管理領域（参照カウント・フレーム番号・取得時刻）の後、フレーム領域をこの境界に揃える
+FRAME_ALIGN = 64
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+class FramePool:
+    def __init__(self, slots=8, shape=DEFAULT_SHAPE, dtype=np.uint8, name=None, lock=None, create=True):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        # 管理領域: 参照カウント(int32) / フレーム番号(int64) / 取得時刻 pc_ns(int64)
+        meta_offset = _align(4 * slots, 8)
+        frames_offset = _align(meta_offset + 16 * slots, FRAME_ALIGN)
+        self.frame_stride = _align(self.frame_bytes, FRAME_ALIGN)
+        size = frames_offset + self.frame_stride * slots
+        self.owner = create
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            # attach するのは spec（ロック）を受け取った子プロセスのみで、子プロセスは所有者の
+            # resource_tracker を引き継ぐため、追跡の登録は所有者の unlink でまとめて外れる
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.lock = lock or multiprocessing.Lock()
+
+        buf = self.shm.buf
+        self._refs = np.ndarray((slots,), dtype=np.int32, buffer=buf, offset=0)
+        self._meta = np.ndarray((slots, 2), dtype=np.int64, buffer=buf, offset=meta_offset)
+        # スロットごとのビュー（使い回す）
+        self._views = [np.ndarray(self.shape, dtype=self.dtype, buffer=buf,
+                                  offset=frames_offset + i * self.frame_stride) for i in range(slots)]
+        if create:
+            self._refs[:] = 0
+            self._meta[:] = -1
+        self._next = 0
+        self._m_exhausted = metrics.counter('frame_pool.exhausted')
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def spec(self):
+        """別プロセスで attach するための情報"""
+        return {'name': self.shm.name, 'slots': self.slots, 'shape': self.shape,
+                'dtype': self.dtype.str, 'lock': self.lock}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(slots=spec['slots'], shape=spec['shape'], dtype=spec['dtype'], name=spec['name'],
+                   lock=spec['lock'], create=False)
+
+    # --- スロットの受け渡し ---
+    def acquire(self):
+        """空きスロットを参照1で確保して番号を返す。全スロットが使用中なら None"""
+        with self.lock:
+            for i in range(self.slots):
+                slot = (self._next + i) % self.slots
+                if self._refs[slot] == 0:
+                    self._refs[slot] = 1
+                    self._next = (slot + 1) % self.slots
+                    return slot
+        self._m_exhausted.inc()
+        return None
+
+    def retain(self, slot, count=1):
+        """利用者を count 人追加する（スロット番号を渡す前に呼ぶ）"""
+        with self.lock:
+            if self._refs[slot] <= 0:
+                raise ValueError(f"スロット {slot} は確保されていません")
+            self._refs[slot] += count
+
+    def release(self, slot):
+        with self.lock:
+            if self._refs[slot] <= 0:
+                raise ValueError(f"スロット {slot} は既に解放されています")
+            self._refs[slot] -= 1
+
+    def view(self, slot):
+        """スロットのフレーム（共有メモリへの numpy ビュー。コピーしない）"""
+        return self._views[slot]
+
+    def set_meta(self, slot, frame_idx, pc_ns):
+        self._meta[slot, 0] = frame_idx
+        self._meta[slot, 1] = pc_ns
+
+    def meta(self, slot):
+        """(フレーム番号, 取得時刻 pc_ns)"""
+        return int(self._meta[slot, 0]), int(self._meta[slot, 1])
+
+    def in_use(self):
+        with self.lock:
+            return int(np.count_nonzero(self._refs))
+
+    # --- 終了処理 ---
+    def close(self):
+        # ビューが残っていると共有メモリを閉じられないため先に破棄する
+        self._views = []
+        self._refs = self._meta = None
+        self.shm.close()
+
+    def unlink(self):
+        if self.owner:
+            self.shm.unlink()
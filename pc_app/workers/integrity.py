@@ -0,0 +1,127 @@
+"""
+記録ファイルの完全性マニフェスト（meta/manifest.json）
+
+各ファイルの書き込み時に sha256 を逐次計算し、録画停止時にサイズ・ハッシュ・サンプル数/フレーム数を
+セッションの meta/manifest.json にまとめる。データを別の場所へコピーした後は、各ファイルを1回読むだけで
+検証できる（python -m pc_app.analysis.verify_manifest）。
+
+    f = HashingFile(path)                       # 書き込みながらハッシュを計算する
+    f.write("frame_idx,pc_ns\\n")
+    f.close()
+    manifest = SessionManifest(session_dir)
+    manifest.add(f.entry(rows=f.lines - 1))
+    manifest.write()
+
+エントリの sha256 は通常ファイル全体のハッシュ。hash_offset がある場合は、先頭 hash_offset バイトを
+head（16進）にそのまま記録し、sha256 はそれ以降のハッシュとする（WAV のようにヘッダを最後に書き直すファイル用）。
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+# セッションディレクトリからのマニフェストの位置
+MANIFEST_PATH = os.path.join('meta', 'manifest.json')
+MANIFEST_VERSION = 1
+HASH_ALGORITHM = 'sha256'
+# 書き終えたファイルを読み直してハッシュを計算するときの読み込み単位
+HASH_CHUNK_BYTES = 1024 * 1024
+
+class HashingFile:
+    """
+    書き込んだバイト列の sha256・バイト数・行数を数えるファイル。
+    文字列は UTF-8 で書き込む（改行は変換しないため、どのOSでも LF になる）。
+    """
+    def __init__(self, path, mode='ab'):
+        self.path = path
+        self._hash = hashlib.sha256()
+        self.bytes = 0
+        self.lines = 0
+        if 'a' in mode and os.path.exists(path) and os.path.getsize(path):
+            # 既存のファイルに追記する場合は、先に既存部分をハッシュに含める
+            digest, self.bytes, self.lines = _hash_existing(path)
+            self._hash = digest
+        self._file = open(path, mode)
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._file.write(data)
+        self._hash.update(data)
+        self.bytes += len(data)
+        self.lines += data.count(b'\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def entry(self, **counts):
+        """マニフェストのエントリ（counts には rows・frames などのサンプル数を渡す）"""
+        return file_entry(self.path, self.hexdigest(), self.bytes, **counts)
+
+def _hash_existing(path):
+    digest = hashlib.sha256()
+    size = lines = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+    return digest, size, lines
+
+def hash_file(path):
+    """書き終えたファイルの (sha256, バイト数) を求める（逐次計算できないファイル用）"""
+    digest, size, _ = _hash_existing(path)
+    return digest.hexdigest(), size
+
+def file_entry(path, sha256, size, **counts):
+    entry = {'path': path, 'bytes': size, HASH_ALGORITHM: sha256}
+    entry.update(counts)
+    return entry
+
+class SessionManifest:
+    """セッション内の各ワーカーから受け取ったエントリをまとめて meta/manifest.json に書き出す"""
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, entry):
+        """エントリを追加する（同じファイルは後から追加したものを使う）。path はセッションからの相対パスにする"""
+        entry = dict(entry)
+        entry['path'] = os.path.relpath(entry['path'], self.session_dir).replace(os.sep, '/')
+        with self._lock:
+            self._entries[entry['path']] = entry
+
+    def add_all(self, entries):
+        for entry in entries:
+            self.add(entry)
+
+    def write(self):
+        """マニフェストを書き出してパスを返す（途中で落ちても壊れたファイルが残らないよう置き換える）"""
+        path = os.path.join(self.session_dir, MANIFEST_PATH)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            files = [self._entries[key] for key in sorted(self._entries)]
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'algorithm': HASH_ALGORITHM,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'files': files,
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        print(f"マニフェストを保存しました: {path}（{len(files)} ファイル）")
+        return path
@@ -0,0 +1,150 @@
+"""
+入力遅延の計測（レバー操作 → AVPlot の再描画完了）
+
+1回の入力を次の段階で追跡し、区間ごとの遅延分布 (p50/p95/p99) を集計する。
+
+    firmware : Pico がボタン変化を検出した時刻（BTN行の pico_ms）
+    arrival  : PC がシリアル行（またはキーボードフック）を受け取った時刻
+    emit     : PicoWorker が av_changed を emit した時刻
+    slot     : GUIスレッドで handle_av_change が実行された時刻
+    paint    : AVPlot の描画が完了した時刻
+
+表示の更新で点が動かなかった入力（±最大値でのレバー操作など）は再描画が起きないため、
+paint を待たずに捨てる（後の無関係な描画の時刻を付けて遅延を大きく見積もらないように）。
+
+Pico と PC の時計は同期していないため、firmware→arrival は「BTN行の
+(arrival - pico_ms) の直近最小値」を基準にした相対値になる（最小の伝送遅延は0とみなす）。
+PC側の区間 (arrival→paint) は同じ perf_counter_ns() で測るため絶対値として扱える。
+"""
+
+import time
+import threading
+from collections import deque
+
+# 集計する区間（名前, 開始段階, 終了段階）
+SEGMENTS = [
+    ('firmware→arrival', 'firmware', 'arrival'),
+    ('arrival→emit', 'arrival', 'emit'),
+    ('emit→slot', 'emit', 'slot'),
+    ('slot→paint', 'slot', 'paint'),
+    ('arrival→paint', 'arrival', 'paint'),
+    ('firmware→paint', 'firmware', 'paint'),
+]
+
+def percentile(sorted_values, p):
+    """ソート済みリストの p パーセンタイル（線形補間）"""
+    if not sorted_values:
+        return float('nan')
+    k = (len(sorted_values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+class LatencyTracker:
+    """
+    入力ごとのタイムスタンプを段階的に記録するトラッカー。
+    av_changed のキュー接続は発行順に処理されるため、slot は最古の未処理入力に対応させる。
+    AVPlot の1回の描画で複数の入力が反映されることがあり、その場合は全てに同じ paint 時刻を付ける。
+    """
+    def __init__(self, window=2000, offset_window=256):
+        self._lock = threading.Lock()
+        self._awaiting_slot = deque(maxlen=256)
+        # slot 済みで AVPlot の表示更新を待つ入力と、表示を更新して描画を待つ入力
+        self._awaiting_display = []
+        self._awaiting_paint = []
+        # 点が動かず計測から除いた入力の数
+        self.discarded = 0
+        self._offsets = deque(maxlen=offset_window)
+        self.samples = {name: deque(maxlen=window) for name, _, _ in SEGMENTS}
+        self.count = 0
+        self.enabled = True
+
+    # --- Pico時刻とPC時刻の対応 ---
+    def observe_clock(self, pico_ms, arrival_ns):
+        """BTN行を受信するたびに呼ぶ。直近の最小差を時計オフセットとして使う"""
+        with self._lock:
+            self._offsets.append(arrival_ns - pico_ms * 1_000_000)
+
+    def _pico_to_pc_ns(self, pico_ms):
+        if pico_ms is None or not self._offsets:
+            return None
+        return pico_ms * 1_000_000 + min(self._offsets)
+
+    # --- 各段階の記録 ---
+    def input_emitted(self, pico_ms=None, arrival_ns=None):
+        """av_changed を emit する直前に PicoWorker のスレッドから呼ぶ"""
+        if not self.enabled:
+            return
+        emit_ns = time.perf_counter_ns()
+        with self._lock:
+            self._awaiting_slot.append({
+                'firmware': self._pico_to_pc_ns(pico_ms),
+                'arrival': arrival_ns if arrival_ns is not None else emit_ns,
+                'emit': emit_ns,
+            })
+
+    def slot_executed(self):
+        """av_changed のスロット先頭で GUI スレッドから呼ぶ"""
+        if not self.enabled:
+            return
+        slot_ns = time.perf_counter_ns()
+        with self._lock:
+            if self._awaiting_slot:
+                trace = self._awaiting_slot.popleft()
+                trace['slot'] = slot_ns
+                self._awaiting_display.append(trace)
+
+    def displayed(self, changed):
+        """AVPlot が点の位置を更新するときに GUI スレッドから呼ぶ（changed: 点が動いて再描画されるか）"""
+        if not self._awaiting_display:
+            return
+        with self._lock:
+            traces, self._awaiting_display = self._awaiting_display, []
+            if changed:
+                self._awaiting_paint.extend(traces)
+            else:
+                self.discarded += len(traces)
+
+    def painted(self):
+        """AVPlot の paintEvent 完了時に GUI スレッドから呼ぶ"""
+        if not self._awaiting_paint:
+            return
+        paint_ns = time.perf_counter_ns()
+        with self._lock:
+            traces, self._awaiting_paint = self._awaiting_paint, []
+            for trace in traces:
+                trace['paint'] = paint_ns
+                for name, start, end in SEGMENTS:
+                    if trace.get(start) is not None:
+                        self.samples[name].append((trace[end] - trace[start]) / 1e6)
+                self.count += 1
+
+    # --- 集計 ---
+    def summary(self):
+        """{区間名: {'n', 'p50', 'p95', 'p99', 'max'}}（単位 ms）"""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self.samples.items()}
+        result = {}
+        for name, values in snapshot.items():
+            if not values:
+                continue
+            result[name] = {
+                'n': len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+                'max': values[-1],
+            }
+        return result
+
+    def format_summary(self, segments=None):
+        lines = []
+        for name, stats in self.summary().items():
+            if segments and name not in segments:
+                continue
+            lines.append(f"{name}: p50 {stats['p50']:.1f} / p95 {stats['p95']:.1f} / "
+                         f"p99 {stats['p99']:.1f} ms (n={stats['n']})")
+        return "\n".join(lines)
+
+# アプリ全体で共有するトラッカー
+input_latency = LatencyTracker()
@@ -0,0 +1,132 @@
+"""
+ワーカーの稼働状況メトリクス（カウンタ・ゲージ・ヒストグラム）
+
+各ワーカーは共有の `metrics` レジストリに値を記録し、GUIのステータスパネルと
+MetricsSnapshotWriter（logs/metrics.jsonl への定期書き出し）がそれを読む。
+記録側の処理は加算・代入・固定長dequeへの追加のみなので、数百Hz程度の頻度では
+CPU負荷は無視できる。`metrics.enabled = False` で記録自体を止められる。
+"""
+
+import json
+import time
+import threading
+from collections import deque
+
+from .latency import percentile
+
+class Counter:
+    """単調増加する値（サンプル数・エラー数・書き込みバイト数など）"""
+    def __init__(self, registry):
+        self._registry = registry
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self.value += amount
+
+class Gauge:
+    """現在値（キュー長・達成fpsなど）"""
+    def __init__(self, registry):
+        self._registry = registry
+        self.value = 0.0
+
+    def set(self, value):
+        if self._registry.enabled:
+            self.value = value
+
+class Histogram:
+    """直近の観測値から分位点を求める（固定長のリングで保持）"""
+    def __init__(self, registry, window=1024):
+        self._registry = registry
+        self._values = deque(maxlen=window)
+        self.count = 0
+
+    def observe(self, value):
+        if not self._registry.enabled:
+            return
+        self._values.append(value)
+        self.count += 1
+
+    def summary(self):
+        values = sorted(self._values)
+        if not values:
+            return {'count': self.count}
+        return {
+            'count': self.count,
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': values[-1],
+        }
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def _get(self, table, name, factory):
+        metric = table.get(name)
+        if metric is None:
+            with self._lock:
+                metric = table.setdefault(name, factory())
+        return metric
+
+    def counter(self, name):
+        return self._get(self._counters, name, lambda: Counter(self))
+
+    def gauge(self, name):
+        return self._get(self._gauges, name, lambda: Gauge(self))
+
+    def histogram(self, name):
+        return self._get(self._histograms, name, lambda: Histogram(self))
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = dict(self._histograms)
+        return {
+            'monotonic': time.monotonic(),
+            'counters': {name: c.value for name, c in sorted(counters.items())},
+            'gauges': {name: g.value for name, g in sorted(gauges.items())},
+            'histograms': {name: h.summary() for name, h in sorted(histograms.items())},
+        }
+
+def compute_rates(previous, current):
+    """2つのスナップショット間のカウンタ増加量を毎秒の値にする"""
+    if not previous:
+        return {}
+    dt = current['monotonic'] - previous['monotonic']
+    if dt <= 0:
+        return {}
+    return {name: (value - previous['counters'].get(name, 0)) / dt
+            for name, value in current['counters'].items()}
+
+class MetricsSnapshotWriter:
+    """スナップショットを JSON Lines で追記する（GUIのタイマーから定期的に呼ぶ）"""
+    def __init__(self, path, registry):
+        self.path = path
+        self.registry = registry
+        self._previous = None
+
+    def write(self):
+        snapshot = self.registry.snapshot()
+        record = {
+            'pc_ns': time.perf_counter_ns(),
+            'wall_time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'rates': compute_rates(self._previous, snapshot),
+            **snapshot,
+        }
+        self._previous = snapshot
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+# アプリ全体で共有するレジストリ
+metrics = MetricsRegistry()
@@ -0,0 +1,341 @@
+"""
+別室のモニタ用のローカル HTTP / WebSocket サーバー
+
+記録中の状態・間引いたGSR・A/V・録画状態・カメラのサムネイルを一定間隔で配信する。
+サーバーは専用スレッドの asyncio ループで動き、記録側は publish_* で最新値を置くだけにする。
+クライアントごとに種類別の最新メッセージを1件だけ保持し、送信が追いつかない場合は古いものを捨てるため、
+遅いクライアントが記録処理や他のクライアントを遅らせることはない。
+
+- GET /        モニタ画面（ブラウザで開く）
+- GET /status  現在の状態（JSON）
+- GET /ws      WebSocket（{"type": "state", ...} と {"type": "thumb", ...} のテキストフレーム）
+"""
+import json
+import time
+import base64
+import struct
+import asyncio
+import hashlib
+import threading
+import collections
+from PySide6.QtCore import QThread, Signal
+from .metrics import metrics
+
+MONITOR_HOST = '127.0.0.1'
+MONITOR_PORT = 8766
+# 状態の配信頻度（Hz）と、1回の配信に含めるGSRの点数（間引き後の表示レート = 両者の積）
+MONITOR_RATE_HZ = 10
+MONITOR_GSR_POINTS = 5
+# 配信までに溜めておく GSR の上限（サーバーが動いていない間も増え続けないように古いものから捨てる）
+MONITOR_GSR_BUFFER = 1000
+# サムネイルの配信間隔（秒）。カメラワーカーがこの間隔で JPEG を作る
+THUMBNAIL_INTERVAL_S = 1.0
+# HTTPリクエストヘッダと受信フレームの上限（バイト）
+MAX_REQUEST_BYTES = 8192
+MAX_CLIENT_FRAME_BYTES = 65536
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+def downsample(values, points):
+    """values を points 個の区間平均に間引く"""
+    if len(values) <= points:
+        return list(values)
+    size = len(values) / points
+    return [sum(values[int(i * size):int((i + 1) * size)]) / (int((i + 1) * size) - int(i * size))
+            for i in range(points)]
+
+def ws_frame(payload, opcode=0x1):
+    """サーバーから送る（マスクなしの）WebSocketフレーム"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+async def read_ws_frame(reader):
+    """クライアントからのフレームを1つ読み、(opcode, payload) を返す"""
+    b1, b2 = await reader.readexactly(2)
+    length = b2 & 0x7f
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    if length > MAX_CLIENT_FRAME_BYTES:
+        raise ValueError("フレームが大きすぎます")
+    mask = await reader.readexactly(4) if b2 & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return b1 & 0x0f, payload
+
+class MonitorClient:
+    """WebSocketクライアント1つ分の送信待ち（種類ごとに最新の1件のみ）"""
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def offer(self, kind, data):
+        """送信待ちに置く。前のメッセージが未送信なら置き換えて False を返す"""
+        replaced = kind in self.pending
+        self.pending[kind] = data
+        self.ready.set()
+        return not replaced
+
+    async def send_loop(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            pending, self.pending = self.pending, {}
+            for data in pending.values():
+                self.writer.write(data)
+            # 送信バッファが空くまでこのクライアントだけが待つ
+            await self.writer.drain()
+
+class MonitorServer(QThread):
+    """
+    モニタ配信サーバー。publish_* はどのスレッドから呼んでもよい（値を置くだけで待たない）。
+    """
+    error = Signal(str)
+
+    def __init__(self, host=MONITOR_HOST, port=MONITOR_PORT):
+        super().__init__()
+        self.host = host
+        self.port = port
+        # 録画側のカメラワーカーに指定するサムネイル間隔（秒）
+        self.thumbnail_interval = THUMBNAIL_INTERVAL_S
+        self._lock = threading.Lock()
+        self._gsr = collections.deque(maxlen=MONITOR_GSR_BUFFER)
+        self._state = {'recording': False, 'arousal': 0.0, 'valence': 0.0, 'online5': 3, 'gsr': None}
+        self._status = {}
+        self._thumbnails = {}
+        self._loop = None
+        self._stop_event = None
+        # serve() がループを作る前に stop() が呼ばれた場合に、作った直後に止めるための印
+        self._stop_requested = threading.Event()
+        self.clients = set()
+
+        self._m_clients = metrics.gauge('monitor.clients')
+        self._m_sent = metrics.counter('monitor.sent_messages')
+        self._m_dropped = metrics.counter('monitor.dropped_messages')
+
+    # --- 記録側から呼ぶ ---
+    def publish_gsr(self, value):
+        with self._lock:
+            self._gsr.append(value)
+            self._state['gsr'] = value
+
+    def publish_av(self, arousal, valence):
+        with self._lock:
+            self._state['arousal'], self._state['valence'] = arousal, valence
+
+    def publish_online5(self, value):
+        with self._lock:
+            self._state['online5'] = value
+
+    def publish_recording(self, recording):
+        with self._lock:
+            self._state['recording'] = recording
+
+    def publish_status(self, status):
+        """セッション番号・経過時間などの付加情報（dict）"""
+        with self._lock:
+            self._status = dict(status)
+
+    def publish_thumbnail(self, camera_index, jpeg):
+        with self._lock:
+            self._thumbnails[camera_index] = (time.time(), jpeg)
+
+    # --- サーバー ---
+    def snapshot(self):
+        with self._lock:
+            return {**self._state, 'status': dict(self._status), 'clients': len(self.clients)}
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except OSError as e:
+            self.error.emit(f"モニタサーバーを開始できませんでした（{self.host}:{self.port}）: {e}")
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        if self._stop_requested.is_set():
+            self._stop_event.set()
+        try:
+            server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                limit=MAX_REQUEST_BYTES)
+            self.port = server.sockets[0].getsockname()[1]
+            print(f"モニタサーバー: http://{self.host}:{self.port}/")
+            broadcaster = asyncio.create_task(self.broadcast_loop())
+            async with server:
+                await self._stop_event.wait()
+            broadcaster.cancel()
+            for client in list(self.clients):
+                client.writer.close()
+        finally:
+            # ポートが使用中などで開始できなかった場合も、閉じたループに stop() から停止を送らないようにする
+            self._loop = self._stop_event = None
+
+    async def broadcast_loop(self):
+        interval = 1.0 / MONITOR_RATE_HZ
+        sent_thumbnails = {}
+        while True:
+            await asyncio.sleep(interval)
+            with self._lock:
+                gsr = list(self._gsr)
+                self._gsr.clear()
+                thumbnails = dict(self._thumbnails)
+            state = self.snapshot()
+            state.update(type='state', t=time.time(), gsr_points=downsample(gsr, MONITOR_GSR_POINTS))
+            messages = [('state', state)]
+            for camera_index, (stamp, jpeg) in thumbnails.items():
+                if sent_thumbnails.get(camera_index) != stamp:
+                    sent_thumbnails[camera_index] = stamp
+                    messages.append((f"thumb_{camera_index}", {
+                        'type': 'thumb', 'camera': camera_index, 't': stamp,
+                        'jpeg': base64.b64encode(jpeg).decode('ascii'),
+                    }))
+            if not self.clients:
+                continue
+            for kind, message in messages:
+                frame = ws_frame(json.dumps(message).encode('utf-8'))
+                for client in self.clients:
+                    if client.offer(kind, frame):
+                        self._m_sent.inc()
+                    else:
+                        self._m_dropped.inc()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        path = parts[1].split('?')[0] if len(parts) >= 2 else ''
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+
+        if path == '/ws' and headers.get('upgrade', '').lower() == 'websocket' and 'sec-websocket-key' in headers:
+            await self.handle_websocket(reader, writer, headers['sec-websocket-key'])
+            return
+        if path == '/':
+            self.respond(writer, '200 OK', 'text/html; charset=utf-8', MONITOR_PAGE.encode('utf-8'))
+        elif path == '/status':
+            self.respond(writer, '200 OK', 'application/json', json.dumps(self.snapshot()).encode('utf-8'))
+        else:
+            self.respond(writer, '404 Not Found', 'text/plain', b'not found')
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def respond(self, writer, status, content_type, body):
+        writer.write((f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\nCache-Control: no-store\r\nConnection: close\r\n\r\n").encode('ascii'))
+        writer.write(body)
+
+    async def handle_websocket(self, reader, writer, key):
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode('ascii'))
+        client = MonitorClient(writer)
+        self.clients.add(client)
+        self._m_clients.set(len(self.clients))
+        sender = asyncio.create_task(client.send_loop())
+        try:
+            # クライアントからはクローズとpingのみを扱う
+            while not sender.done():
+                opcode, payload = await read_ws_frame(reader)
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    client.offer('pong', ws_frame(payload, opcode=0xA))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.clients.discard(client)
+            self._m_clients.set(len(self.clients))
+            sender.cancel()
+            writer.close()
+
+    def stop(self):
+        # 先に印を立てる（ループがまだ無ければ serve() が作った直後に印を見て止まる）
+        self._stop_requested.set()
+        loop, stop_event = self._loop, self._stop_event
+        if loop and stop_event and not loop.is_closed():
+            try:
+                loop.call_soon_threadsafe(stop_event.set)
+            except RuntimeError:
+                pass  # 確認した直後にループが閉じた
+        self.wait()  # スレッドの終了を待機
+
+# モニタ画面（外部ファイルやライブラリに依存しない）
+MONITOR_PAGE = """<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><title>実験モニタ</title>
+<style>
+body { background: #111; color: #eee; font-family: sans-serif; margin: 16px; }
+#row { display: flex; gap: 16px; align-items: flex-start; }
+canvas { background: #000; border: 1px solid #444; }
+#status { font-size: 20px; margin-bottom: 8px; }
+#thumbs img { width: 320px; margin-right: 8px; border: 1px solid #444; }
+.rec { color: #f44; font-weight: bold; }
+</style></head>
+<body>
+<div id="status">接続中...</div>
+<div id="row">
+  <canvas id="gsr" width="600" height="200"></canvas>
+  <canvas id="av" width="200" height="200"></canvas>
+</div>
+<div id="thumbs"></div>
+<script>
+const gsr = [], GSR_POINTS = 600;
+const status = document.getElementById('status');
+function drawGsr() {
+  const c = document.getElementById('gsr'), g = c.getContext('2d');
+  g.clearRect(0, 0, c.width, c.height);
+  if (gsr.length < 2) return;
+  const lo = Math.min(...gsr), hi = Math.max(...gsr), span = Math.max(hi - lo, 1);
+  g.strokeStyle = '#0f0'; g.beginPath();
+  gsr.forEach((v, i) => { const x = i * c.width / GSR_POINTS, y = c.height - (v - lo) / span * c.height;
+                          i ? g.lineTo(x, y) : g.moveTo(x, y); });
+  g.stroke();
+}
+function drawAv(a, v) {
+  const c = document.getElementById('av'), g = c.getContext('2d'), h = c.width / 2;
+  g.clearRect(0, 0, c.width, c.height);
+  g.strokeStyle = '#fff'; g.beginPath(); g.moveTo(0, h); g.lineTo(c.width, h); g.moveTo(h, 0); g.lineTo(h, c.height); g.stroke();
+  g.fillStyle = '#f00'; g.beginPath(); g.arc(h + v / 2.5 * h, h - a / 2.5 * h, 8, 0, 2 * Math.PI); g.fill();
+}
+function connect() {
+  const ws = new WebSocket(`ws://${location.host}/ws`);
+  ws.onmessage = (e) => {
+    const m = JSON.parse(e.data);
+    if (m.type === 'state') {
+      gsr.push(...m.gsr_points); gsr.splice(0, Math.max(0, gsr.length - GSR_POINTS));
+      const s = m.status, rec = m.recording ? '<span class="rec">● 録画中</span>' : '待機中';
+      status.innerHTML = `${rec} ${s.pid || ''} セッション ${s.session_number || '-'} ` +
+        `${s.record_seconds ? Math.floor(s.record_seconds) + ' 秒' : ''} / GSR ${m.gsr ?? '-'} / ` +
+        `A ${m.arousal.toFixed(1)} V ${m.valence.toFixed(1)} / 興奮度 ${m.online5}`;
+      drawGsr(); drawAv(m.arousal, m.valence);
+    } else if (m.type === 'thumb') {
+      let img = document.getElementById('cam' + m.camera);
+      if (!img) { img = document.createElement('img'); img.id = 'cam' + m.camera;
+                  document.getElementById('thumbs').appendChild(img); }
+      img.src = 'data:image/jpeg;base64,' + m.jpeg;
+    }
+  };
+  ws.onclose = () => { status.textContent = '切断されました。再接続中...'; setTimeout(connect, 1000); };
+}
+connect();
+</script></body></html>
+"""
@@ -1,87 +1,317 @@
-
 import serial
-import keyboard
 import time
 from PySide6.QtCore import QThread, Signal
+from .latency import input_latency
+from .metrics import metrics
+
+# ファームウェアの BTN 行のビット位置（pico_firmware/code.py の BUTTON_BITS と対応）
+BUTTON_BITS = {'UP': 0, 'DOWN': 1, 'LEFT': 2, 'RIGHT': 3, 'B1': 4, 'B2': 5}
+
+# serial.csv の列（GSRサンプルごとに、その時点の評価値を並べて記録する）
+SERIAL_CSV_COLUMNS = "pc_ns,pico_ts_ms,idx,gsr_value,arousal,valence,online5"
+
+def serial_csv_row(gsr_value, idx, pico_ms, pc_ns, arousal, valence, online5):
+    """serial.csv の1行。旧形式のGSR行（連番・Pico時刻が -1）ではその列を空にする"""
+    return (f"{pc_ns},{pico_ms if pico_ms >= 0 else ''},{idx if idx >= 0 else ''},{gsr_value},"
+            f"{arousal:g},{valence:g},{online5}\n")
 
 class PicoWorker(QThread):
     """
     Picoからのシリアルデータとキーボード入力を監視するワーカー。
+
+    ファームウェアが `BTN:<seq>,<pico_ms>,<mask>` を送ってくる場合は、そのボタン状態から
+    A/V変更・マーカー・録画トグル(F13相当)・終了(F15相当)を直接判定する。
+    BTN行を受信するまではキーボードフック（HID経由）で動作する。
     """
     # --- シグナル定義 ---
     # GSRデータ（int）
     new_gsr_data = Signal(int)
+    # 連番付きGSRサンプル（値, 連番, Pico時刻ms, PC受信時刻ns）。旧形式の行では連番とPico時刻は -1
+    gsr_sample = Signal(int, "qint64", "qint64", "qint64")
     # Arousal/Valenceの変更（float, float）
     av_changed = Signal(float, float)
+    # オンライン興奮度（5段階, UP/DOWNで±1）の変更
+    online5_changed = Signal(int)
     # 録画トグル信号
     record_toggled = Signal()
     # 実験終了信号
     session_ended = Signal()
     # モーフ気づきマーカー信号
     morph_marker_received = Signal()
+    # ボタンの押下/解放（ボタン名, 押下ならTrue, Pico時刻ms, PC受信時刻ns）
+    button_changed = Signal(str, bool, "qint64", "qint64")
+    # シリアルポートの接続/切断（接続中なら True）。切断は自動で再接続するためエラーにはしない
+    connection_changed = Signal(bool)
     # エラーメッセージ（str）
     error = Signal(str)
 
-    def __init__(self, serial_port='COM4', baud_rate=9600):
+    def __init__(self, serial_port='COM4', baud_rate=9600, use_keyboard_hooks=True):
         super().__init__()
         self.serial_port = serial_port
         self.baud_rate = baud_rate
+        # ベンチマークなどキーボードが無い環境ではフックを使わない
+        self.use_keyboard_hooks = use_keyboard_hooks
         self.ser = None
+        self._rx_buffer = b''
         self._is_running = True
-        
+        # 切断後の再接続間隔（秒）
+        self.reconnect_interval = 1.0
+        self._reconnect_at = None
+        self.last_gsr_idx = None
+
+        # メトリクス
+        self._m_bytes = metrics.counter('pico.rx_bytes')
+        self._m_lines = metrics.counter('pico.lines')
+        self._m_samples = metrics.counter('pico.gsr_samples')
+        self._m_parse_errors = metrics.counter('pico.parse_errors')
+        self._m_seq_gaps = metrics.counter('pico.seq_gaps')
+        self._m_buttons = metrics.counter('pico.button_events')
+        self._m_disconnects = metrics.counter('pico.disconnects')
+        self._m_reconnects = metrics.counter('pico.reconnects')
+
         self.arousal = 0.0
         self.valence = 0.0
         self.av_step = 0.5
         self.av_max = 2.5
+        # オンライン5段階（既定=3）
+        self.online5 = 3
+
+        # シリアル入力モード（BTN行を受信したらTrue）
+        self.serial_input = False
+        self.button_mask = 0
+        self.last_button_seq = None
+        # レバー長押し時のリピート（初回遅延, 間隔 秒）
+        self.repeat_delay = 0.4
+        self.repeat_interval = 0.15
+        self._lever_repeat_at = {}
+        # B2のデバウンスとB1+B2長押し
+        self.b2_debounce_ms = 300
+        self.long_press_duration = 3.0
+        self._last_b2_press_ms = None
+        self._long_press_start = None
+        self._long_press_triggered = False
 
     def run(self):
-        # キーボードフックを設定
-        self.setup_keyboard_hooks()
+        # キーボードフックを設定（シリアル入力が使えない場合のフォールバック）
+        if self.use_keyboard_hooks:
+            self.setup_keyboard_hooks()
 
         # シリアルポートの接続試行
-        try:
-            self.ser = serial.Serial(self.serial_port, self.baud_rate, timeout=1)
-            print(f"シリアルポート {self.serial_port} に接続しました。")
-        except serial.SerialException:
+        if not self.open_serial():
             self.error.emit(f"シリアルポート {self.serial_port} が見つかりません。Picoが接続されているか確認してください。")
-            # キーボード入力の監視は継続
+            # キーボード入力の監視は継続し、Pico が後から接続されるのを待つ
+            self._reconnect_at = time.monotonic() + self.reconnect_interval
 
         while self._is_running:
             if self.ser and self.ser.is_open:
                 try:
-                    line = self.ser.readline().decode('utf-8').strip()
-                    if line.startswith("GSR:"):
-                        gsr_value = int(line.split(':')[1])
-                        self.new_gsr_data.emit(gsr_value)
-                except (UnicodeDecodeError, ValueError, IndexError):
-                    # 不正なデータを無視
-                    pass
-            # 0.01秒待機してCPU負荷を軽減
-            self.msleep(10)
-        
+                    lines = self.read_lines()
+                except (serial.SerialException, OSError):
+                    # USB抜けなど。ポートを閉じて再接続を試みる
+                    self.handle_disconnect()
+                    continue
+                for line, pc_ns in lines:
+                    try:
+                        self.handle_line(line.decode('utf-8').strip(), pc_ns)
+                    except (UnicodeDecodeError, ValueError, IndexError):
+                        # 不正なデータは無視して件数だけ数える
+                        self._m_parse_errors.inc()
+            else:
+                if self._reconnect_at is not None and time.monotonic() >= self._reconnect_at:
+                    if self.open_serial():
+                        self._m_reconnects.inc()
+                    else:
+                        self._reconnect_at = time.monotonic() + self.reconnect_interval
+                # 0.01秒待機してCPU負荷を軽減
+                self.msleep(10)
+            self.process_held_buttons()
+
         # 終了時にキーボードフックを解除
-        keyboard.unhook_all()
+        if self.use_keyboard_hooks:
+            import keyboard
+            keyboard.unhook_all()
         if self.ser and self.ser.is_open:
+            try:
+                self.ser.write(b"MODE:HID\n")
+            except serial.SerialException:
+                pass
             self.ser.close()
         print("Picoワーカーを終了しました。")
 
+    def open_serial(self):
+        """ポートを開いてシリアル入力モードを要求する。失敗したら False"""
+        try:
+            self.ser = serial.Serial(self.serial_port, self.baud_rate, timeout=0.005)
+            print(f"シリアルポート {self.serial_port} に接続しました。")
+            # ファームウェアにHID送信を止めてボタン状態をシリアルで送るよう要求
+            self.ser.write(b"MODE:SERIAL\n")
+        except (serial.SerialException, OSError):
+            self.ser = None
+            return False
+        self._reconnect_at = None
+        self.connection_changed.emit(True)
+        return True
+
+    def handle_disconnect(self):
+        """
+        切断時の後始末。受信途中の行と押下中のボタンを破棄し、再接続を待つ。
+        再接続後の連番はPico再起動で戻ることがあるため、欠落判定もやり直す。
+        """
+        try:
+            self.ser.close()
+        except (serial.SerialException, OSError):
+            pass
+        self.ser = None
+        self._rx_buffer = b''
+        self.last_gsr_idx = None
+        self.last_button_seq = None
+        # ファームウェアは切断でHIDに戻るため、キーボードフックでの入力に戻す
+        self.serial_input = False
+        self.button_mask = 0
+        self._lever_repeat_at.clear()
+        self._long_press_start = None
+        self._long_press_triggered = False
+        self._reconnect_at = time.monotonic() + self.reconnect_interval
+        self._m_disconnects.inc()
+        print(f"シリアルポート {self.serial_port} が切断されました。再接続を試みます。")
+        self.connection_changed.emit(False)
+
+    def read_lines(self):
+        """
+        受信済みのバイト列を行単位で返す。タイムアウトで行の途中までしか届いていない場合は
+        次回に持ち越すため、短いタイムアウトでも行が分断されない。
+        """
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if not data:
+            return []
+        pc_ns = time.perf_counter_ns()
+        self._m_bytes.inc(len(data))
+        self._rx_buffer += data
+        *lines, self._rx_buffer = self._rx_buffer.split(b'\n')
+        self._m_lines.inc(len(lines))
+        return [(line, pc_ns) for line in lines]
+
+    def handle_line(self, line, pc_ns):
+        if line.startswith("GSR:"):
+            # "GSR:<value>" または "GSR:<value>,<idx>,<pico_ms>"
+            fields = line[4:].split(',')
+            gsr_value = int(fields[0])
+            self._m_samples.inc()
+            if len(fields) >= 3:
+                idx, pico_ms = int(fields[1]), int(fields[2])
+                self.check_sequence('gsr', idx)
+            else:
+                idx = pico_ms = -1
+            self.gsr_sample.emit(gsr_value, idx, pico_ms, pc_ns)
+            self.new_gsr_data.emit(gsr_value)
+        elif line.startswith("BTN:"):
+            self.handle_button_line(line, pc_ns)
+
     def setup_keyboard_hooks(self):
+        import keyboard  # フックを使う場合のみ読み込む（ワーカースレッド内で読み込まれる）
         # keyboardライブラリでは矢印キーは文字列として指定
-        keyboard.on_press_key('up', lambda e: self.update_arousal(self.av_step))
-        keyboard.on_press_key('down', lambda e: self.update_arousal(-self.av_step))
-        keyboard.on_press_key('left', lambda e: self.update_valence(-self.av_step))
-        keyboard.on_press_key('right', lambda e: self.update_valence(self.av_step))
+        # シリアル入力モード中はHIDからの入力を二重に処理しない
+        def hook(key, action):
+            keyboard.on_press_key(key, lambda e: None if self.serial_input else action(time.perf_counter_ns()))
+
+        hook('up', lambda t: self.update_arousal(self.av_step, arrival_ns=t))
+        hook('down', lambda t: self.update_arousal(-self.av_step, arrival_ns=t))
+        hook('left', lambda t: self.update_valence(-self.av_step, arrival_ns=t))
+        hook('right', lambda t: self.update_valence(self.av_step, arrival_ns=t))
+
+        hook('p', lambda t: self.morph_marker_received.emit())
+        hook('f13', lambda t: self.record_toggled.emit())
+        hook('f15', lambda t: self.session_ended.emit())
+
+    # --- シリアルのボタン状態からの判定 ---
+    def handle_button_line(self, line, pc_ns):
+        seq, pico_ms, mask = (int(v) for v in line[4:].split(','))
+        if not self.serial_input:
+            print("シリアル入力モードに切り替えました（ボタン状態をシリアルで受信）。")
+            self.serial_input = True
+        self.check_sequence('button', seq)
+        self._m_buttons.inc()
+        input_latency.observe_clock(pico_ms, pc_ns)
+
+        changed = mask ^ self.button_mask
+        self.button_mask = mask
+        for name, bit in BUTTON_BITS.items():
+            if changed & (1 << bit):
+                self.handle_button_edge(name, bool(mask & (1 << bit)), pico_ms, pc_ns)
+
+    def check_sequence(self, kind, seq):
+        """連番の欠落を数える（Pico再起動などで番号が戻った場合は欠落扱いしない）"""
+        attr = 'last_gsr_idx' if kind == 'gsr' else 'last_button_seq'
+        last = getattr(self, attr)
+        if last is not None and seq > last + 1:
+            self._m_seq_gaps.inc(seq - last - 1)
+            if kind == 'button':
+                print(f"ボタン状態の欠落: seq {last} -> {seq}")
+        setattr(self, attr, seq)
+
+    def handle_button_edge(self, name, pressed, pico_ms, pc_ns):
+        self.button_changed.emit(name, pressed, pico_ms, pc_ns)
+        now = time.perf_counter()
+
+        if name in ('UP', 'DOWN', 'LEFT', 'RIGHT'):
+            if pressed:
+                self.apply_lever(name, pico_ms, pc_ns)
+                self._lever_repeat_at[name] = now + self.repeat_delay
+            else:
+                self._lever_repeat_at.pop(name, None)
+        elif name == 'B1' and pressed:
+            self.morph_marker_received.emit()
+        elif name == 'B2' and pressed:
+            # デバウンスはPico側の時刻で判定する
+            if self._last_b2_press_ms is None or pico_ms - self._last_b2_press_ms > self.b2_debounce_ms:
+                self.record_toggled.emit()
+            self._last_b2_press_ms = pico_ms
+
+        # B1+B2 同時押しの開始/解除
+        both = BUTTON_BITS['B1'], BUTTON_BITS['B2']
+        if all(self.button_mask & (1 << bit) for bit in both):
+            if self._long_press_start is None:
+                self._long_press_start = now
+        else:
+            self._long_press_start = None
+            self._long_press_triggered = False
+
+    def apply_lever(self, name, pico_ms=None, arrival_ns=None):
+        if name == 'UP':
+            self.update_arousal(self.av_step, pico_ms, arrival_ns)
+        elif name == 'DOWN':
+            self.update_arousal(-self.av_step, pico_ms, arrival_ns)
+        elif name == 'LEFT':
+            self.update_valence(-self.av_step, pico_ms, arrival_ns)
+        elif name == 'RIGHT':
+            self.update_valence(self.av_step, pico_ms, arrival_ns)
 
-        keyboard.on_press_key('p', lambda e: self.morph_marker_received.emit())
-        keyboard.on_press_key('f13', lambda e: self.record_toggled.emit())
-        keyboard.on_press_key('f15', lambda e: self.session_ended.emit())
+    def process_held_buttons(self):
+        """レバー長押しのリピートとB1+B2長押し（F15相当）を判定する"""
+        if not self.serial_input:
+            return
+        now = time.perf_counter()
+        for name, repeat_at in list(self._lever_repeat_at.items()):
+            if now >= repeat_at:
+                self.apply_lever(name)
+                self._lever_repeat_at[name] = repeat_at + self.repeat_interval
+        if (self._long_press_start is not None and not self._long_press_triggered and
+                now - self._long_press_start >= self.long_press_duration):
+            self._long_press_triggered = True
+            self.session_ended.emit()
 
-    def update_arousal(self, change):
+    def update_arousal(self, change, pico_ms=None, arrival_ns=None):
         self.arousal = max(-self.av_max, min(self.av_max, self.arousal + change))
+        online5 = max(1, min(5, self.online5 + (1 if change > 0 else -1)))
+        input_latency.input_emitted(pico_ms, arrival_ns)
         self.av_changed.emit(self.arousal, self.valence)
+        if online5 != self.online5:
+            self.online5 = online5
+            self.online5_changed.emit(online5)
 
-    def update_valence(self, change):
+    def update_valence(self, change, pico_ms=None, arrival_ns=None):
         self.valence = max(-self.av_max, min(self.av_max, self.valence + change))
+        input_latency.input_emitted(pico_ms, arrival_ns)
         self.av_changed.emit(self.arousal, self.valence)
 
     def stop(self):
@@ -0,0 +1,174 @@
+import os
+import glob
+import time
+import shutil
+from PySide6.QtCore import QThread, Signal
+from .camera_worker import CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS, CAMERA_FOURCC, FACE_STREAM_SUFFIX, FACE_ROI_SIZE
+from .sidecar import sidecar_path_for
+
+# 空き容量がこれを下回る場合は録画を開始しない（NFR）
+MIN_FREE_BYTES = 10 * 1024**3
+# 書き込み速度の測定量とブロックサイズ
+TEST_BYTES = 256 * 1024**2
+TEST_BLOCK_BYTES = 4 * 1024**2
+# 測定中に fsync して区間速度を記録する間隔（最小の区間速度を「持続速度」とみなす）
+TEST_SYNC_BYTES = 32 * 1024**2
+# 必要帯域に対して持続書き込み速度がこの倍率未満なら警告する（エンコーダの書き出しは間欠的なため）
+THROUGHPUT_MARGIN = 3.0
+
+# 過去の録画が無い場合のコーデック別ビットレートの目安（bit/画素）
+CODEC_BITS_PER_PIXEL = {'mp4v': 0.25, 'avc1': 0.1, 'MJPG': 1.5}
+# その他のストリーム（バイト/秒）
+SERIAL_BYTES_PER_SECOND = 10 * 60      # serial.csv（10Hz, 1行約60バイト）
+EVENTS_BYTES_PER_SECOND = 200          # events.jsonl
+AUDIO_BYTES_PER_SECOND = 48000 * 2     # audio/rta.wav（48kHz, モノラル, 16bit）
+
+def measured_bytes_per_frame(data_root, max_files=8):
+    """
+    過去に録画した動画（sidecar のフレーム数で割る）から1フレームあたりの平均バイト数を求める。
+    録画が無ければ None。
+    """
+    videos = glob.glob(os.path.join(data_root, '*', 'session_*', 'video', 'camera_*.mp4'))
+    videos.sort(key=os.path.getmtime, reverse=True)
+    total_bytes = total_frames = 0
+    # 顔ROI録画の切り出し映像は解像度が違うため除く
+    videos = [v for v in videos if not v.endswith(FACE_STREAM_SUFFIX + '.mp4')]
+    for path in videos[:max_files]:
+        sidecar = sidecar_path_for(path)
+        if not os.path.exists(sidecar):
+            continue
+        with open(sidecar, 'rb') as f:
+            frames = sum(1 for _ in f) - 1
+        if frames > 0:
+            total_bytes += os.path.getsize(path)
+            total_frames += frames
+    return total_bytes / total_frames if total_frames else None
+
+def face_roi_pixel_ratio(full_frame_scale):
+    """顔ROI録画（縮小した全体映像＋顔の切り出し映像）で記録する画素数の、全体映像に対する比"""
+    full_pixels = CAMERA_WIDTH * CAMERA_HEIGHT
+    return (full_pixels * full_frame_scale ** 2 + FACE_ROI_SIZE ** 2) / full_pixels
+
+def estimate_requirements(num_cameras, duration_s, bytes_per_frame=None, audio=True, pixel_ratio=1.0):
+    """
+    録画に必要な帯域（バイト/秒）と容量（バイト）を見積もる。
+    pixel_ratio は1台あたりに記録する画素数の全体映像に対する比（顔ROI録画では face_roi_pixel_ratio）。
+    """
+    if bytes_per_frame is None:
+        bits = CODEC_BITS_PER_PIXEL.get(CAMERA_FOURCC, 0.25)
+        bytes_per_frame = CAMERA_WIDTH * CAMERA_HEIGHT * bits / 8
+    camera_bps = bytes_per_frame * CAMERA_FPS * pixel_ratio
+    sidecar_bps = CAMERA_FPS * 30  # frame_idx,pc_ns の1行
+    bandwidth = num_cameras * (camera_bps + sidecar_bps) + SERIAL_BYTES_PER_SECOND + EVENTS_BYTES_PER_SECOND
+    if audio:
+        bandwidth += AUDIO_BYTES_PER_SECOND
+    return {
+        'bytes_per_frame': bytes_per_frame,
+        'bandwidth_bps': bandwidth,
+        'capacity_bytes': bandwidth * duration_s,
+    }
+
+def check_free_space(path, required_bytes=0):
+    """
+    録画開始直前の確認（ディスク容量の取得のみなので即座に終わる）。
+    問題が無ければ None、録画を開始すべきでなければ理由のメッセージを返す。
+    """
+    os.makedirs(path, exist_ok=True)
+    free = shutil.disk_usage(path).free
+    if free - required_bytes < MIN_FREE_BYTES:
+        return (f"保存先の空き容量が不足しています（空き {free / 1024**3:.1f} GB、"
+                f"必要 {(required_bytes + MIN_FREE_BYTES) / 1024**3:.1f} GB）。")
+    return None
+
+def evaluate(requirements, free_bytes, throughput_bps=None):
+    """
+    見積もりと測定結果から ('ok' | 'warn' | 'block', メッセージのリスト) を返す。
+    throughput_bps が None（測定中）の場合は容量のみで判定する。
+    """
+    level, messages = 'ok', []
+    remaining = free_bytes - requirements['capacity_bytes']
+    if remaining < MIN_FREE_BYTES:
+        level = 'block'
+        messages.append(f"空き容量 {free_bytes / 1024**3:.1f} GB に対し、予定時間の録画に "
+                        f"{requirements['capacity_bytes'] / 1024**3:.1f} GB 必要です"
+                        f"（録画後に {MIN_FREE_BYTES / 1024**3:.0f} GB 以上残す必要があります）。")
+    if throughput_bps is not None:
+        needed = requirements['bandwidth_bps']
+        if throughput_bps < needed:
+            level = 'block'
+            messages.append(f"書き込み速度 {throughput_bps / 1e6:.1f} MB/s が必要帯域 {needed / 1e6:.1f} MB/s を下回っています。")
+        elif throughput_bps < needed * THROUGHPUT_MARGIN:
+            level = 'warn' if level == 'ok' else level
+            messages.append(f"書き込み速度 {throughput_bps / 1e6:.1f} MB/s に対し必要帯域 {needed / 1e6:.1f} MB/s で、"
+                            f"余裕が {THROUGHPUT_MARGIN:g} 倍未満です。")
+    return level, messages
+
+class PreflightWorker(QThread):
+    """
+    録画先ディレクトリの持続書き込み速度と空き容量を測るワーカー。
+    セットアップ画面の表示中にバックグラウンドで実行し、実験開始時には結果を参照するだけにする。
+    """
+    # 測定結果 {'free_bytes', 'throughput_bps', 'mean_bps', 'bytes_per_frame'}
+    result_ready = Signal(dict)
+    error = Signal(str)
+
+    def __init__(self, target_dir, test_bytes=TEST_BYTES):
+        super().__init__()
+        self.target_dir = target_dir
+        self.test_bytes = test_bytes
+        self._is_running = True
+
+    def run(self):
+        try:
+            os.makedirs(self.target_dir, exist_ok=True)
+            free = shutil.disk_usage(self.target_dir).free
+            # 空き容量が足りない場合に測定でさらに減らさない
+            test_bytes = min(self.test_bytes, max(0, (free - MIN_FREE_BYTES) // 2))
+            throughput, mean = self.measure_write(test_bytes) if test_bytes >= TEST_SYNC_BYTES else (None, None)
+        except OSError as e:
+            self.error.emit(f"保存先の書き込み速度を測定できませんでした: {e}")
+            return
+        if not self._is_running:
+            return
+        result = {
+            'free_bytes': free,
+            'throughput_bps': throughput,
+            'mean_bps': mean,
+            'bytes_per_frame': measured_bytes_per_frame(self.target_dir),
+        }
+        if throughput is not None:
+            print(f"保存先の書き込み速度: 持続 {throughput / 1e6:.1f} MB/s（平均 {mean / 1e6:.1f} MB/s）、"
+                  f"空き {free / 1024**3:.1f} GB")
+        self.result_ready.emit(result)
+
+    def measure_write(self, test_bytes):
+        """一時ファイルへの逐次書き込み。TEST_SYNC_BYTES ごとに fsync し、(最小区間速度, 平均速度) を返す"""
+        path = os.path.join(self.target_dir, f".preflight_{os.getpid()}.tmp")
+        block = os.urandom(TEST_BLOCK_BYTES)  # 圧縮・重複排除されないデータ
+        rates = []
+        written = 0
+        try:
+            with open(path, 'wb', buffering=0) as f:
+                start = interval_start = time.perf_counter()
+                interval_bytes = 0
+                while written < test_bytes and self._is_running:
+                    f.write(block)
+                    written += len(block)
+                    interval_bytes += len(block)
+                    if interval_bytes >= TEST_SYNC_BYTES:
+                        os.fsync(f.fileno())
+                        now = time.perf_counter()
+                        rates.append(interval_bytes / (now - interval_start))
+                        interval_start, interval_bytes = now, 0
+                os.fsync(f.fileno())
+                elapsed = time.perf_counter() - start
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        if not rates:
+            return None, None
+        return min(rates), written / elapsed
+
+    def stop(self):
+        self._is_running = False
+        self.wait()  # スレッドの終了を待機
@@ -0,0 +1,61 @@
+"""
+録画開始前の数秒（プリロール）を保持するリングバッファ
+
+録画していない間も GSR の行・イベント・カメラのフレームをここに入れておき、録画開始時に取り出して
+ファイルの先頭に書く（実験者の録画開始操作が少し遅れても、その直前から記録が残る）。
+各項目は取得時刻 pc_ns を持ち、直近 seconds 秒より古いものと、合計が max_bytes を超えた分は古い方から捨てる。
+使用量は preroll.<名前>.bytes / .items のメトリクスで確認できる。
+"""
+import collections
+
+from .metrics import metrics
+
+# 既定のプリロール時間（秒）
+DEFAULT_PREROLL_SECONDS = 5
+# GSR の行・イベントのバッファの上限（1000Hz の GSR でも 5 秒分が十分に入る）
+SAMPLE_PREROLL_MAX_BYTES = 4 * 1024**2
+
+class PrerollBuffer:
+    """直近 seconds 秒分（合計 max_bytes まで）の (pc_ns, 項目) を保持する。seconds が 0 なら何も保持しない"""
+    def __init__(self, name, seconds=0, max_bytes=SAMPLE_PREROLL_MAX_BYTES):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = collections.deque()
+        self._m_bytes = metrics.gauge(f"preroll.{name}.bytes")
+        self._m_items = metrics.gauge(f"preroll.{name}.items")
+        # 容量の上限で（保持時間より前に）捨てた数
+        self._m_evicted = metrics.counter(f"preroll.{name}.evicted")
+
+    def __len__(self):
+        return len(self._items)
+
+    def append(self, pc_ns, item, size):
+        if not self.seconds:
+            return
+        self._items.append((pc_ns, item, size))
+        self.bytes += size
+        oldest_ns = pc_ns - int(self.seconds * 1e9)
+        while self._items and self._items[0][0] < oldest_ns:
+            self._pop()
+        while self.bytes > self.max_bytes:
+            self._pop()
+            self._m_evicted.inc()
+        self._m_bytes.set(self.bytes)
+        self._m_items.set(len(self._items))
+
+    def _pop(self):
+        _, _, size = self._items.popleft()
+        self.bytes -= size
+
+    def drain(self):
+        """保持している項目を古い順に [(pc_ns, 項目), ...] で返して空にする"""
+        items = [(pc_ns, item) for pc_ns, item, _ in self._items]
+        self.clear()
+        return items
+
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+        self._m_bytes.set(0)
+        self._m_items.set(0)
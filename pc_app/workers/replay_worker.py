@@ -0,0 +1,466 @@
+import os
+import csv
+import json
+import math
+import time
+import queue
+import bisect
+import cv2
+import numpy as np
+from PySide6.QtCore import QThread, Signal
+from PySide6.QtGui import QImage
+from .sidecar import sidecar_path_for
+
+# 再生速度の範囲
+MIN_SPEED = 0.5
+MAX_SPEED = 16.0
+# 高速再生時に GSR をGUIへ送る上限（サンプル/秒）。超える分は間引く
+MAX_GSR_EMIT_HZ = 500
+# シーク時にGSRグラフへ描き直す直前のサンプル数（GSRWidget の表示幅）
+GSR_HISTORY_SAMPLES = 300
+
+class TimeIndex:
+    """
+    時刻順に並んだ行ファイル（CSV / JSON Lines）の疎な索引。
+    stride 行ごとに (時刻, バイトオフセット, その時点の状態) を保持し、シークは
+    二分探索で直前のブロックへ移動してから読み進めるだけで済む。索引の作成は1回の通読のみ。
+
+    parse(line) -> (t_ns, record) または None（ヘッダ・不正行）
+    fold(state, record) -> state（A/V の現在値など、シーク先で復元する状態）
+    """
+    def __init__(self, path, parse, fold=None, initial_state=None, stride=256):
+        self.path = path
+        self.parse = parse
+        self.fold = fold
+        self.stride = stride
+        self.times = []
+        self.offsets = []
+        self.states = []
+        self.count = 0
+        self.first_ns = None
+        self.last_ns = None
+        self._build(initial_state, stride)
+
+    def _build(self, state, stride):
+        with open(self.path, 'rb') as f:
+            offset = 0
+            for raw in f:
+                parsed = self.parse(raw)
+                if parsed is not None:
+                    t_ns, record = parsed
+                    if self.count % stride == 0:
+                        self.times.append(t_ns)
+                        self.offsets.append(offset)
+                        self.states.append(state)
+                    if self.first_ns is None:
+                        self.first_ns = t_ns
+                    self.last_ns = t_ns
+                    if self.fold:
+                        state = self.fold(state, record)
+                    self.count += 1
+                offset += len(raw)
+
+    def read_from(self, t_ns):
+        """
+        t_ns 以降のレコードを (t_ns, record) で順に返すイテレータと、t_ns 時点の状態を返す。
+        ブロック先頭から t_ns までのレコードは状態の更新にだけ使う。
+        """
+        block = max(0, bisect.bisect_right(self.times, t_ns) - 1)
+        state = self.states[block] if self.states else None
+        f = open(self.path, 'rb')
+        if self.offsets:
+            f.seek(self.offsets[block])
+        pending = None
+        for raw in f:
+            parsed = self.parse(raw)
+            if parsed is None:
+                continue
+            if parsed[0] >= t_ns:
+                pending = parsed
+                break
+            if self.fold:
+                state = self.fold(state, parsed[1])
+        return self._iterate(f, pending), state
+
+    def _iterate(self, f, pending):
+        try:
+            if pending is not None:
+                yield pending
+            for raw in f:
+                parsed = self.parse(raw)
+                if parsed is not None:
+                    yield parsed
+        finally:
+            f.close()
+
+class VideoTrack:
+    """録画動画と sidecar のフレーム時刻。sidecar が無い場合は動画のfpsから時刻を求める"""
+    def __init__(self, name, path, origin_ns):
+        self.name = name
+        self.path = path
+        self.cap = None
+        self.next_frame = 0
+        sidecar = sidecar_path_for(path)
+        if os.path.exists(sidecar):
+            data = np.loadtxt(sidecar, delimiter=',', skiprows=1, dtype=np.int64, ndmin=2)
+            # origin_ns が None（記録の時計が別の形式）の場合は最初のフレームを0とする
+            base = origin_ns if origin_ns is not None else (data[0, 1] if len(data) else 0)
+            self.frame_ns = data[:, 1] - base
+        else:
+            cap = cv2.VideoCapture(path)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 20.0
+            count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            self.frame_ns = (np.arange(count) * 1e9 / fps).astype(np.int64)
+
+    @property
+    def first_ns(self):
+        return int(self.frame_ns[0]) if len(self.frame_ns) else 0
+
+    @property
+    def last_ns(self):
+        return int(self.frame_ns[-1]) if len(self.frame_ns) else 0
+
+    def open(self):
+        if self.cap is None:
+            self.cap = cv2.VideoCapture(self.path)
+            self.next_frame = 0
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def frame_at(self, t_ns):
+        """t_ns に表示すべきフレーム番号（まだ最初のフレーム前なら -1）"""
+        return int(np.searchsorted(self.frame_ns, t_ns, side='right')) - 1
+
+    def read_until(self, target):
+        """target 番のフレームまで進めて返す。少しの遅れは grab で読み飛ばし、大きく離れていればシークする"""
+        if target < self.next_frame or target - self.next_frame > 30:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            self.next_frame = target
+        while self.next_frame < target:
+            if not self.cap.grab():
+                return None
+            self.next_frame += 1
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        self.next_frame += 1
+        return frame
+
+class ReplaySession:
+    """
+    記録済みセッションの読み込み。main.py の形式（serial.csv, events.jsonl, video/ + sidecar/）と
+    recorder.py の形式（gsr_data.csv, operations.csv）の両方に対応し、時刻はセッション開始からのnsに揃える。
+    プリロール（録画開始前の数秒）の記録は負の時刻になり、再生は start_ns（0以下）から始まる。
+    """
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        serial_path = os.path.join(session_dir, 'serial.csv')
+        events_path = os.path.join(session_dir, 'events.jsonl')
+        if os.path.exists(serial_path) or os.path.exists(events_path):
+            self.origin_ns = self._find_origin(events_path, serial_path)
+            self.gsr = self._index(serial_path, self._serial_parser(serial_path))
+            self.events = self._index(events_path, self._parse_event, self._fold_av, (0.0, 0.0))
+            video_origin = self.origin_ns
+        else:
+            self.origin_ns = 0
+            gsr_path = os.path.join(session_dir, 'gsr_data.csv')
+            self.gsr = self._index(gsr_path, self._recorder_gsr_parser(gsr_path))
+            self.events = self._index(os.path.join(session_dir, 'operations.csv'),
+                                      self._parse_operation, self._fold_av, (0.0, 0.0))
+            # recorder.py は経過秒で記録しているため、動画は最初のフレームを0として合わせる
+            video_origin = None
+        if self.gsr is None and self.events is None:
+            raise FileNotFoundError(f"再生できる記録がありません: {session_dir}")
+
+        self.videos = []
+        video_dir = os.path.join(session_dir, 'video')
+        if os.path.isdir(video_dir):
+            for name in sorted(os.listdir(video_dir)):
+                if name.endswith('.mp4'):
+                    self.videos.append(VideoTrack(os.path.splitext(name)[0], os.path.join(video_dir, name), video_origin))
+
+        starts = [index.first_ns for index in (self.gsr, self.events) if index and index.first_ns is not None]
+        starts += [track.first_ns for track in self.videos]
+        self.start_ns = min(starts + [0])
+        ends = [index.last_ns for index in (self.gsr, self.events) if index and index.last_ns is not None]
+        ends += [track.last_ns for track in self.videos]
+        self.duration_ns = max(ends) if ends else 0
+
+    @staticmethod
+    def _index(path, parse, fold=None, initial_state=None):
+        if not os.path.exists(path):
+            return None
+        return TimeIndex(path, parse, fold, initial_state)
+
+    @staticmethod
+    def _find_origin(events_path, serial_path):
+        """
+        record_start イベントの時刻をセッションの0とする。record_start が無ければ
+        events.jsonl と serial.csv の最初の記録のうち早い方を0とする
+        """
+        firsts = []
+        if os.path.exists(events_path):
+            with open(events_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                        pc_ns = int(event['pc_ns'])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    if event.get('type') == 'record_start':
+                        return pc_ns
+                    if not firsts:
+                        firsts.append(pc_ns)
+        if os.path.exists(serial_path):
+            with open(serial_path, encoding='utf-8') as f:
+                header = f.readline().strip().split(',')
+                for line in f:
+                    try:
+                        firsts.append(int(line.split(',')[header.index('pc_ns')]))
+                        break
+                    except (ValueError, IndexError):
+                        continue
+        return min(firsts) if firsts else 0
+
+    # --- 行の解析 ---
+    def _serial_parser(self, path):
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            header = f.readline().strip().split(',')
+        t_col, v_col = header.index('pc_ns'), header.index('gsr_value')
+        origin = self.origin_ns
+
+        def parse(raw):
+            fields = raw.split(b',')
+            try:
+                return int(fields[t_col]) - origin, int(fields[v_col])
+            except (ValueError, IndexError):
+                return None
+        return parse
+
+    @staticmethod
+    def _recorder_gsr_parser(path):
+        def parse(raw):
+            fields = raw.split(b',')
+            try:
+                return int(float(fields[1]) * 1e9), int(fields[2])
+            except (ValueError, IndexError):
+                return None
+        return parse
+
+    def _parse_event(self, raw):
+        try:
+            event = json.loads(raw)
+            return int(event['pc_ns']) - self.origin_ns, (event['type'], event.get('data', {}))
+        except (ValueError, KeyError):
+            return None
+
+    @staticmethod
+    def _parse_operation(raw):
+        try:
+            row = next(csv.reader([raw.decode('utf-8')]))
+            t_ns = int(float(row[1]) * 1e9)
+        except (ValueError, IndexError, UnicodeDecodeError, StopIteration):
+            return None
+        op, details = row[2], row[5] if len(row) > 5 else ''
+        if op == 'controller_input':
+            return t_ns, ('av_change', {'arousal': float(row[3]), 'valence': float(row[4])})
+        if op == 'event_marker':
+            return t_ns, ('morph_awareness_marker', {})
+        if op in ('button_press', 'button_release'):
+            return t_ns, ('button', {'button': details.split(' ')[0], 'pressed': op == 'button_press'})
+        return t_ns, (op, {'details': details})
+
+    @staticmethod
+    def _fold_av(state, record):
+        event_type, data = record
+        if event_type == 'av_change':
+            return data['arousal'], data['valence']
+        return state
+
+class ReplayWorker(QThread):
+    """
+    記録済みセッションを PicoWorker / カメラプレビューの代わりに再生するワーカー。
+    同じシグナル名で GSR・A/V・マーカー・ボタンを送るため、GUI側のスロットをそのまま使える。
+    録画トグル・終了信号は送らない（再生中に記録が始まらないようにする）。
+    """
+    new_gsr_data = Signal(int)
+    av_changed = Signal(float, float)
+    morph_marker_received = Signal()
+    button_changed = Signal(str, bool, "qint64", "qint64")
+    # その他のイベント（種類, データ）
+    event_replayed = Signal(str, object)
+    # シーク直後のGSR履歴（値のリスト）
+    gsr_history = Signal(object)
+    # プレビュー用フレーム（QImage, 動画名）
+    frame_ready = Signal(QImage, str)
+    # 再生位置（セッション開始からの ms）, 再生中か
+    position_changed = Signal("qint64", bool)
+    error = Signal(str)
+
+    def __init__(self, session_dir, speed=1.0, preview_width=640):
+        super().__init__()
+        self.session = ReplaySession(session_dir)
+        self.preview_width = preview_width
+        self.speed = max(MIN_SPEED, min(MAX_SPEED, float(speed)))
+        self._commands = queue.Queue()
+        self._is_running = True
+        self._preview_name = self.session.videos[0].name if self.session.videos else None
+
+    @property
+    def start_ms(self):
+        """再生範囲の先頭（プリロールがあれば負）"""
+        return self.session.start_ns // 1_000_000
+
+    @property
+    def duration_ms(self):
+        return self.session.duration_ns // 1_000_000
+
+    @property
+    def video_names(self):
+        return [track.name for track in self.session.videos]
+
+    # --- GUIスレッドから呼ぶ操作 ---
+    def seek(self, position_ms):
+        self._commands.put(('seek', int(position_ms) * 1_000_000))
+
+    def set_speed(self, speed):
+        self._commands.put(('speed', max(MIN_SPEED, min(MAX_SPEED, float(speed)))))
+
+    def set_paused(self, paused):
+        self._commands.put(('pause', paused))
+
+    def set_preview(self, name):
+        self._commands.put(('preview', name))
+
+    # --- 再生ループ ---
+    def run(self):
+        tracks = {track.name: track for track in self.session.videos}
+        position_ns = self.session.start_ns
+        paused = False
+        wall_ns = time.perf_counter_ns()
+        gsr_iter = events_iter = None
+        next_gsr = next_event = None
+        last_position_emit = 0
+
+        def reposition(t_ns):
+            nonlocal gsr_iter, events_iter, next_gsr, next_event
+            # 前の位置から読んでいたファイルを閉じる
+            for records in (gsr_iter, events_iter):
+                if records is not None:
+                    records.close()
+            if self.session.gsr:
+                gsr_iter, _ = self.session.gsr.read_from(t_ns)
+                next_gsr = next(gsr_iter, None)
+                self.gsr_history.emit(self.gsr_before(t_ns))
+            if self.session.events:
+                events_iter, (arousal, valence) = self.session.events.read_from(t_ns)
+                next_event = next(events_iter, None)
+                self.av_changed.emit(arousal, valence)
+            self.show_preview(tracks.get(self._preview_name), t_ns, force=True)
+
+        try:
+            reposition(position_ns)
+            while self._is_running:
+                while not self._commands.empty():
+                    command, value = self._commands.get_nowait()
+                    if command == 'seek':
+                        position_ns = max(self.session.start_ns, min(value, self.session.duration_ns))
+                        wall_ns = time.perf_counter_ns()
+                        reposition(position_ns)
+                    elif command == 'speed':
+                        self.speed = value
+                    elif command == 'pause':
+                        paused = value
+                    elif command == 'preview':
+                        if self._preview_name in tracks:
+                            tracks[self._preview_name].close()
+                        self._preview_name = value
+                        self.show_preview(tracks.get(value), position_ns, force=True)
+
+                now = time.perf_counter_ns()
+                elapsed_ns = now - wall_ns
+                if not paused:
+                    position_ns = min(self.session.duration_ns, position_ns + int(elapsed_ns * self.speed))
+                wall_ns = now
+
+                # GSR（速度 × 記録レートが上限を超える場合は間引く）
+                samples = []
+                while next_gsr is not None and next_gsr[0] <= position_ns:
+                    samples.append(next_gsr[1])
+                    next_gsr = next(gsr_iter, None)
+                if samples:
+                    allowed = max(1.0, MAX_GSR_EMIT_HZ * elapsed_ns / 1e9)
+                    step = max(1, math.ceil(len(samples) / allowed))
+                    for value in samples[step - 1::step]:
+                        self.new_gsr_data.emit(value)
+
+                while next_event is not None and next_event[0] <= position_ns:
+                    self.emit_event(*next_event[1])
+                    next_event = next(events_iter, None)
+
+                self.show_preview(tracks.get(self._preview_name), position_ns)
+
+                if now - last_position_emit > 100_000_000:
+                    self.position_changed.emit(position_ns // 1_000_000, not paused)
+                    last_position_emit = now
+                if position_ns >= self.session.duration_ns:
+                    paused = True
+                self.msleep(5)
+        finally:
+            for records in (gsr_iter, events_iter):
+                if records is not None:
+                    records.close()
+            for track in tracks.values():
+                track.close()
+        print("再生ワーカーを終了しました。")
+
+    def gsr_before(self, t_ns):
+        """t_ns 直前の GSR_HISTORY_SAMPLES 件（必要な分だけ索引のブロックを遡って読む）"""
+        index = self.session.gsr
+        block = bisect.bisect_right(index.times, t_ns) - 1
+        block = max(0, block - GSR_HISTORY_SAMPLES // index.stride - 1)
+        start_ns = index.times[block] if index.times else 0
+        values = []
+        records, _ = index.read_from(start_ns)
+        for record_ns, value in records:
+            if record_ns >= t_ns:
+                break
+            values.append(value)
+        records.close()
+        return values[-GSR_HISTORY_SAMPLES:]
+
+    def emit_event(self, event_type, data):
+        if event_type == 'av_change':
+            self.av_changed.emit(data['arousal'], data['valence'])
+        elif event_type == 'morph_awareness_marker':
+            self.morph_marker_received.emit()
+        elif event_type == 'button':
+            self.button_changed.emit(data['button'], data['pressed'], data.get('pico_ms', 0), 0)
+        else:
+            self.event_replayed.emit(event_type, data)
+
+    def show_preview(self, track, t_ns, force=False):
+        if track is None:
+            return
+        track.open()
+        target = track.frame_at(t_ns)
+        if target < 0 or (target < track.next_frame and not force):
+            return
+        frame = track.read_until(max(target, 0))
+        if frame is None:
+            return
+        height, width = frame.shape[:2]
+        frame = cv2.resize(frame, (self.preview_width, int(height * self.preview_width / width)))
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb.shape
+        self.frame_ready.emit(QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888).copy(), track.name)
+
+    def stop(self):
+        self._is_running = False
+        self.wait()  # スレッドの終了を待機
@@ -0,0 +1,16 @@
+"""
+動画ファイルとフレームタイムスタンプ (sidecar) の対応
+
+録画（camera_worker）・再生（replay_worker）・オフライン解析（analysis/face_features）の共通部分。
+解析スクリプトからも読み込むため、Qt や OpenCV に依存しない。
+"""
+import os
+
+def sidecar_path_for(video_path):
+    """動画ファイルに対応するフレームタイムスタンプ (sidecar) のパスを返す。
+
+    session_NN/video/camera_0.mp4 -> session_NN/sidecar/camera_0_frames.csv
+    """
+    video_dir = os.path.dirname(video_path)
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return os.path.join(os.path.dirname(video_dir), 'sidecar', f"{stem}_frames.csv")
@@ -0,0 +1,151 @@
+import cv2
+import time
+import queue
+from collections import deque
+from PySide6.QtCore import QThread, Signal
+from PySide6.QtGui import QImage
+
+class StimuliPlayer(QThread):
+    """
+    刺激動画を再生するワーカー。
+
+    次のクリップは休憩中に preload() で開き、先頭数秒分をデコードしておく。
+    play() の時点ではデコード済みのフレームを表示時刻に合わせて送り出すだけなので、
+    再生開始の遅延がファイルオープンやデコード時間に左右されない。
+    clip_start の時刻は表示側（StimulusView）が最初のフレームを描画した時刻を使う。
+    """
+    # フレーム（QImage, clip_id, frame_idx）
+    frame_ready = Signal(QImage, str, int)
+    # 先読み完了（clip_id）
+    preloaded = Signal(str)
+    # 最後のフレームを送り出した（clip_id, 送出したフレーム数）
+    clip_finished = Signal(str, int)
+    # エラーメッセージ（str）
+    error = Signal(str)
+
+    def __init__(self, preload_seconds=3.0, display_width=1280):
+        super().__init__()
+        self.preload_seconds = preload_seconds
+        self.display_width = display_width
+        self._commands = queue.Queue()
+        self._is_running = True
+        self._stop_requested = False
+
+        self._cap = None
+        self._clip_id = None
+        self._fps = 30.0
+        self._buffer = deque()
+        self._eof = False
+        self._max_buffer = 1
+        self._ready = False
+
+    # --- GUIスレッドから呼ぶAPI ---
+    def preload(self, clip_id, path):
+        """次のクリップを開いて先頭を先読みする（休憩中に呼ぶ）"""
+        self._commands.put(('preload', clip_id, path))
+
+    def play(self):
+        """先読み済みのクリップを再生する"""
+        self._commands.put(('play',))
+
+    def stop_clip(self):
+        """再生中のクリップを中断する"""
+        self._stop_requested = True
+
+    # --- ワーカー本体 ---
+    def run(self):
+        while self._is_running:
+            try:
+                command = self._commands.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if command[0] == 'preload':
+                self._preload(command[1], command[2])
+            elif command[0] == 'play':
+                if not self._ready:
+                    self.error.emit("先読みされたクリップがありません。")
+                    continue
+                self._play()
+        self._close_clip()
+        print("刺激プレイヤーを終了しました。")
+
+    def _close_clip(self):
+        if self._cap:
+            self._cap.release()
+        self._cap = None
+        self._buffer.clear()
+        self._ready = False
+
+    def _decode_one(self):
+        """1フレームをデコードしてバッファに追加する。終端なら False"""
+        ret, frame = self._cap.read()
+        if not ret:
+            self._eof = True
+            return False
+        height, width = frame.shape[:2]
+        if width > self.display_width:
+            scale = self.display_width / width
+            frame = cv2.resize(frame, (self.display_width, int(height * scale)), interpolation=cv2.INTER_AREA)
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        h, w, ch = rgb.shape
+        # numpy配列を参照しないようコピーしてからスレッド間で渡す
+        self._buffer.append(QImage(rgb.data, w, h, ch * w, QImage.Format_RGB888).copy())
+        return True
+
+    def _preload(self, clip_id, path):
+        self._close_clip()
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            self.error.emit(f"刺激動画を開けませんでした: {path}")
+            return
+        self._cap = cap
+        self._clip_id = clip_id
+        self._fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self._eof = False
+        self._max_buffer = max(1, int(self._fps * self.preload_seconds))
+
+        start = time.perf_counter()
+        while len(self._buffer) < self._max_buffer and self._decode_one():
+            pass
+        self._ready = True
+        print(f"クリップ {clip_id} を先読みしました: {len(self._buffer)} フレーム "
+              f"({time.perf_counter() - start:.2f}s)")
+        self.preloaded.emit(clip_id)
+
+    def _sleep_until(self, deadline):
+        """deadline (perf_counter秒) まで待つ。終盤はスピンして精度を確保する"""
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            if remaining > 0.003:
+                time.sleep(remaining - 0.002)
+
+    def _play(self):
+        clip_id = self._clip_id
+        frame_interval = 1.0 / self._fps
+        frame_idx = 0
+        next_deadline = time.perf_counter()
+        self._stop_requested = False
+
+        # 再生中に届いた先読み要求はクリップ終了後に処理する
+        while self._is_running and not self._stop_requested:
+            if not self._buffer:
+                if self._eof or not self._decode_one():
+                    break
+            self._sleep_until(next_deadline)
+            self.frame_ready.emit(self._buffer.popleft(), clip_id, frame_idx)
+            frame_idx += 1
+            next_deadline += frame_interval
+
+            # 次の表示時刻までの空き時間でデコードを進めておく
+            while (not self._eof and len(self._buffer) < self._max_buffer and
+                   time.perf_counter() < next_deadline - frame_interval / 2):
+                self._decode_one()
+
+        self._close_clip()
+        self.clip_finished.emit(clip_id, frame_idx)
+
+    def stop(self):
+        self._is_running = False
+        self.wait()  # スレッドの終了を待機
@@ -6,17 +6,26 @@ Raspberry Pi Pico W + GSRセンサー + 物理ボタン
 - pin.id 属性エラーの修正
 - より安全なピン初期化
 - エラーハンドリング強化
+
+シリアル入力モード (v3.2):
+- ボタン状態が変化するたびに `BTN:<seq>,<pico_ms>,<mask>` を出力する
+  (mask: bit0=UP, bit1=DOWN, bit2=LEFT, bit3=RIGHT, bit4=B1, bit5=B2。押下中が1)
+- PCから `MODE:SERIAL` を受信するとキーボード(HID)送信を止め、判定はPC側で行う
+- `MODE:HID` 受信、またはシリアル切断でHID送信に戻る（フォールバック）
+- GSRは `GSR:<value>,<seq>,<pico_ms>` 形式で出力する
 """
 
+import sys
 import time
 import board
 import digitalio
 import analogio
 import usb_hid
+import supervisor
 from adafruit_hid.keyboard import Keyboard
 from adafruit_hid.keycode import Keycode
 
-print("=== CircuitPython Controller v3.1 (Fixed) ===")
+print("=== CircuitPython Controller v3.2 (Serial buttons) ===")
 print("Initializing hardware...")
 
 # --- デバイス設定 ---
@@ -71,6 +80,9 @@ for pin_obj, keycode, name, pin_name in PIN_CONFIG:
     except Exception as e:
         print(f"✗ Error initializing {pin_name} ({name}): {e}")
 
+# シリアル報告用のビット位置
+BUTTON_BITS = {"UP": 0, "DOWN": 1, "LEFT": 2, "RIGHT": 3, "B1": 4, "B2": 5}
+
 # 特殊ボタンの参照
 b1_available = 'B1' in pins
 b2_available = 'B2' in pins
@@ -88,10 +100,17 @@ long_press_triggered = False
 
 last_gsr_print_time = 0
 gsr_output_interval = 0.1
+gsr_seq = 0
 
 led_blink_time = 0
 led_state = False
 
+# シリアル入力モード
+serial_mode = False
+button_seq = 0
+last_button_mask = 0
+command_buffer = ""
+
 print("✓ Controller ready for experiment")
 print()
 print("Available controls:")
@@ -103,6 +122,68 @@ if b1_available and b2_available:
     print("  B1+B2 hold 3s: Session end (F15)")
 print()
 
+def read_button_mask():
+    mask = 0
+    for name, pin_data in pins.items():
+        if pin_data['obj'].value is False:  # プルアップなので押下でFalse
+            mask |= 1 << BUTTON_BITS[name]
+    return mask
+
+def release_all_keys():
+    if not kbd:
+        return
+    for pin_data in pins.values():
+        try:
+            kbd.release(pin_data['keycode'])
+        except Exception:
+            pass
+
+def resync_pin_states():
+    """
+    各ピンの state を現在の値に合わせ、長押しの計時をやり直す。
+    シリアル入力モード中は B2・長押しの処理を飛ばすため、HIDに戻った直後に古い状態で
+    押下・解放・長押しを送らないよう、モード切替のたびに呼ぶ
+    """
+    global long_press_start_time, long_press_triggered
+    for name, pin_data in pins.items():
+        try:
+            pin_data['state'] = pin_data['obj'].value
+        except Exception as e:
+            print(f"Error reading {name}: {e}")
+    long_press_start_time = 0
+    long_press_triggered = False
+
+def set_serial_mode(enabled):
+    global serial_mode
+    if enabled == serial_mode:
+        return
+    if enabled:
+        release_all_keys()
+    serial_mode = enabled
+    resync_pin_states()
+
+def poll_pc_commands():
+    """PCからのモード切替コマンドを読む（ブロックしない）"""
+    global command_buffer
+    if not supervisor.runtime.serial_connected:
+        if serial_mode:
+            set_serial_mode(False)
+            print("Serial disconnected: fallback to HID")
+        return
+    n = supervisor.runtime.serial_bytes_available
+    if not n:
+        return
+    command_buffer += sys.stdin.read(n)
+    while "\n" in command_buffer:
+        line, command_buffer = command_buffer.split("\n", 1)
+        line = line.strip()
+        if line == "MODE:SERIAL":
+            set_serial_mode(True)
+            print("MODE:SERIAL OK")
+        elif line == "MODE:HID":
+            set_serial_mode(False)
+            print("MODE:HID OK")
+
 # --- メインループ ---
 print("Starting main loop...")
 try:
@@ -115,7 +196,16 @@ try:
             led.value = led_state
             led_blink_time = current_time
 
-        # 2. 通常キー処理（B2以外）
+        # 2. ボタン状態のシリアル報告（変化時のみ、本体の時刻付き）
+        poll_pc_commands()
+        button_mask = read_button_mask()
+        if button_mask != last_button_mask:
+            button_seq += 1
+            print(f"BTN:{button_seq},{time.monotonic_ns() // 1000000},{button_mask}")
+            last_button_mask = button_mask
+
+        # 3. 通常キー処理（B2以外）
+        # シリアル入力モード中はPC側で判定するためHIDは送らない
         for name, pin_data in pins.items():
             if name == 'B2':  # B2は特別処理
                 continue
@@ -125,7 +215,9 @@ try:
                 last_state = pin_data['state']
 
                 if current_state != last_state:
-                    if current_state is False and kbd:  # ボタン押下
+                    if serial_mode:
+                        pass
+                    elif current_state is False and kbd:  # ボタン押下
                         kbd.press(pin_data['keycode'])
                         print(f"[{current_time:.2f}] {name} PRESSED -> {pin_data['keycode']}")
                     elif current_state is True and kbd:  # ボタン離し
@@ -136,8 +228,8 @@ try:
             except Exception as e:
                 print(f"Error processing {name}: {e}")
 
-        # 3. B2ボタン処理（デバウンス付き）
-        if b2_available and kbd:
+        # 4. B2ボタン処理（デバウンス付き）
+        if b2_available and kbd and not serial_mode:
             try:
                 b2_state = pins['B2']['obj'].value
                 if (b2_state is False and 
@@ -153,8 +245,8 @@ try:
             except Exception as e:
                 print(f"Error processing B2: {e}")
 
-        # 4. B1+B2長押し処理
-        if b1_available and b2_available and kbd:
+        # 5. B1+B2長押し処理
+        if b1_available and b2_available and kbd and not serial_mode:
             try:
                 b1_state = pins['B1']['obj'].value
                 b2_state = pins['B2']['obj'].value
@@ -179,16 +271,19 @@ try:
             except Exception as e:
                 print(f"Error processing long press: {e}")
 
-        # 5. GSRセンサー出力
+        # 6. GSRセンサー出力
         if gsr and (current_time - last_gsr_print_time) >= gsr_output_interval:
             try:
                 gsr_value = gsr.value
-                print(f"GSR:{gsr_value}")
+                # 値, 連番, Pico時刻(ms)。連番はPC側で欠落検出に使う
+                gsr_seq += 1
+                print(f"GSR:{gsr_value},{gsr_seq},{time.monotonic_ns() // 1000000}")
                 last_gsr_print_time = current_time
             except Exception as e:
                 print(f"Error reading GSR: {e}")
 
-        time.sleep(0.01)
+        # ボタンのエッジ検出遅延を抑えるため短い周期で回す
+        time.sleep(0.002)
 
 except KeyboardInterrupt:
     print("\n=== Controller stopped by user ===")
@@ -21,6 +21,8 @@ import numpy as np
 
 # --- ワーカーのインポート ---
 from pc_app.workers.pico_worker import PicoWorker
+from pc_app.workers.preflight_worker import check_free_space
+from pc_app.analysis.catalog import index_session_in_background
 
 class ExperimentRecorder(QMainWindow):
     def __init__(self):
@@ -195,9 +197,11 @@ class ExperimentRecorder(QMainWindow):
         self.pico_worker.av_changed.connect(self.handle_av_change)
         self.pico_worker.record_toggled.connect(self.toggle_recording)
         self.pico_worker.morph_marker_received.connect(self.handle_marker)
+        self.pico_worker.button_changed.connect(self.handle_button_change)
         self.pico_worker.session_ended.connect(self.end_experiment)
         self.pico_worker.error.connect(self.show_error)
-        self.pico_worker.start()
+        # ワーカー（シリアル接続・キーボードフック）はウィンドウを表示してから起動する
+        QTimer.singleShot(0, self.pico_worker.start)
         
     def on_id_changed(self):
         text = self.id_input.text().strip()
@@ -233,6 +237,12 @@ class ExperimentRecorder(QMainWindow):
         if not self.session_dir:
             self.show_error("先に実験セットアップを行ってください")
             return
+
+        # 空き容量が閾値を下回る場合は記録を開始しない
+        message = check_free_space(self.session_dir)
+        if message:
+            self.show_error(message)
+            return
             
         try:
             # セッション番号を管理（複数回の録画に対応）
@@ -299,6 +309,10 @@ class ExperimentRecorder(QMainWindow):
             if self.operations_file:
                 self.operations_file.close()
                 self.operations_file = None
+
+            # セッションカタログに登録
+            index_session_in_background(
+                os.path.join(self.session_dir, f"session_{self.current_session_count:02d}"))
             
             self.is_recording = False
             
@@ -362,6 +376,10 @@ class ExperimentRecorder(QMainWindow):
         self.log_message("イベントマーカー記録")
         self.log_operation("event_marker", "Pキー押下")
     
+    def handle_button_change(self, name, pressed, pico_ms, pc_ns):
+        operation = "button_press" if pressed else "button_release"
+        self.log_operation(operation, f"{name} pico_ms={pico_ms} pc_ns={pc_ns}")
+
     def log_operation(self, operation_type, details):
         if not self.is_recording or not self.operations_file:
             return
@@ -0,0 +1,13 @@
+"""
+テスト共通の設定
+
+解析スクリプトと同じく pc_app.analysis.X / pc_app.workers.X としてインポートできるよう、
+リポジトリのルートを import パスの末尾に追加する（ルートの code.py が標準ライブラリの code を隠さないよう、
+先頭には入れない）。リポジトリのルートで pytest を実行する。
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
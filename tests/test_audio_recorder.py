@@ -0,0 +1,120 @@
+"""workers/audio_recorder.py のリングバッファと逐次WAV書き出し（録音デバイスは使わない）"""
+import os
+import time
+import wave
+
+import numpy as np
+
+from pc_app.workers.audio_recorder import AudioRingBuffer, StreamingWavWriter, AudioRecorder
+from pc_app.analysis.verify_manifest import verify_file
+
+
+def ramp(start, n, channels=1):
+    """start から始まる連番のフレーム（(n, channels) の int16）"""
+    values = np.arange(start, start + n, dtype=np.int16)
+    return np.repeat(values[:, None], channels, axis=1)
+
+
+def test_ring_wraps_around():
+    ring = AudioRingBuffer(10, 2)
+    out = np.zeros((10, 2), dtype=np.int16)
+    ring.write(ramp(0, 7, 2))
+    assert ring.read_into(out[:5]) == 5
+    assert out[:5, 0].tolist() == [0, 1, 2, 3, 4]
+    # 書き込み位置が末尾を越えて先頭に戻る
+    ring.write(ramp(7, 6, 2))
+    assert ring.available == 8
+    assert ring.read_into(out) == 8
+    assert out[:8, 0].tolist() == list(range(5, 13))
+    assert (out[:8, 0] == out[:8, 1]).all()
+    assert ring.available == 0 and ring.overruns == 0
+
+
+def test_ring_overflow_drops_newest_frames():
+    ring = AudioRingBuffer(8, 1)
+    ring.write(ramp(0, 5))
+    ring.write(ramp(5, 6))        # 空きは3フレーム
+    assert ring.overruns == 3
+    assert ring.available == 8
+    out = np.zeros((20, 1), dtype=np.int16)
+    assert ring.read_into(out) == 8
+    assert out[:8, 0].tolist() == list(range(8))
+    assert ring.read_into(out) == 0
+
+
+def test_ring_many_blocks_keep_order():
+    ring = AudioRingBuffer(97, 1)
+    out = np.zeros((41, 1), dtype=np.int16)
+    written = read = 0
+    received = []
+    while read < 5000:
+        if ring.available < 60:
+            ring.write(ramp(written, 37))
+            written += 37
+        n = ring.read_into(out)
+        received.extend(out[:n, 0].tolist())
+        read += n
+    assert received == list(range(read))
+    assert ring.overruns == 0
+
+
+def read_wav(path):
+    with wave.open(path, 'rb') as wav:
+        return wav.getframerate(), wav.getnchannels(), np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+
+
+def test_wav_header_sizes_after_close(tmp_path):
+    path = str(tmp_path / 'rta.wav')
+    writer = StreamingWavWriter(path, 48000, 2, fixup_interval=3600)
+    blocks = [ramp(i * 480, 480, 2) for i in range(10)]
+    for block in blocks:
+        writer.write(block)
+    writer.close()
+    writer.close()  # 2回目は何もしない
+    assert os.path.getsize(path) == StreamingWavWriter.HEADER_SIZE + 10 * 480 * 2 * 2
+    rate, channels, samples = read_wav(path)
+    assert (rate, channels) == (48000, 2)
+    assert np.array_equal(samples.reshape(-1, 2), np.concatenate(blocks))
+    entry = writer.entry()
+    assert entry['frames'] == 4800 and entry['bytes'] == os.path.getsize(path)
+    # ヘッダを除いた sha256 がマニフェストの照合と一致する
+    assert verify_file(str(tmp_path), dict(entry, path='rta.wav')) is None
+
+
+def test_wav_header_is_updated_while_recording(tmp_path):
+    path = str(tmp_path / 'rta.wav')
+    writer = StreamingWavWriter(path, 16000, 1, fixup_interval=0)
+    writer.write(ramp(0, 160))
+    # 閉じる前（プロセスが落ちた場合）でも、書いた分まで読めるヘッダになっている
+    _, _, samples = read_wav(path)
+    assert samples.tolist() == list(range(160))
+    writer.close()
+
+
+class BlockSource:
+    """決まったブロックを録音開始時にまとめて渡す入力"""
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.stopped = False
+
+    def start(self, sample_rate, channels, block_frames, callback):
+        for block in self.blocks:
+            callback(block)
+
+    def stop(self):
+        self.stopped = True
+
+
+def test_recorder_writes_all_buffered_frames(tmp_path):
+    path = str(tmp_path / 'audio' / 'rta.wav')
+    blocks = [ramp(i * 160, 160) for i in range(50)]
+    source = BlockSource(blocks)
+    recorder = AudioRecorder(path, source=source, sample_rate=16000, buffer_seconds=1.0)
+    recorder.start()
+    time.sleep(0.2)
+    recorder.stop()
+    assert source.stopped
+    _, _, samples = read_wav(path)
+    assert np.array_equal(samples, np.concatenate(blocks)[:, 0])
+    assert recorder.manifest_entry['frames'] == 8000
+    assert recorder.ring.overruns == 0
@@ -0,0 +1,100 @@
+"""analysis/event_index.py の区間の組み立てと検索"""
+import json
+
+import numpy as np
+
+from pc_app.analysis.event_index import EventIndex, IntervalIndex
+
+
+def build(events):
+    """[(時刻, 種類, データ)] から EventIndex を作る"""
+    return EventIndex([e[0] for e in events], [e[1] for e in events], [e[2] if len(e) > 2 else {} for e in events])
+
+
+def spans(index, kind):
+    span = index.spans[kind]
+    return list(zip(span.starts.tolist(), span.ends.tolist(), list(span.labels)))
+
+
+def test_interval_boundaries_are_half_open():
+    index = IntervalIndex([10, 30], [20, 40], ['a', 'b'])
+    t = [9, 10, 19, 20, 29, 30, 39, 40]
+    assert index.lookup(t).tolist() == [-1, 0, 0, -1, -1, 1, 1, -1]
+    assert list(index.labels_at(t, fill='-')) == ['-', 'a', 'a', '-', '-', 'b', 'b', '-']
+    assert list(index.overlapping(15, 35)) == [0, 1]
+    assert list(index.overlapping(20, 30)) == []
+    assert index.durations_s().tolist() == [1e-8, 1e-8]
+
+
+def test_empty_interval_index():
+    index = IntervalIndex([], [], [])
+    assert index.lookup([0, 1]).tolist() == [-1, -1]
+    assert list(index.overlapping(0, 10)) == []
+
+
+def test_rests_between_clips():
+    index = build([(0, 'record_start'), (10, 'clip_start', {'clip_id': 'A'}), (20, 'clip_end'),
+                   (30, 'clip_start', {'clip_id': 'B'}), (40, 'clip_end'), (100, 'record_stop')])
+    assert spans(index, 'record') == [(0, 100, 0)]
+    assert spans(index, 'clip') == [(10, 20, 'A'), (30, 40, 'B')]
+    assert spans(index, 'rest') == [(0, 10, 0), (20, 30, 1), (40, 100, 2)]
+    labels = index.label([5, 10, 25, 40, 99, 100])
+    assert labels['clip'].tolist() == [-1, 0, -1, -1, -1, -1]
+    assert labels['rest'].tolist() == [0, -1, 1, 2, 2, -1]
+    assert labels['record'].tolist() == [0, 0, 0, 0, 0, -1]
+
+
+def test_missing_record_stop_extends_to_last_event():
+    index = build([(0, 'record_start'), (10, 'clip_start', {'clip_id': 'A'}), (20, 'clip_end'), (50, 'av_change')])
+    assert spans(index, 'record') == [(0, 50, 0)]
+    assert spans(index, 'rest') == [(0, 10, 0), (20, 50, 1)]
+
+
+def test_unclosed_clip_is_not_a_span():
+    index = build([(0, 'record_start'), (10, 'clip_start', {'clip_id': 'A'}), (15, 'morph_awareness_marker'),
+                   (30, 'clip_start', {'clip_id': 'B'}), (40, 'clip_end'), (50, 'record_stop')])
+    # A は clip_end の前に次のクリップが始まった。B の区間だけを作り、A のモーフ気付きは捨てる
+    assert spans(index, 'clip') == [(30, 40, 'B')]
+    assert spans(index, 'morph') == []
+    assert spans(index, 'rest') == [(0, 30, 0), (40, 50, 1)]
+
+
+def test_morph_marker_outside_clip_is_ignored():
+    index = build([(0, 'record_start'), (5, 'morph_awareness_marker'), (10, 'clip_start', {'clip_id': 'A'}),
+                   (12, 'morph_awareness_marker'), (14, 'morph_awareness_marker'), (20, 'clip_end'),
+                   (25, 'morph_awareness_marker'), (30, 'record_stop')])
+    # クリップ内の最初のマーカーからクリップの終わりまで
+    assert spans(index, 'morph') == [(12, 20, 'A')]
+    assert index.count_between('morph_awareness_marker', 0, 30) == 4
+    assert [e[0] for e in index.events_between(10, 20, types=['morph_awareness_marker'])] == [12, 14]
+
+
+def test_gui_events_jsonl(tmp_path):
+    """main.py が書く形の events.jsonl（プリロールのイベントが record_start より前にある）"""
+    lines = [
+        {'pc_ns': 1000, 'type': 'av_change', 'data': {'arousal': 0.1, 'valence': 0.0}},   # プリロール
+        {'pc_ns': 2000, 'type': 'record_start', 'data': {'session_number': 1, 'preroll_seconds': 5}},
+        {'pc_ns': 2100, 'type': 'camera_record_start', 'data': {'camera': 0, 'preroll_start_ns': 900}},
+        {'pc_ns': 3000, 'type': 'clip_start', 'data': {'clip_id': 'c1'}},
+        {'pc_ns': 3500, 'type': 'morph_awareness_marker', 'data': {}},
+        {'pc_ns': 4000, 'type': 'clip_end', 'data': {'clip_id': 'c1'}},
+        {'pc_ns': 4900, 'type': 'rta_audio_stop', 'data': {'file': 'audio/rta.wav'}},
+        {'pc_ns': 5000, 'type': 'record_stop', 'data': {'session_number': 1}},
+    ]
+    path = tmp_path / 'events.jsonl'
+    path.write_text("".join(json.dumps(line) + "\n" for line in lines) + '{"pc_ns": 60', encoding='utf-8')
+    index = EventIndex.load(str(tmp_path))
+    assert len(index) == len(lines)  # 書き込み途中の最終行は読み飛ばす
+    assert spans(index, 'record') == [(2000, 5000, 0)]
+    assert spans(index, 'clip') == [(3000, 4000, 'c1')]
+    assert spans(index, 'morph') == [(3500, 4000, 'c1')]
+    assert spans(index, 'rest') == [(2000, 3000, 0), (4000, 5000, 1)]
+    labels = index.label(np.array([1000, 2000, 4999, 5000]))
+    assert labels['record'].tolist() == [-1, 0, 0, -1]
+
+
+def test_events_are_sorted_by_time():
+    index = build([(30, 'b'), (10, 'a'), (20, 'c')])
+    assert index.times.tolist() == [10, 20, 30]
+    assert [e[1] for e in index.events_between(0, 100)] == ['a', 'c', 'b']
+    assert index.times_of('missing').tolist() == []
@@ -0,0 +1,78 @@
+"""workers/frame_pool.py のスロットの参照カウントと再利用"""
+import numpy as np
+import pytest
+
+from pc_app.workers.frame_pool import FramePool
+
+
+@pytest.fixture
+def pool():
+    pool = FramePool(slots=3, shape=(4, 6, 3))
+    yield pool
+    pool.close()
+    pool.unlink()
+
+
+def test_exhausted_pool_returns_none(pool):
+    slots = [pool.acquire() for _ in range(3)]
+    assert sorted(slots) == [0, 1, 2]
+    assert pool.in_use() == 3
+    assert pool.acquire() is None
+    pool.release(slots[1])
+    assert pool.acquire() == slots[1]
+
+
+def test_slots_are_handed_out_in_rotation(pool):
+    # 空きスロットは前回確保したスロットの次から探す
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    assert second == (first + 1) % pool.slots
+    pool.release(second)
+    assert pool.acquire() == (second + 1) % pool.slots
+
+
+def test_double_release_raises(pool):
+    slot = pool.acquire()
+    pool.release(slot)
+    with pytest.raises(ValueError):
+        pool.release(slot)
+    assert pool.in_use() == 0
+
+
+def test_retain_requires_acquired_slot(pool):
+    with pytest.raises(ValueError):
+        pool.retain(0)
+
+
+def test_slot_held_by_reader_is_not_reused(pool):
+    slot = pool.acquire()
+    pool.view(slot)[:] = 7
+    pool.set_meta(slot, 42, 123456789)
+    pool.retain(slot)           # プレビューに渡す
+    pool.release(slot)          # 取得側は使い終わった
+    assert pool.in_use() == 1
+    # 残りのスロットを全て使っても、読み手が持っているスロットは渡されない
+    others = [pool.acquire(), pool.acquire()]
+    assert slot not in others
+    assert pool.acquire() is None
+    assert (pool.view(slot) == 7).all()
+    assert pool.meta(slot) == (42, 123456789)
+    pool.release(slot)          # 読み手も使い終わった
+    assert pool.acquire() == slot
+
+
+def test_views_share_memory_without_copy(pool):
+    slot = pool.acquire()
+    view = pool.view(slot)
+    assert view.shape == (4, 6, 3) and view.dtype == np.uint8
+    assert pool.view(slot) is view
+    view[0, 0] = (1, 2, 3)
+    other = FramePool.attach(pool.spec())
+    try:
+        assert tuple(other.view(slot)[0, 0]) == (1, 2, 3)
+        assert other.in_use() == 1
+        other.release(slot)      # 別の利用者からの解放も同じ参照カウントに反映される
+        assert pool.in_use() == 0
+    finally:
+        other.close()
@@ -0,0 +1,94 @@
+"""workers/integrity.py のハッシュ計算・マニフェストと analysis/verify_manifest.py の照合"""
+import os
+import json
+import hashlib
+
+import pytest
+
+from pc_app.workers.integrity import HashingFile, SessionManifest, MANIFEST_PATH, hash_file
+from pc_app.analysis.verify_manifest import verify_session, main
+
+
+def write_rows(path, rows, mode='ab'):
+    f = HashingFile(path, mode)
+    for row in rows:
+        f.write(row)
+    f.close()
+    return f
+
+
+def test_hashing_file_matches_written_bytes(tmp_path):
+    path = str(tmp_path / 'serial.csv')
+    rows = ["pc_ns,gsr_value\n", "1,100\n", "2,101\n", b"3,102\n", "4,é\n"]
+    f = write_rows(path, rows)
+    with open(path, 'rb') as written:
+        data = written.read()
+    assert f.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert f.bytes == len(data)
+    assert f.lines == 5
+    assert f.entry(rows=f.lines - 1) == {'path': path, 'bytes': len(data), 'sha256': f.hexdigest(), 'rows': 4}
+    assert hash_file(path) == (f.hexdigest(), len(data))
+
+
+def test_hashing_file_append_includes_existing_part(tmp_path):
+    path = str(tmp_path / 'events.jsonl')
+    write_rows(path, ['{"a": 1}\n'])
+    f = write_rows(path, ['{"b": 2}\n', '{"c": 3}\n'])
+    with open(path, 'rb') as written:
+        data = written.read()
+    assert f.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert (f.bytes, f.lines) == (len(data), 3)
+
+
+def make_session(tmp_path):
+    session_dir = str(tmp_path / 'session_01')
+    os.makedirs(os.path.join(session_dir, 'sidecar'))
+    manifest = SessionManifest(session_dir)
+    serial = write_rows(os.path.join(session_dir, 'serial.csv'), ["pc_ns,gsr_value\n"] + [f"{i},{i % 7}\n" for i in range(1000)])
+    sidecar = write_rows(os.path.join(session_dir, 'sidecar', 'camera_0_frames.csv'), ["frame_idx,pc_ns\n", "0,5\n"], 'wb')
+    manifest.add(serial.entry(rows=serial.lines - 1))
+    manifest.add(sidecar.entry(frames=1))
+    manifest.write()
+    return session_dir
+
+
+def test_manifest_round_trip(tmp_path):
+    session_dir = make_session(tmp_path)
+    with open(os.path.join(session_dir, MANIFEST_PATH), encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['algorithm'] == 'sha256'
+    # パスはセッションからの相対パス（/ 区切り）で、名前順に並ぶ
+    assert [e['path'] for e in manifest['files']] == ['serial.csv', 'sidecar/camera_0_frames.csv']
+    assert manifest['files'][0]['rows'] == 1000
+    assert manifest['files'][1]['frames'] == 1
+    assert verify_session(session_dir) == (2, [])
+    assert main([str(tmp_path)]) == 0
+
+
+def test_verify_detects_modified_file(tmp_path):
+    session_dir = make_session(tmp_path)
+    path = os.path.join(session_dir, 'serial.csv')
+    with open(path, 'r+b') as f:
+        f.seek(-3, os.SEEK_END)
+        f.write(b'9')  # サイズは同じで中身だけ変える
+    count, problems = verify_session(session_dir)
+    assert count == 2
+    assert problems == [('serial.csv', "sha256 が異なります")]
+    assert main([str(tmp_path)]) == 1
+
+
+def test_verify_detects_truncated_and_missing_files(tmp_path):
+    session_dir = make_session(tmp_path)
+    path = os.path.join(session_dir, 'serial.csv')
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - 10)
+    os.remove(os.path.join(session_dir, 'sidecar', 'camera_0_frames.csv'))
+    _, problems = verify_session(session_dir)
+    assert problems[0][0] == 'serial.csv' and problems[0][1].startswith("サイズが異なります")
+    assert problems[1] == ('sidecar/camera_0_frames.csv', "ファイルがありません")
+
+
+def test_verify_without_manifest(tmp_path):
+    os.makedirs(tmp_path / 'session_01')
+    assert verify_session(str(tmp_path / 'session_01')) is None
@@ -0,0 +1,33 @@
+"""workers/monitor_server.py の停止処理"""
+import time
+import socket
+
+from pc_app.workers.monitor_server import MonitorServer
+
+
+def test_stop_before_loop_is_created(monkeypatch):
+    """serve() がイベントループを作る前に stop() が呼ばれても止まる"""
+    serve = MonitorServer.serve
+
+    async def delayed_serve(self):
+        time.sleep(0.2)
+        await serve(self)
+    monkeypatch.setattr(MonitorServer, 'serve', delayed_serve)
+    server = MonitorServer(port=0)
+    server.start()
+    started = time.monotonic()
+    server.stop()
+    assert server.isFinished()
+    assert time.monotonic() - started < 5
+
+
+def test_stop_after_failed_start():
+    """ポートが使用中で開始できなかった後の stop()"""
+    with socket.socket() as busy:
+        busy.bind(('127.0.0.1', 0))
+        busy.listen()
+        server = MonitorServer(host='127.0.0.1', port=busy.getsockname()[1])
+        server.start()
+        server.wait(5000)
+        server.stop()
+    assert server.isFinished()
@@ -0,0 +1,50 @@
+"""tools/pico_emulator.py の出力（擬似端末の代わりに行を記録する接続を使う）"""
+from pc_app.tools.pico_emulator import VirtualPico, BANNER
+
+
+class RecordingTransport:
+    """書き込まれた行を接続の区切りごとに記録する"""
+    def __init__(self):
+        self.connections = []
+        self.is_open = False
+
+    def open(self):
+        self.is_open = True
+        self.connections.append([])
+        return 'fake'
+
+    def write(self, data):
+        assert self.is_open, "切断中に書き込んだ"
+        self.connections[-1].extend(data.decode('utf-8').split("\r\n")[:-1])
+
+    def read(self):
+        assert self.is_open, "切断中に読み込んだ"
+        return b''
+
+    def close(self):
+        self.is_open = False
+
+
+def gsr_rows(lines):
+    rows = []
+    for line in lines:
+        if line.startswith("GSR:"):
+            value, seq, pico_ms = line[4:].split(',')
+            rows.append((int(seq), int(pico_ms)))
+    return rows
+
+
+def test_disconnect_drops_samples_instead_of_replaying_them():
+    transport = RecordingTransport()
+    pico = VirtualPico(transport, rate_hz=200, script=[(0.3, 'disconnect', ['0.4'])], debug_lines=False)
+    pico.run(duration=1.0)
+    assert len(transport.connections) == 2
+    before, after = (gsr_rows(lines) for lines in transport.connections)
+    assert transport.connections[1][:len(BANNER)] == BANNER
+    # 切断中の約0.4秒分（約80サンプル）の連番が飛ぶ
+    gap = after[0][0] - before[-1][0]
+    assert 60 <= gap <= 100
+    # 再接続直後に溜まったサンプルをまとめて送らない（Pico 時刻は再接続の時刻から続く）
+    assert after[0][1] - before[-1][1] >= 350
+    assert all(b[0] == a[0] + 1 for a, b in zip(after, after[1:]))
+    assert len(after) <= 0.3 * 200 + 20
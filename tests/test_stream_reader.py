@@ -0,0 +1,77 @@
+"""analysis/stream_reader.py のチャンク分割（重なり行の扱い）と旧形式の行の読み込み"""
+import json
+
+import numpy as np
+import pytest
+
+from pc_app.analysis.stream_reader import iter_chunks, iter_session_chunks
+
+SERIAL_HEADER = "pc_ns,pico_ts_ms,idx,gsr_value,arousal,valence,online5\n"
+ROWS = 1000
+
+
+@pytest.fixture
+def serial_path(tmp_path):
+    path = tmp_path / 'serial.csv'
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(SERIAL_HEADER)
+        for i in range(ROWS):
+            # pc_ns は float64 では丸まる大きさにする
+            f.write(f"{10**18 + i},{i * 5},{i},{30000 + i},{i / ROWS:.3f},0.0,{i % 6}\n")
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_rows, overlap', [
+    (100, 0), (100, 10), (333, 0), (333, 32), (1000, 0), (1000, 999), (7, 0), (7, 3), (7, 6),
+])
+def test_chunks_reproduce_all_rows(serial_path, chunk_rows, overlap):
+    chunks = list(iter_chunks(serial_path, chunk_rows=chunk_rows, overlap=overlap))
+    t_ns = np.concatenate([chunk.t_ns[chunk.new_rows] for chunk in chunks])
+    assert t_ns.dtype == np.int64
+    assert t_ns.tolist() == [10**18 + i for i in range(ROWS)]
+    gsr = np.concatenate([chunk['gsr_value'][chunk.new_rows] for chunk in chunks])
+    assert gsr.tolist() == [30000 + i for i in range(ROWS)]
+    for i, chunk in enumerate(chunks):
+        assert len(chunk) <= chunk_rows
+        assert chunk.overlap == (0 if i == 0 else overlap)
+        assert chunk.start == i * (chunk_rows - overlap)
+        if i:
+            # 先頭の overlap 行は前のチャンクの末尾と同じ行
+            assert chunk.t_ns[:overlap].tolist() == chunks[i - 1].t_ns[len(chunks[i - 1]) - overlap:].tolist()
+    # 最後のチャンクは前のチャンクと重ならない行を必ず含む（重なり行だけのチャンクは返さない）
+    assert len(chunks[-1]) > chunks[-1].overlap
+
+
+def test_overlap_must_be_smaller_than_chunk(serial_path):
+    with pytest.raises(ValueError):
+        iter_chunks(serial_path, chunk_rows=10, overlap=10)
+
+
+def test_blank_legacy_columns_fall_back_to_nan(tmp_path):
+    """旧形式の GSR 行（Pico時刻・連番が空欄）と書き込み途中の最終行"""
+    path = tmp_path / 'serial.csv'
+    path.write_text(SERIAL_HEADER
+                    + "100,5,0,30000,0.1,0.2,0\n"
+                    + "200,,,30001,,,\n"
+                    + "300,15,2,30002,0.3,0.4,1\n"
+                    + "4", encoding='utf-8')
+    chunks = list(iter_chunks(str(path), chunk_rows=2, overlap=1))
+    rows = {name: np.concatenate([c[name][c.new_rows] for c in chunks]) for name in ('pc_ns', 'idx', 'gsr_value')}
+    assert rows['pc_ns'].tolist() == [100, 200, 300]  # 列の足りない最終行は読み飛ばす
+    assert rows['pc_ns'].dtype == np.int64
+    assert rows['gsr_value'].tolist() == [30000, 30001, 30002]
+    assert rows['idx'][0] == 0 and np.isnan(rows['idx'][1]) and rows['idx'][2] == 2
+
+
+def test_events_and_sessions(tmp_path):
+    for n, session in enumerate(('session_01', 'session_02', 'session_03')):
+        (tmp_path / session).mkdir()
+        if n == 1:
+            continue  # events.jsonl の無いセッションは飛ばす
+        lines = [json.dumps({'pc_ns': n * 100 + i, 'type': 'av_change', 'data': {'arousal': i}}) for i in range(5)]
+        (tmp_path / session / 'events.jsonl').write_text("\n".join(lines) + "\nnot json\n", encoding='utf-8')
+    dirs = [str(tmp_path / s) for s in ('session_01', 'session_02', 'session_03')]
+    chunks = list(iter_session_chunks(dirs, 'events.jsonl', chunk_rows=3))
+    assert [c.t_ns.tolist() for c in chunks] == [[0, 1, 2], [3, 4], [200, 201, 202], [203, 204]]
+    assert chunks[0]['type'].tolist() == ['av_change'] * 3
+    assert chunks[0]['data'][2] == {'arousal': 2}